@@ -1,45 +1,143 @@
+import contextvars
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
 from collections import Counter
+from functools import wraps
+
+import metricas
+from cache import CacheDeResultados
+from consultas_lentas import RegistroDeConsultasLentas
+from db import PoolDeConexoes, PoolEsgotadoError, dimensionar_por_worker
 
 app = Flask(__name__)
 CORS(app) 
+metricas.instrumentar(app)
 
 # CONFIGURAÇÃO DO BANCO
+# As variáveis DB_NAME, DB_USER, DB_PASSWORD, DB_HOST e DB_PORT sobrescrevem
+# os valores abaixo (o benchmark.py usa isso para apontar para outro banco).
 DB_CONFIG = {
-    'dbname': 'loja_vendas',
-    'user': 'postgres',
-    'password': 'abc123',  # <--- COLOQUE SUA SENHA AQUI
-    'host': 'localhost',
-    'port': '5432'
+    'dbname': os.environ.get('DB_NAME', 'loja_vendas'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', 'abc123'),  # <--- COLOQUE SUA SENHA AQUI
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': os.environ.get('DB_PORT', '5432')
 }
 
 
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        print(f"Erro de conexão com o Banco: {e}")
-        return None
+# CONFIGURAÇÃO DO POOL DE CONEXÕES
+# DB_POOL_MAX é o total de conexões do servidor inteiro; ele é dividido entre
+# os processos (WEB_CONCURRENCY, mesma variável usada pelo gunicorn).
+_pool_maximo = dimensionar_por_worker(os.environ.get('DB_POOL_MAX', 20), os.environ.get('WEB_CONCURRENCY', 1))
+POOL_CONFIG = {
+    'minimo': min(int(os.environ.get('DB_POOL_MIN', 1)), _pool_maximo),
+    'maximo': _pool_maximo,
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),               # segundos esperando conexão livre
+    'intervalo_verificacao': float(os.environ.get('DB_POOL_VERIFICACAO', 30)),  # SELECT 1 se ociosa há mais que isso
+}
+
+# ConexaoMedida: todo cursor das rotas alimenta as métricas de /api/_metrics
+pool = PoolDeConexoes(dict(DB_CONFIG, connection_factory=metricas.ConexaoMedida), **POOL_CONFIG)
+
+
+# LOG DE CONSULTAS LENTAS
+# Consultas acima de CONSULTA_LENTA_MS vão para backend/consultas_lentas/consultas.jsonl
+# (SQL, parâmetros, duração, rota); uma fração CONSULTA_LENTA_AMOSTRA delas tem o
+# plano (EXPLAIN ANALYZE, BUFFERS) gravado em planos.txt. CONSULTA_LENTA_MS < 0 desliga.
+_consulta_lenta_ms = float(os.environ.get('CONSULTA_LENTA_MS', 500))
+if _consulta_lenta_ms >= 0:
+    metricas.coletor.consultas_lentas = RegistroDeConsultasLentas(
+        DB_CONFIG,
+        diretorio=os.environ.get('CONSULTA_LENTA_DIR',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'consultas_lentas')),
+        limite_ms=_consulta_lenta_ms,
+        amostra=float(os.environ.get('CONSULTA_LENTA_AMOSTRA', 0.2)),
+        intervalo_explain=float(os.environ.get('CONSULTA_LENTA_INTERVALO_EXPLAIN', 300)),  # por SQL
+    )
+
+
+def buscar_todos(query, params=None):
+    """Executa uma consulta de leitura usando uma conexão do pool e retorna as linhas como dicts."""
+    with pool.conexao() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+# Qualquer rota que não conseguir conexão (banco fora do ar ou pool esgotado) cai aqui
+@app.errorhandler(PoolEsgotadoError)
+@app.errorhandler(psycopg2.OperationalError)
+def erro_conexao_banco(e):
+    print(f"Erro de conexão com o Banco: {e}")
+    return jsonify({"error": "Erro ao conectar no banco"}), 500
 
 # =================================================================
 # ROTA 1: Listar Produtos
 # =================================================================
-@app.route('/api/produtos', methods=['GET'])
-def get_produtos():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Erro ao conectar no banco"}), 500
-    
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+# Parâmetros opcionais (query string):
+#   categoria, tipo_produto, preco_min, preco_max, em_estoque=1  -> filtros
+#   limite=N&apos=<id>   -> paginação por cursor (keyset em id_produto)
+#   formato=ndjson       -> um produto por linha, lido de um cursor no servidor
+# Sem "limite" a resposta continua sendo a lista completa (formato antigo),
+# mas enviada aos poucos, então a memória não cresce com o catálogo.
+LIMITE_MAXIMO_PRODUTOS = 1000
+LOTE_CURSOR_PRODUTOS = 2000
+
+# Mesma precedência do CASE que define tipo_produto
+FILTROS_TIPO_PRODUTO = {
+    'Dispositivo': "d.id_produto IS NOT NULL",
+    'Hardware':    "d.id_produto IS NULL AND h.id_produto IS NOT NULL",
+    'Periférico':  "d.id_produto IS NULL AND h.id_produto IS NULL AND per.id_produto IS NOT NULL",
+    'Outro':       "d.id_produto IS NULL AND h.id_produto IS NULL AND per.id_produto IS NULL",
+}
+
+
+def montar_consulta_produtos(args, apos=None, limite=None):
+    """Monta o SELECT do catálogo (pai + filhas) com os filtros recebidos na URL."""
+    condicoes = []
+    params = []
+
+    if args.get('categoria'):
+        condicoes.append("p.categoria = %s")
+        params.append(args.get('categoria'))
+
+    tipo = args.get('tipo_produto')
+    if tipo:
+        if tipo == 'Periferico':
+            tipo = 'Periférico'
+        if tipo not in FILTROS_TIPO_PRODUTO:
+            raise ValueError(f"tipo_produto inválido: {tipo}")
+        condicoes.append(FILTROS_TIPO_PRODUTO[tipo])
+
+    preco_min = args.get('preco_min', type=float)
+    if preco_min is not None:
+        condicoes.append("p.preco_unitario >= %s")
+        params.append(preco_min)
+
+    preco_max = args.get('preco_max', type=float)
+    if preco_max is not None:
+        condicoes.append("p.preco_unitario <= %s")
+        params.append(preco_max)
+
+    if args.get('em_estoque') in ('1', 'true', 'sim'):
+        condicoes.append("p.estoque_atual > 0")
+
+    # Keyset: continua a partir do último id entregue (usa o índice da PK)
+    if apos is not None:
+        condicoes.append("p.id_produto > %s")
+        params.append(apos)
+
+    where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+
     # Query inteligente: Pega dados da tabela PAI (Produto) e junta com as FILHAS
     # Usamos COALESCE para pegar o 'tipo' da tabela específica que não for nula
-    query = """
+    query = f"""
         SELECT 
             p.id_produto as id,
             p.nome_produto as nome,
@@ -63,27 +161,84 @@ def get_produtos():
         LEFT JOIN Dispositivo d ON p.id_produto = d.id_produto
         LEFT JOIN Hardware h ON p.id_produto = h.id_produto
         LEFT JOIN Periferico per ON p.id_produto = per.id_produto
-        ORDER BY p.id_produto;
+        {where}
+        ORDER BY p.id_produto
     """
-    
-    cursor.execute(query)
-    produtos = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
 
-    return jsonify(produtos)
+    if limite is not None:
+        query += " LIMIT %s"
+        params.append(limite)
+
+    return query, params
+
+
+def stream_produtos(query, params, formato):
+    """
+    Gera a resposta linha a linha a partir de um cursor nomeado (server-side),
+    que traz LOTE_CURSOR_PRODUTOS linhas por vez do Postgres.
+    A conexão volta ao pool quando o gerador termina ou o cliente desconecta.
+    """
+    with pool.conexao() as conn:
+        with conn.cursor(name='stream_produtos', cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = LOTE_CURSOR_PRODUTOS
+            cursor.execute(query, params)
+            yield ""  # sinaliza para a rota que a consulta já foi aberta
+
+            if formato == 'ndjson':
+                for row in cursor:
+                    yield app.json.dumps(row) + "\n"
+            else:
+                yield "["
+                primeiro = True
+                for row in cursor:
+                    yield ("" if primeiro else ",") + app.json.dumps(row)
+                    primeiro = False
+                yield "]"
+
+
+@app.route('/api/produtos', methods=['GET'])
+def get_produtos():
+    limite = request.args.get('limite', type=int)
+    apos = request.args.get('apos', type=int)
+    formato = request.args.get('formato')
+
+    try:
+        if limite is None:
+            query, params = montar_consulta_produtos(request.args, apos=apos)
+        else:
+            limite = max(1, min(limite, LIMITE_MAXIMO_PRODUTOS))
+            # Busca 1 a mais só para saber se existe próxima página
+            query, params = montar_consulta_produtos(request.args, apos=apos, limite=limite + 1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Sem paginação: lista completa, enviada em streaming
+    if limite is None:
+        mimetype = 'application/x-ndjson' if formato == 'ndjson' else 'application/json'
+        gerador = stream_produtos(query, params, formato)
+        # Avança até o execute ainda dentro da rota: erro de conexão/SQL vira 500 normal
+        next(gerador)
+        return app.response_class(gerador, mimetype=mimetype)
+
+    # Página: no máximo LIMITE_MAXIMO_PRODUTOS linhas, cabe tranquilamente em memória
+    produtos = buscar_todos(query, params)
+    proximo_cursor = None
+    if len(produtos) > limite:
+        produtos = produtos[:limite]
+        proximo_cursor = produtos[-1]['id']
+
+    if formato == 'ndjson':
+        corpo = "".join(app.json.dumps(row) + "\n" for row in produtos)
+        return app.response_class(corpo, mimetype='application/x-ndjson',
+                                  headers={'X-Proximo-Cursor': '' if proximo_cursor is None else str(proximo_cursor)})
+
+    return jsonify({"produtos": produtos, "proximo_cursor": proximo_cursor})
 
 # =================================================================
 # ROTA 2: Listar Clientes
 # =================================================================
 @app.route('/api/clientes', methods=['GET'])
 def get_clientes():
-    conn = get_db_connection()
-    if not conn: return jsonify({"error": "Erro conexão"}), 500
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # ATUALIZAÇÃO: Fazemos um LEFT JOIN com a tabela Pedido e usamos COUNT
     # para saber quantas vezes esse cliente já comprou.
     query = """
@@ -98,10 +253,7 @@ def get_clientes():
         LEFT JOIN Pedido p ON c.id_cliente = p.id_cliente
         GROUP BY c.id_cliente, c.nome_cliente, c.cidade, c.estado, f.pontos_acumulados;
     """
-    cursor.execute(query)
-    clientes = cursor.fetchall()
-    
-    conn.close()
+    clientes = buscar_todos(query)
     return jsonify(clientes)
 
 # =================================================================
@@ -110,174 +262,187 @@ def get_clientes():
 @app.route('/api/checkout', methods=['POST'])
 def checkout():
     dados = request.json
-    conn = get_db_connection()
-    
-    if not conn:
-        return jsonify({"message": "Erro de conexão com o banco"}), 500
-
-    cursor = conn.cursor()
-
-    try:
-        # =================================================================
-        # 0. PREPARAÇÃO DOS DADOS
-        # =================================================================
-        id_cliente = dados.get('cliente_id')
-        items_recebidos = dados.get('items')
-        total_front = dados.get('total')
-        metodo_pagamento = dados.get('metodo_pagamento')
-        dados_desconto = dados.get('desconto')
-        
-        # Agrupa itens iguais para definir quantidade (Ex: 2x Mouse)
-        # Cria um dicionario: { id_produto: {qtd: 2, preco: 100} }
-        carrinho_processado = {}
-        for item in items_recebidos:
-            pid = item['id_produto']
-            preco = item['preco']
-            if pid in carrinho_processado:
-                carrinho_processado[pid]['qtd'] += 1
-            else:
-                carrinho_processado[pid] = {'qtd': 1, 'preco': preco}
-
-        # Calcula pontos (Exemplo: 1 ponto a cada R$ 10 gastos)
-        pontos_ganhos = int(total_front / 10)
+    with pool.conexao() as conn, conn.cursor() as cursor:
+        try:
+            # =================================================================
+            # 0. PREPARAÇÃO DOS DADOS
+            # =================================================================
+            id_cliente = dados.get('cliente_id')
+            items_recebidos = dados.get('items')
+            total_front = dados.get('total')
+            metodo_pagamento = dados.get('metodo_pagamento')
+            dados_desconto = dados.get('desconto')
         
-        # Datas
-        data_hoje = datetime.now().date()
-        prazo_entrega = datetime.now().date()
-
-        # =================================================================
-        # 1. INSERIR PEDIDO
-        # =================================================================
-        sql_pedido = """
-            INSERT INTO Pedido (data_pedido, prazo_estimado, status_pedido, prioridade_pedido, modo_envio, id_cliente, pontos_fidelidade_gerados)
-            VALUES (%s, %s, 'concluido', 'media', 'entrega', %s, %s)
-            RETURNING id_pedido;
-        """
-        cursor.execute(sql_pedido, (data_hoje, prazo_entrega, id_cliente, pontos_ganhos))
-        id_pedido = cursor.fetchone()[0] # Pega o ID gerado
-
-        # =================================================================
-        # 2. INSERIR ITENS E BAIXAR ESTOQUE
-        # =================================================================
-        subtotal_calculado = 0
+            # Agrupa itens iguais para definir quantidade (Ex: 2x Mouse)
+            # Cria um dicionario: { id_produto: {qtd: 2, preco: 100} }
+            carrinho_processado = {}
+            for item in items_recebidos:
+                pid = item['id_produto']
+                preco = item['preco']
+                if pid in carrinho_processado:
+                    carrinho_processado[pid]['qtd'] += 1
+                else:
+                    carrinho_processado[pid] = {'qtd': 1, 'preco': preco}
+
+            # Calcula pontos (Exemplo: 1 ponto a cada R$ 10 gastos)
+            pontos_ganhos = int(total_front / 10)
         
-        for pid, info in carrinho_processado.items():
-            qtd = info['qtd']
-            preco_unit = info['preco']
-            total_item = qtd * preco_unit
-            subtotal_calculado += total_item
-            
-            # A) Inserir na tabela de junção
-            cursor.execute("""
+            # Datas
+            data_hoje = datetime.now().date()
+            prazo_entrega = datetime.now().date()
+
+            # =================================================================
+            # 1. INSERIR PEDIDO
+            # =================================================================
+            sql_pedido = """
+                INSERT INTO Pedido (data_pedido, prazo_estimado, status_pedido, prioridade_pedido, modo_envio, id_cliente, pontos_fidelidade_gerados)
+                VALUES (%s, %s, 'concluido', 'media', 'entrega', %s, %s)
+                RETURNING id_pedido;
+            """
+            cursor.execute(sql_pedido, (data_hoje, prazo_entrega, id_cliente, pontos_ganhos))
+            id_pedido = cursor.fetchone()[0] # Pega o ID gerado
+
+            # =================================================================
+            # 2. INSERIR ITENS E BAIXAR ESTOQUE (uma única instrução para o carrinho todo)
+            # =================================================================
+            # - "travados" bloqueia as linhas de Produto sempre em ordem de id,
+            #   evitando deadlock entre dois carrinhos com os mesmos produtos
+            # - o UPDATE só baixa o estoque onde estoque_atual >= qtd; como a
+            #   condição é reavaliada sobre a linha já bloqueada, não há oversell
+            # - o INSERT grava os itens apenas dos produtos que foram baixados
+            if not carrinho_processado:
+                raise Exception("Carrinho vazio!")
+
+            ids = list(carrinho_processado.keys())
+            qtds = [info['qtd'] for info in carrinho_processado.values()]
+            precos = [info['preco'] for info in carrinho_processado.values()]
+
+            sql_itens = """
+                WITH carrinho AS (
+                    SELECT * FROM unnest(%s::int[], %s::int[], %s::numeric[]) AS c(id_produto, qtd, preco)
+                ),
+                travados AS (
+                    SELECT p.id_produto
+                    FROM Produto p
+                    JOIN carrinho c ON c.id_produto = p.id_produto
+                    ORDER BY p.id_produto
+                    FOR UPDATE OF p
+                ),
+                baixa AS (
+                    UPDATE Produto p
+                    SET estoque_atual = p.estoque_atual - c.qtd
+                    FROM carrinho c
+                    JOIN travados t ON t.id_produto = c.id_produto
+                    WHERE p.id_produto = c.id_produto
+                      AND p.estoque_atual >= c.qtd
+                    RETURNING p.id_produto
+                )
                 INSERT INTO Item_Pedido (id_pedido, id_produto, quantidade, preco_unitario, valor_total_item)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (id_pedido, pid, qtd, preco_unit, total_item))
-            
-            # B) Baixar estoque na tabela Produto
-            # Verifica se tem estoque antes
-            cursor.execute("SELECT estoque_atual FROM Produto WHERE id_produto = %s", (pid,))
-            estoque_atual = cursor.fetchone()[0]
-            
-            if estoque_atual < qtd:
-                raise Exception(f"Produto ID {pid} sem estoque suficiente!")
-                
-            cursor.execute("""
-                UPDATE Produto SET estoque_atual = estoque_atual - %s 
-                WHERE id_produto = %s
-            """, (qtd, pid))
-
-        # =================================================================
-        # 3. INSERIR VENDA (Financeiro)
-        # =================================================================
-        # Definindo valores fixos para simplificar
-        custo_envio = 20.00 
-        imposto_loja = total_front * 0.10 # 10%
-        taxa_pagamento = 5.00
-        frete_cobrado = 20.00
+                SELECT %s, c.id_produto, c.qtd, c.preco, c.qtd * c.preco
+                FROM carrinho c
+                JOIN baixa b ON b.id_produto = c.id_produto
+                RETURNING id_produto;
+            """
+            cursor.execute(sql_itens, (ids, qtds, precos, id_pedido))
+            baixados = {row[0] for row in cursor.fetchall()}
+
+            # Produto que não voltou no RETURNING não existe ou não tinha estoque
+            faltando = [pid for pid in ids if pid not in baixados]
+            if faltando:
+                raise Exception(f"Produto ID {faltando[0]} sem estoque suficiente!")
+
+            # Atualiza o modelo de recomendações na mesma transação:
+            # +1 pedido para cada par de produtos deste carrinho (ordem fixa evita deadlock)
+            if len(ids) > 1:
+                cursor.execute("""
+                    INSERT INTO Coocorrencia_Produto (id_produto, id_relacionado, qtd_pedidos)
+                    SELECT a.id, b.id, 1
+                    FROM unnest(%s::int[]) AS a(id)
+                    CROSS JOIN unnest(%s::int[]) AS b(id)
+                    WHERE a.id <> b.id
+                    ORDER BY a.id, b.id
+                    ON CONFLICT (id_produto, id_relacionado)
+                    DO UPDATE SET qtd_pedidos = Coocorrencia_Produto.qtd_pedidos + 1
+                """, (ids, ids))
+
+            subtotal_calculado = sum(info['qtd'] * info['preco'] for info in carrinho_processado.values())
+
+            # =================================================================
+            # 3. INSERIR VENDA (Financeiro)
+            # =================================================================
+            # Definindo valores fixos para simplificar
+            custo_envio = 20.00 
+            imposto_loja = total_front * 0.10 # 10%
+            taxa_pagamento = 5.00
+            frete_cobrado = 20.00
         
-        valor_desconto = 0
-        if dados_desconto:
-            # Se for porcentagem, calcula. Aqui o front ja mandou o total com desconto
-            # Então calculamos a diferença do subtotal
-            valor_desconto = (subtotal_calculado + frete_cobrado) - total_front
-
-        sql_venda = """
-            INSERT INTO Venda (id_pedido, custo_envio, custo_imposto_loja, custo_taxa_pagamento, valor_frete, valor_imposto_cliente, subtotal, valor_desconto, valor_total)
-            VALUES (%s, %s, %s, %s, %s, 0, %s, %s, %s)
-        """
-        cursor.execute(sql_venda, (id_pedido, custo_envio, imposto_loja, taxa_pagamento, frete_cobrado, subtotal_calculado, valor_desconto, total_front))
-
-        # =================================================================
-        # 4. REGISTRAR DESCONTO (Se houver)
-        # =================================================================
-        if dados_desconto:
-            cursor.execute("""
-                INSERT INTO Desconto_Aplicado (id_pedido, tipo, porcentagem, descricao)
-                VALUES (%s, %s, %s, %s)
-            """, (id_pedido, dados_desconto.get('tipo', 'promocional'), dados_desconto.get('valor', 0), dados_desconto.get('descricao', 'desconto aplicado')))
-
-        # =================================================================
-        # 5. INSERIR PAGAMENTO
-        # =================================================================
-
-        sql_pagamento = """
-            INSERT INTO Pagamento (id_pedido, forma_pagamento, parcelas, data_pagamento, valor_pago)
-            VALUES (%s, %s, 1, %s, %s)
-        """
-        cursor.execute(sql_pagamento, (id_pedido, metodo_pagamento, data_hoje, total_front))
-
-        # =================================================================
-        # 6. ATUALIZAR FIDELIDADE DO CLIENTE
-        # =================================================================
-        # Verifica se cliente ja tem registro na tabela fidelidade
-        cursor.execute("SELECT id_cliente FROM Fidelidade_Cliente WHERE id_cliente = %s", (id_cliente,))
-        if cursor.fetchone():
-            cursor.execute("""
-                UPDATE Fidelidade_Cliente 
-                SET pontos_acumulados = pontos_acumulados + %s 
-                WHERE id_cliente = %s
-            """, (pontos_ganhos, id_cliente))
-        else:
+            valor_desconto = 0
+            if dados_desconto:
+                # Se for porcentagem, calcula. Aqui o front ja mandou o total com desconto
+                # Então calculamos a diferença do subtotal
+                valor_desconto = (subtotal_calculado + frete_cobrado) - total_front
+
+            sql_venda = """
+                INSERT INTO Venda (id_pedido, custo_envio, custo_imposto_loja, custo_taxa_pagamento, valor_frete, valor_imposto_cliente, subtotal, valor_desconto, valor_total)
+                VALUES (%s, %s, %s, %s, %s, 0, %s, %s, %s)
+            """
+            cursor.execute(sql_venda, (id_pedido, custo_envio, imposto_loja, taxa_pagamento, frete_cobrado, subtotal_calculado, valor_desconto, total_front))
+
+            # =================================================================
+            # 4. REGISTRAR DESCONTO (Se houver)
+            # =================================================================
+            if dados_desconto:
+                cursor.execute("""
+                    INSERT INTO Desconto_Aplicado (id_pedido, tipo, porcentagem, descricao)
+                    VALUES (%s, %s, %s, %s)
+                """, (id_pedido, dados_desconto.get('tipo', 'promocional'), dados_desconto.get('valor', 0), dados_desconto.get('descricao', 'desconto aplicado')))
+
+            # =================================================================
+            # 5. INSERIR PAGAMENTO
+            # =================================================================
+
+            sql_pagamento = """
+                INSERT INTO Pagamento (id_pedido, forma_pagamento, parcelas, data_pagamento, valor_pago)
+                VALUES (%s, %s, 1, %s, %s)
+            """
+            cursor.execute(sql_pagamento, (id_pedido, metodo_pagamento, data_hoje, total_front))
+
+            # =================================================================
+            # 6. ATUALIZAR FIDELIDADE DO CLIENTE
+            # =================================================================
+            # Upsert: cria o registro de fidelidade ou soma os pontos, sem ler antes
             cursor.execute("""
                 INSERT INTO Fidelidade_Cliente (id_cliente, pontos_acumulados)
                 VALUES (%s, %s)
+                ON CONFLICT (id_cliente)
+                DO UPDATE SET pontos_acumulados = Fidelidade_Cliente.pontos_acumulados + EXCLUDED.pontos_acumulados
             """, (id_cliente, pontos_ganhos))
 
-        # =================================================================
-        # SUCESSO TOTAL: CONFIRMA A TRANSAÇÃO
-        # =================================================================
-        conn.commit()
-        print(f"Venda {id_pedido} realizada com sucesso!")
+            # =================================================================
+            # SUCESSO TOTAL: CONFIRMA A TRANSAÇÃO
+            # =================================================================
+            conn.commit()
+            cache_graficos.invalidar_tabelas('Pedido', 'Item_Pedido', 'Produto', 'Venda', 'Pagamento')
+            print(f"Venda {id_pedido} realizada com sucesso!")
         
-        return jsonify({
-            "message": "Compra realizada com sucesso!",
-            "id_pedido": id_pedido,
-            "pontos_ganhos": pontos_ganhos
-        }), 201
-
-    except Exception as e:
-        # Se DEU ERRO em qualquer etapa acima, desfaz tudo
-        conn.rollback()
-        print(f"Erro na transação: {e}")
-        return jsonify({"message": f"Erro ao processar compra: {str(e)}"}), 500
-    
-    finally:
-        cursor.close()
-        conn.close()
+            return jsonify({
+                "message": "Compra realizada com sucesso!",
+                "id_pedido": id_pedido,
+                "pontos_ganhos": pontos_ganhos
+            }), 201
+
+        except Exception as e:
+            # Se DEU ERRO em qualquer etapa acima, desfaz tudo
+            conn.rollback()
+            print(f"Erro na transação: {e}")
+            return jsonify({"message": f"Erro ao processar compra: {str(e)}"}), 500
 
 # =================================================================
 # ROTA 4: Listar Descontos
 # =================================================================
 @app.route('/api/descontos', methods=['GET'])
 def get_descontos():
-    conn = get_db_connection()
-    if not conn: return jsonify([]), 500
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM desconto_aplicado")
-    descontos = cursor.fetchall()
-
-    conn.close()
+    descontos = buscar_todos("SELECT * FROM desconto_aplicado")
     return jsonify(descontos)
 
 # =================================================================
@@ -285,9 +450,6 @@ def get_descontos():
 # =================================================================
 @app.route('/api/clientes/fidelidade', methods=['GET'])
 def get_clientes_fidelidade():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Busca clientes que tenham > 100 pontos na tabela fidelidade
     query = """
         SELECT c.id_cliente, c.nome_cliente 
@@ -295,10 +457,7 @@ def get_clientes_fidelidade():
         JOIN Fidelidade_Cliente f ON c.id_cliente = f.id_cliente
         WHERE f.pontos_acumulados > 100
     """
-    cursor.execute(query)
-    clientes_vip = cursor.fetchall()
-    
-    conn.close()
+    clientes_vip = buscar_todos(query)
     return jsonify(clientes_vip)
     
 # =================================================================
@@ -306,9 +465,6 @@ def get_clientes_fidelidade():
 # =================================================================
 @app.route('/api/clientes/promocional', methods=['GET'])
 def get_clientes_promocional():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Conta quantos itens do tipo 'Periferico' cada um comprou
     # e usa HAVING para filtrar só quem tem >= 2
     query = """
@@ -320,10 +476,7 @@ def get_clientes_promocional():
         GROUP BY c.id_cliente, c.nome_cliente
         HAVING COUNT(*) >= 2
     """
-    cursor.execute(query)
-    clientes_promo = cursor.fetchall()
-    
-    conn.close()
+    clientes_promo = buscar_todos(query)
     return jsonify(clientes_promo)
 
 # =================================================================
@@ -331,9 +484,6 @@ def get_clientes_promocional():
 # =================================================================
 @app.route('/api/clientes/primeira-compra', methods=['GET'])
 def get_clientes_primeira_compra():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Seleciona Clientes onde NÃO existe correspondência na tabela Pedidos
     query = """
         SELECT c.id_cliente, c.nome_cliente
@@ -341,10 +491,7 @@ def get_clientes_primeira_compra():
         LEFT JOIN Pedido p ON c.id_cliente = p.id_cliente
         WHERE p.id_pedido IS NULL
     """
-    cursor.execute(query)
-    clientes_novos = cursor.fetchall()
-    
-    conn.close()
+    clientes_novos = buscar_todos(query)
     return jsonify(clientes_novos)
 
 # =================================================================
@@ -353,9 +500,6 @@ def get_clientes_primeira_compra():
 
 @app.route('/api/clientes/inativos', methods=['GET'])
 def get_clientes_inativos():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Seleciona clientes cuja ÚLTIMA compra foi há mais de 6 meses
     # CURRENT_DATE - INTERVAL '6 months' calcula a data limite
     query = """
@@ -366,10 +510,7 @@ def get_clientes_inativos():
         HAVING MAX(p.data_pedido) < CURRENT_DATE - INTERVAL '6 months'
         ORDER BY ultima_compra ASC
     """
-    cursor.execute(query)
-    clientes = cursor.fetchall()
-    
-    conn.close()
+    clientes = buscar_todos(query)
     return jsonify(clientes)
 
 # =================================================================
@@ -378,9 +519,6 @@ def get_clientes_inativos():
 
 @app.route('/api/clientes/high-ticket', methods=['GET'])
 def get_clientes_high_ticket():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # 1. Calcula a média de TODAS as vendas da loja (Subquery)
     # 2. Agrupa os pedidos por cliente
     # 3. Filtra (HAVING) apenas quem tem média pessoal maior que a média global
@@ -396,64 +534,297 @@ def get_clientes_high_ticket():
         )
         ORDER BY ticket_medio_cliente DESC
     """
-    cursor.execute(query)
-    clientes = cursor.fetchall()
-    
-    conn.close()
+    clientes = buscar_todos(query)
     return jsonify(clientes)
 
 # =================================================================
 # ROTA 10: Recomendacoes de produtos
 # =================================================================
+# Listas de mais vendidos por categoria, usadas quando um produto ainda não
+# tem histórico de compra conjunta. Ficam em memória e são recalculadas em
+# segundo plano a cada POPULARES_TTL segundos (ou quando um produto é criado).
+POPULARES_POR_CATEGORIA = 20
+
+cache_recomendacoes = CacheDeResultados(ttl_padrao=float(os.environ.get('POPULARES_TTL', 600)))
+
+
+def calcular_populares_por_categoria():
+    linhas = buscar_todos("""
+        WITH vendidos AS (
+            SELECT id_produto, SUM(quantidade) AS qtd
+            FROM Item_Pedido
+            GROUP BY id_produto
+        ),
+        ranking AS (
+            SELECT 
+                p.id_produto,
+                p.nome_produto as nome,
+                p.preco_unitario as preco,
+                p.categoria,
+                ROW_NUMBER() OVER (PARTITION BY p.categoria ORDER BY COALESCE(v.qtd, 0) DESC, p.id_produto) AS posicao
+            FROM Produto p
+            LEFT JOIN vendidos v ON v.id_produto = p.id_produto
+        )
+        SELECT id_produto, nome, preco, categoria
+        FROM ranking
+        WHERE posicao <= %s
+        ORDER BY categoria, posicao;
+    """, (POPULARES_POR_CATEGORIA,))
+
+    por_categoria = {}
+    for row in linhas:
+        por_categoria.setdefault(row['categoria'], []).append(row)
+
+    return {
+        "por_categoria": por_categoria,
+        "geral": linhas,
+        "categoria_do_produto": {row['id_produto']: row['categoria'] for row in linhas},
+    }
+
+
+def sugestoes_populares(id_produto, categoria=None, qtd=3):
+    """Sorteia (em memória) produtos populares da mesma categoria, completando com os gerais."""
+    populares = cache_recomendacoes.obter('populares-por-categoria', calcular_populares_por_categoria)
+
+    if categoria is None:
+        categoria = populares["categoria_do_produto"].get(id_produto)
+    if categoria is None:
+        # Produto fora das listas (ex.: recém-criado e sem vendas): busca só a categoria pela PK
+        linha = buscar_todos("SELECT categoria FROM Produto WHERE id_produto = %s", (id_produto,))
+        categoria = linha[0]['categoria'] if linha else None
+
+    candidatos = [p for p in populares["por_categoria"].get(categoria, []) if p['id_produto'] != id_produto]
+    sugestoes = random.sample(candidatos, min(qtd, len(candidatos)))
+
+    if len(sugestoes) < qtd:
+        escolhidos = {p['id_produto'] for p in sugestoes} | {id_produto}
+        resto = [p for p in populares["geral"] if p['id_produto'] not in escolhidos]
+        sugestoes += random.sample(resto, min(qtd - len(sugestoes), len(resto)))
+
+    return sugestoes
+
+
 @app.route('/api/produtos/<int:id_produto>/recomendacoes', methods=['GET'])
 def get_recomendacoes(id_produto):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    # Lê o modelo pré-calculado (Coocorrencia_Produto): quantos pedidos tiveram
+    # os dois produtos juntos. O índice (id_produto, qtd_pedidos DESC) entrega
+    # o top 3 direto, sem o self-join em Item_Pedido a cada chamada.
     query = """
         SELECT 
             p.id_produto,
             p.nome_produto as nome,
             p.preco_unitario as preco,
             p.categoria,
-            COUNT(*) as relevancia
-        FROM Item_Pedido item_A
-        JOIN Item_Pedido item_B ON item_A.id_pedido = item_B.id_pedido
-        JOIN Produto p ON item_B.id_produto = p.id_produto
-        WHERE item_A.id_produto = %s
-          AND item_B.id_produto != %s
-        GROUP BY p.id_produto, p.nome_produto, p.preco_unitario, p.categoria
-        ORDER BY relevancia DESC
+            c.qtd_pedidos as relevancia
+        FROM Coocorrencia_Produto c
+        JOIN Produto p ON c.id_relacionado = p.id_produto
+        WHERE c.id_produto = %s
+        ORDER BY c.qtd_pedidos DESC
         LIMIT 3;
     """
     
-    cursor.execute(query, (id_produto, id_produto))
-    sugestoes = cursor.fetchall()
+    sugestoes = buscar_todos(query, (id_produto,))
 
     # FALLBACK (Plano B)
     # Se a query acima não retornar nada (produto novo ou poucas vendas),
-    # retornamos 3 produtos da mesma categoria para não deixar vazio.
+    # retornamos 3 produtos populares da mesma categoria para não deixar vazio.
     if not sugestoes:
-        cursor.execute("""
-            SELECT id_produto, nome_produto as nome, preco_unitario as preco, tipo
-            FROM Produto 
-            WHERE id_produto != %s 
-            ORDER BY RANDOM() 
-            LIMIT 3
-        """, (id_produto,))
-        sugestoes = cursor.fetchall()
-
-    conn.close()
+        sugestoes = sugestoes_populares(id_produto)
+
     return jsonify(sugestoes)
 
+# =================================================================
+# ROTA 11: Recomendações para vários produtos de uma vez (ex.: carrinho)
+# =================================================================
+# POST {"ids": [1, 5, 9], "k": 3}
+# Responde o top-k de cada produto e um top-k combinado (soma das relevâncias
+# de todos os produtos enviados), sempre sem os produtos que já estão na lista.
+# Tudo sai de uma única consulta sobre Coocorrencia_Produto.
+LIMITE_IDS_RECOMENDACAO = 100
+
+
+@app.route('/api/recomendacoes/batch', methods=['POST'])
+def get_recomendacoes_batch():
+    dados = request.json or {}
+
+    try:
+        ids = list(dict.fromkeys(int(i) for i in dados.get('ids', [])))
+        k = max(1, min(int(dados.get('k', 3)), 20))
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids deve ser uma lista de inteiros e k um inteiro"}), 400
+
+    if not ids:
+        return jsonify({"por_produto": {}, "combinado": []})
+    if len(ids) > LIMITE_IDS_RECOMENDACAO:
+        return jsonify({"error": f"Máximo de {LIMITE_IDS_RECOMENDACAO} produtos por requisição"}), 400
+
+    # - por_produto: LATERAL percorre o índice (id_produto, qtd_pedidos DESC) de
+    #   cada produto e para após k vizinhos que não estejam na lista
+    # - combinado: soma a relevância de cada vizinho em relação a todos os produtos
+    query = """
+        WITH entrada AS (
+            SELECT unnest(%(ids)s::int[]) AS id_produto
+        ),
+        por_produto AS (
+            SELECT e.id_produto AS origem, v.id_relacionado, v.qtd_pedidos AS relevancia
+            FROM entrada e
+            CROSS JOIN LATERAL (
+                SELECT c.id_relacionado, c.qtd_pedidos
+                FROM Coocorrencia_Produto c
+                WHERE c.id_produto = e.id_produto
+                  AND c.id_relacionado <> ALL(%(ids)s::int[])
+                ORDER BY c.qtd_pedidos DESC
+                LIMIT %(k)s
+            ) v
+        ),
+        combinado AS (
+            SELECT NULL::int AS origem, c.id_relacionado, SUM(c.qtd_pedidos) AS relevancia
+            FROM Coocorrencia_Produto c
+            WHERE c.id_produto = ANY(%(ids)s::int[])
+              AND c.id_relacionado <> ALL(%(ids)s::int[])
+            GROUP BY c.id_relacionado
+            ORDER BY relevancia DESC
+            LIMIT %(k)s
+        ),
+        todos AS (
+            SELECT * FROM por_produto
+            UNION ALL
+            SELECT * FROM combinado
+        )
+        SELECT 
+            t.origem,
+            p.id_produto,
+            p.nome_produto as nome,
+            p.preco_unitario as preco,
+            p.categoria,
+            t.relevancia
+        FROM todos t
+        JOIN Produto p ON p.id_produto = t.id_relacionado
+        ORDER BY t.origem NULLS LAST, t.relevancia DESC;
+    """
+
+    linhas = buscar_todos(query, {"ids": ids, "k": k})
+
+    por_produto = {str(i): [] for i in ids}
+    combinado = []
+    for row in linhas:
+        origem = row.pop('origem')
+        if origem is None:
+            combinado.append(row)
+        else:
+            por_produto[str(origem)].append(row)
+
+    return jsonify({"por_produto": por_produto, "combinado": combinado})
+
+# =================================================================
+# CACHE DOS GRÁFICOS
+# =================================================================
+# TTL (segundos) de cada gráfico; os que não estão aqui usam GRAFICOS_TTL.
+# Depois do TTL o valor antigo ainda é servido por mais um TTL enquanto é
+# recalculado em segundo plano. Escritas (checkout, novos produtos/clientes)
+# invalidam na hora os gráficos que leem as tabelas alteradas.
+TTL_GRAFICOS = {
+    'estoque-minimo-atual': 60,
+    'recorrencia-clientes': 900,
+    'recorrencia-mensal':   900,
+}
+
+cache_graficos = CacheDeResultados(ttl_padrao=float(os.environ.get('GRAFICOS_TTL', 300)))
+
+# nome do gráfico -> função que calcula os dados (usado também pelo batch)
+GRAFICOS = {}
+
+
+def grafico(nome, tabelas=()):
+    """
+    Registra a função como um gráfico: ela retorna o dict de dados e a rota
+    responde com a versão em cache (calculando só quando necessário).
+    """
+    def decorador(func):
+        GRAFICOS[nome] = func
+        cache_graficos.registrar(nome, ttl=TTL_GRAFICOS.get(nome), tabelas=tabelas)
+
+        @wraps(func)
+        def rota():
+            return jsonify(cache_graficos.obter(nome, func))
+        return rota
+    return decorador
+
+
+@app.route('/api/graficos/_cache', methods=['GET'])
+def estatisticas_cache_graficos():
+    return jsonify(cache_graficos.estatisticas())
+
+
+# =================================================================
+# ROTA: Métricas (formato texto do Prometheus)
+# =================================================================
+# Por rota: requisições, latência, tempo no banco/JSON/Python, consultas por
+# requisição e linhas retornadas; mais o estado do pool e dos caches.
+# As métricas são por processo (com vários workers, cada um expõe as suas).
+@app.route('/api/_metrics', methods=['GET'])
+def metricas_prometheus():
+    texto = metricas.coletor.renderizar(
+        pool=pool.estatisticas(),
+        caches={'graficos': cache_graficos.estatisticas(), 'recomendacoes': cache_recomendacoes.estatisticas()},
+    )
+    return app.response_class(texto, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# =================================================================
+# ROTA: Vários gráficos em uma requisição (relatorio.html)
+# =================================================================
+# GET /api/graficos/batch?charts=vendas-por-categoria,pedidos-por-mes,...
+# Sem "charts" devolve todos. Os gráficos são calculados em paralelo num pool
+# de threads limitado (cada um pega sua conexão do pool e passa pelo cache).
+executor_graficos = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('GRAFICOS_BATCH_WORKERS', 4)),
+    thread_name_prefix='graficos'
+)
+
+
+def _calcular_grafico_cronometrado(nome):
+    inicio = time.perf_counter()
+    dados = cache_graficos.obter(nome, GRAFICOS[nome])
+    return dados, round((time.perf_counter() - inicio) * 1000, 2)
+
+
+@app.route('/api/graficos/batch', methods=['GET'])
+def graficos_batch():
+    inicio = time.perf_counter()
+
+    param = request.args.get('charts')
+    nomes = [n.strip() for n in param.split(',') if n.strip()] if param else list(GRAFICOS)
+    nomes = list(dict.fromkeys(nomes))  # remove repetidos mantendo a ordem
+
+    desconhecidos = [n for n in nomes if n not in GRAFICOS]
+    if desconhecidos:
+        return jsonify({"error": f"Gráficos desconhecidos: {', '.join(desconhecidos)}"}), 400
+
+    # copy_context: as consultas das threads do pool contam para esta requisição nas métricas
+    futuros = {
+        nome: executor_graficos.submit(contextvars.copy_context().run, _calcular_grafico_cronometrado, nome)
+        for nome in nomes
+    }
+
+    resposta = {"graficos": {}, "tempos_ms": {}, "erros": {}}
+    for nome, futuro in futuros.items():
+        try:
+            resposta["graficos"][nome], resposta["tempos_ms"][nome] = futuro.result()
+        except Exception as e:
+            # Um gráfico com erro não derruba o relatório inteiro
+            print(f"Erro no gráfico {nome}: {e}")
+            resposta["erros"][nome] = str(e)
+
+    resposta["total_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    return jsonify(resposta)
+
 # =================================================================
 # ROTA: Vendas por categoria
 # =================================================================
 @app.route('/api/graficos/vendas-por-categoria', methods=['GET'])
+@grafico('vendas-por-categoria', tabelas=('Item_Pedido', 'Produto'))
 def vendas_por_categoria():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT p.categoria, SUM(i.valor_total_item) AS total
         FROM Item_Pedido i
@@ -462,10 +833,7 @@ def vendas_por_categoria():
         ORDER BY total DESC;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-
-    conn.close()
+    dados = buscar_todos(query)
 
     # Converter para formato que o frontend já entende
     resposta = {
@@ -473,16 +841,14 @@ def vendas_por_categoria():
         "totais":     [float(row["total"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Pedidos por mês
 # =================================================================
 @app.route('/api/graficos/pedidos-por-mes', methods=['GET'])
+@grafico('pedidos-por-mes', tabelas=('Pedido',))
 def pedidos_por_mes():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             TO_CHAR(data_pedido, 'YYYY-MM') AS mes,
@@ -492,23 +858,19 @@ def pedidos_por_mes():
         ORDER BY mes;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
-    return jsonify({
+    return {
         "meses": [row["mes"] for row in dados],
         "total": [row["total"] for row in dados]
-    })
+    }
 
 # =================================================================
 # ROTA: Quantidade de Produtos Vendidos
 # =================================================================
 @app.route('/api/graficos/top-produtos', methods=['GET'])
+@grafico('top-produtos', tabelas=('Item_Pedido', 'Produto'))
 def top_produtos():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT p.nome_produto AS nome, SUM(i.quantidade) AS qtd
         FROM Item_Pedido i
@@ -518,23 +880,19 @@ def top_produtos():
         LIMIT 5;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
-    return jsonify({
+    return {
         "produtos": [row["nome"] for row in dados],
         "quantidades": [row["qtd"] for row in dados]
-    })
+    }
 
 # =================================================================
 # ROTA: Vendas por Produto (Top 10)
 # =================================================================
 @app.route('/api/graficos/vendas-por-produto', methods=['GET'])
+@grafico('vendas-por-produto', tabelas=('Item_Pedido', 'Produto'))
 def vendas_por_produto():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             p.nome_produto,
@@ -546,25 +904,21 @@ def vendas_por_produto():
         LIMIT 10;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "produtos": [row["nome_produto"] for row in dados],
         "quantidades": [int(row["total_vendido"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
     # =================================================================
 # ROTA: Faturamento por Cliente (Top 10)
 # =================================================================
 @app.route('/api/graficos/faturamento-por-cliente', methods=['GET'])
+@grafico('faturamento-por-cliente', tabelas=('Venda', 'Pedido', 'Cliente'))
 def faturamento_por_cliente():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             c.nome_cliente,
@@ -577,25 +931,21 @@ def faturamento_por_cliente():
         LIMIT 10;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "clientes": [row["nome_cliente"] for row in dados],
         "totais":   [float(row["total_gasto"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
     # =================================================================
 # ROTA: Pedidos por Status
 # =================================================================
 @app.route('/api/graficos/pedidos-por-status', methods=['GET'])
+@grafico('pedidos-por-status', tabelas=('Pedido',))
 def pedidos_por_status():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             status_pedido,
@@ -605,25 +955,21 @@ def pedidos_por_status():
         ORDER BY status_pedido;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "status":      [row["status_pedido"] for row in dados],
         "quantidades": [int(row["quantidade"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Pedidos por Prioridade
 # =================================================================
 @app.route('/api/graficos/pedidos-por-prioridade', methods=['GET'])
+@grafico('pedidos-por-prioridade', tabelas=('Pedido',))
 def pedidos_por_prioridade():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             prioridade_pedido,
@@ -633,25 +979,21 @@ def pedidos_por_prioridade():
         ORDER BY prioridade_pedido;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "prioridades": [row["prioridade_pedido"] for row in dados],
         "quantidades": [int(row["quantidade"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Vendas por Forma de Pagamento
 # =================================================================
 @app.route('/api/graficos/vendas-por-forma-pagamento', methods=['GET'])
+@grafico('vendas-por-forma-pagamento', tabelas=('Pagamento',))
 def vendas_por_forma_pagamento():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             forma_pagamento,
@@ -661,25 +1003,21 @@ def vendas_por_forma_pagamento():
         ORDER BY forma_pagamento;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "formas":      [row["forma_pagamento"] for row in dados],
         "quantidades": [int(row["quantidade"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Estoque Atual x Estoque Mínimo
 # =================================================================
 @app.route('/api/graficos/estoque-minimo-atual', methods=['GET'])
+@grafico('estoque-minimo-atual', tabelas=('Produto',))
 def estoque_minimo_atual():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             nome_produto,
@@ -689,9 +1027,7 @@ def estoque_minimo_atual():
         ORDER BY nome_produto;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "produtos": [row["nome_produto"] for row in dados],
@@ -699,16 +1035,14 @@ def estoque_minimo_atual():
         "minimo":   [int(row["estoque_minimo"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Pedidos por Estado
 # =================================================================
 @app.route('/api/graficos/pedidos-por-estado', methods=['GET'])
+@grafico('pedidos-por-estado', tabelas=('Pedido', 'Cliente'))
 def pedidos_por_estado():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             c.estado,
@@ -719,25 +1053,21 @@ def pedidos_por_estado():
         ORDER BY quantidade DESC;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "estados":     [row["estado"] for row in dados],
         "quantidades": [int(row["quantidade"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Ticket Médio por Mês
 # =================================================================
 @app.route('/api/graficos/ticket-medio-mensal', methods=['GET'])
+@grafico('ticket-medio-mensal', tabelas=('Pedido', 'Venda'))
 def ticket_medio_mensal():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             TO_CHAR(DATE_TRUNC('month', p.data_pedido), 'YYYY-MM') AS mes,
@@ -748,25 +1078,21 @@ def ticket_medio_mensal():
         ORDER BY DATE_TRUNC('month', p.data_pedido);
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "meses":  [row["mes"] for row in dados],
         "tickets": [float(row["ticket_medio"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Lucro por Produto (Top 10)
 # =================================================================
 @app.route('/api/graficos/lucro-por-produto', methods=['GET'])
+@grafico('lucro-por-produto', tabelas=('Item_Pedido', 'Produto'))
 def lucro_por_produto():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         SELECT 
             p.nome_produto,
@@ -779,25 +1105,20 @@ def lucro_por_produto():
         LIMIT 10;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "produtos": [row["nome_produto"] for row in dados],
         "lucros":   [float(row["lucro_total"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Curva ABC de Produtos (Pareto)
 # =================================================================
 # @app.route('/api/graficos/curva-abc', methods=['GET'])
 # def curva_abc():
-#     conn = get_db_connection()
-#     cursor = conn.cursor(cursor_factory=RealDictCursor)
-
 #     query = """
 #         WITH faturamento AS (
 #             SELECT
@@ -829,9 +1150,7 @@ def lucro_por_produto():
 #         FROM acumulado;
 #     """
 
-#     cursor.execute(query)
-#     dados = cursor.fetchall()
-#     conn.close()
+#     dados = buscar_todos(query)
 
 #     resposta = {
 #         "produtos":       [row["nome_produto"] for row in dados],
@@ -840,16 +1159,14 @@ def lucro_por_produto():
 #         "classes":        [row["classe"] for row in dados]
 #     }
 
-#     return jsonify(resposta)
+#     return resposta
 
 # =================================================================
 # ROTA: Dias Médios Entre Compras por Cliente
 # =================================================================
 @app.route('/api/graficos/recorrencia-clientes', methods=['GET'])
+@grafico('recorrencia-clientes', tabelas=('Pedido', 'Cliente'))
 def recorrencia_clientes():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         WITH compras AS (
             SELECT 
@@ -887,25 +1204,21 @@ def recorrencia_clientes():
 
 
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "clientes": [row["nome_cliente"] for row in dados],
         "dias":     [float(row["dias_medio"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: Média Mensal de Dias Entre Compras
 # =================================================================
 @app.route('/api/graficos/recorrencia-mensal', methods=['GET'])
+@grafico('recorrencia-mensal', tabelas=('Pedido',))
 def recorrencia_mensal():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     query = """
         WITH compras AS (
             SELECT 
@@ -937,16 +1250,14 @@ def recorrencia_mensal():
         ORDER BY mes;
     """
 
-    cursor.execute(query)
-    dados = cursor.fetchall()
-    conn.close()
+    dados = buscar_todos(query)
 
     resposta = {
         "meses": [row["mes_formatado"] for row in dados],
         "dias":  [float(row["dias_medio"]) for row in dados]
     }
 
-    return jsonify(resposta)
+    return resposta
 
 # =================================================================
 # ROTA: inserir cliente
@@ -955,42 +1266,37 @@ def recorrencia_mensal():
 @app.route('/api/clientes', methods=['POST'])
 def criar_cliente():
     dados = request.json
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with pool.conexao() as conn, conn.cursor() as cursor:
+        try:
+            # 1. Inserir na tabela Cliente
+            # Usamos CURRENT_DATE para a data de cadastro
+            query_cliente = """
+                INSERT INTO Cliente (nome_cliente, cidade, estado, pais, data_cadastro)
+                VALUES (%s, %s, %s, 'Brasil', CURRENT_DATE)
+                RETURNING id_cliente;
+            """
+            cursor.execute(query_cliente, (
+                dados.get('nome'),
+                dados.get('cidade'),
+                dados.get('estado')
+            ))
+            novo_id = cursor.fetchone()[0]
+
+            # 2. Iniciar tabela de Fidelidade (Zero pontos)
+            query_fidelidade = """
+                INSERT INTO Fidelidade_Cliente (id_cliente, pontos_acumulados)
+                VALUES (%s, 0)
+            """
+            cursor.execute(query_fidelidade, (novo_id,))
 
-    try:
-        # 1. Inserir na tabela Cliente
-        # Usamos CURRENT_DATE para a data de cadastro
-        query_cliente = """
-            INSERT INTO Cliente (nome_cliente, cidade, estado, pais, data_cadastro)
-            VALUES (%s, %s, %s, 'Brasil', CURRENT_DATE)
-            RETURNING id_cliente;
-        """
-        cursor.execute(query_cliente, (
-            dados.get('nome'),
-            dados.get('cidade'),
-            dados.get('estado')
-        ))
-        novo_id = cursor.fetchone()[0]
-
-        # 2. Iniciar tabela de Fidelidade (Zero pontos)
-        query_fidelidade = """
-            INSERT INTO Fidelidade_Cliente (id_cliente, pontos_acumulados)
-            VALUES (%s, 0)
-        """
-        cursor.execute(query_fidelidade, (novo_id,))
-
-        conn.commit()
-        return jsonify({"message": "Cliente cadastrado com sucesso!", "id": novo_id}), 201
-
-    except Exception as e:
-        conn.rollback()
-        print("Erro ao criar cliente:", e)
-        return jsonify({"message": "Erro ao salvar no banco."}), 500
-    
-    finally:
-        cursor.close()
-        conn.close()
+            conn.commit()
+            cache_graficos.invalidar_tabelas('Cliente')
+            return jsonify({"message": "Cliente cadastrado com sucesso!", "id": novo_id}), 201
+
+        except Exception as e:
+            conn.rollback()
+            print("Erro ao criar cliente:", e)
+            return jsonify({"message": "Erro ao salvar no banco."}), 500
 
 
 # =================================================================
@@ -1000,70 +1306,67 @@ def criar_cliente():
 @app.route('/api/produtos', methods=['POST'])
 def criar_produto():
     dados = request.json
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # 1. Inserir na Tabela PAI (Produto)
-        cat = dados.get('categoria') # Ex: 'Hardware'
+    with pool.conexao() as conn, conn.cursor() as cursor:
+        try:
+            # 1. Inserir na Tabela PAI (Produto)
+            cat = dados.get('categoria') # Ex: 'Hardware'
         
-        query_pai = """
-            INSERT INTO Produto 
-            (nome_produto, categoria, preco_unitario, custo_unitario, estoque_atual, estoque_minimo)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id_produto;
-        """
+            query_pai = """
+                INSERT INTO Produto 
+                (nome_produto, categoria, preco_unitario, custo_unitario, estoque_atual, estoque_minimo)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id_produto;
+            """
         
-        cursor.execute(query_pai, (
-            dados.get('nome'),
-            cat,
-            dados.get('preco'),
-            dados.get('custo'),
-            dados.get('estoque_atual'),
-            dados.get('estoque_minimo')
-        ))
+            cursor.execute(query_pai, (
+                dados.get('nome'),
+                cat,
+                dados.get('preco'),
+                dados.get('custo'),
+                dados.get('estoque_atual'),
+                dados.get('estoque_minimo')
+            ))
         
-        novo_id = cursor.fetchone()[0]
-
-        # 2. Inserir na Tabela FILHA correspondente
-        # Precisamos preencher os campos NOT NULL com valores padrão ('Generico', 0, etc)
-        # para que o JOIN funcione na leitura.
-
-        if cat == 'Hardware':
-            # Campos obrigatórios: consumo_energia, tipo
-            cursor.execute("""
-                INSERT INTO Hardware (id_produto, consumo_energia, especificacao_tecnica, tipo)
-                VALUES (%s, 0, 'Especificação Padrão', 'Componente')
-            """, (novo_id,))
+            novo_id = cursor.fetchone()[0]
+
+            # 2. Inserir na Tabela FILHA correspondente
+            # Precisamos preencher os campos NOT NULL com valores padrão ('Generico', 0, etc)
+            # para que o JOIN funcione na leitura.
+
+            if cat == 'Hardware':
+                # Campos obrigatórios: consumo_energia, tipo
+                cursor.execute("""
+                    INSERT INTO Hardware (id_produto, consumo_energia, especificacao_tecnica, tipo)
+                    VALUES (%s, 0, 'Especificação Padrão', 'Componente')
+                """, (novo_id,))
             
-        elif cat == 'Periférico' or cat == 'Periferico':
-            # Campos obrigatórios: cor, conexao, tipo
-            cursor.execute("""
-                INSERT INTO Periferico (id_produto, cor, conexao, tipo)
-                VALUES (%s, 'Preto', 'USB', 'Acessório')
-            """, (novo_id,))
+            elif cat == 'Periférico' or cat == 'Periferico':
+                # Campos obrigatórios: cor, conexao, tipo
+                cursor.execute("""
+                    INSERT INTO Periferico (id_produto, cor, conexao, tipo)
+                    VALUES (%s, 'Preto', 'USB', 'Acessório')
+                """, (novo_id,))
             
-        elif cat == 'Dispositivo':
-            # Campos obrigatórios: cor, dimensao, tipo
-            cursor.execute("""
-                INSERT INTO Dispositivo (id_produto, cor, dimensao, tipo)
-                VALUES (%s, 'Padrão', 'Padrão', 'Eletrônico')
-            """, (novo_id,))
-
-        # Se for 'Outro', não inserimos em nenhuma filha, e o sistema lerá como 'Outro' mesmo.
-
-        conn.commit()
-        print(f"Produto {novo_id} criado como {cat}")
+            elif cat == 'Dispositivo':
+                # Campos obrigatórios: cor, dimensao, tipo
+                cursor.execute("""
+                    INSERT INTO Dispositivo (id_produto, cor, dimensao, tipo)
+                    VALUES (%s, 'Padrão', 'Padrão', 'Eletrônico')
+                """, (novo_id,))
+
+            # Se for 'Outro', não inserimos em nenhuma filha, e o sistema lerá como 'Outro' mesmo.
+
+            conn.commit()
+            cache_graficos.invalidar_tabelas('Produto')
+            cache_recomendacoes.invalidar('populares-por-categoria')
+            print(f"Produto {novo_id} criado como {cat}")
         
-        return jsonify({"message": "Produto criado!", "id": novo_id}), 201
-
-    except Exception as e:
-        conn.rollback()
-        print("Erro ao criar produto:", e)
-        return jsonify({"message": f"Erro SQL: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+            return jsonify({"message": "Produto criado!", "id": novo_id}), 201
+
+        except Exception as e:
+            conn.rollback()
+            print("Erro ao criar produto:", e)
+            return jsonify({"message": f"Erro SQL: {str(e)}"}), 500
 
 
 if __name__ == '__main__':
@@ -0,0 +1,839 @@
+"""
+Benchmark das rotas do backend contra bancos populados em várias escalas.
+
+    python backend/benchmark.py executar --camadas 1k 100k --concorrencia 8 --requisicoes 200
+    python backend/benchmark.py executar --url http://127.0.0.1:5000     # servidor já rodando
+    python backend/benchmark.py comparar resultados_benchmark/antes.json resultados_benchmark/depois.json
+
+Para cada camada (1k, 100k, 10m pedidos):
+  1. garante um banco próprio populado (loja_bench_<camada>) com o script_populador;
+  2. sobe o app.py apontando para esse banco (variáveis DB_*);
+  3. dispara cada rota com N clientes concorrentes (uma conexão HTTP keep-alive
+     por cliente) e mede latência p50/p95/p99, vazão e taxa de erro;
+  4. grava tudo em JSON (resultados_benchmark/benchmark-<data>.json).
+
+`comparar` lê dois resultados e aponta as rotas que pioraram além da
+tolerância (sai com código 1 se houver regressão).
+
+Por padrão só as rotas de leitura entram; --com-escritas inclui checkout e
+cadastros (que alteram o banco da camada). --sem-cache zera GRAFICOS_TTL e
+POPULARES_TTL para medir as consultas e não o cache.
+
+`checkout` mede a contenção do POST /api/checkout: vários compradores
+simultâneos escolhendo produtos e clientes com distribuição Zipf (poucos
+SKUs quentes), em níveis crescentes de concorrência. Para cada nível grava
+checkouts/s, latência de commit, taxa de rollback, tempo de espera por lock
+(amostrado de pg_locks + pg_stat_activity, por tabela) e se houve oversell.
+
+    python backend/benchmark.py checkout --camada 100k --niveis 1 4 16 64 --duracao 20
+"""
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import psycopg2
+
+DIRETORIO_BACKEND = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_POPULADOR = os.path.join(DIRETORIO_BACKEND, '..', 'script_populador', 'scripts')
+DIRETORIO_RESULTADOS = os.path.join(DIRETORIO_BACKEND, 'resultados_benchmark')
+
+# camada -> (qtd_clientes, qtd_pedidos)
+CAMADAS = {
+    '1k':   (100, 1_000),
+    '100k': (5_000, 100_000),
+    '10m':  (200_000, 10_000_000),
+}
+
+COMANDO_SERVIDOR = (
+    f'"{sys.executable}" -m flask --app app run --host 127.0.0.1 --port {{porta}} '
+    '--no-reload --no-debugger --with-threads'
+)
+
+
+# =================================================================
+# ESTATÍSTICAS
+# =================================================================
+def percentil(ordenados, p):
+    """Percentil pelo método nearest-rank sobre uma lista já ordenada."""
+    if not ordenados:
+        return None
+    # Menor posição com pelo menos p% dos valores até ela. p * N antes de dividir:
+    # p / 100 * N erra no float (7 / 100 * 100 = 7.000000000000001) e o ceil sobe uma posição
+    posicao = max(0, min(len(ordenados) - 1, math.ceil(p * len(ordenados) / 100) - 1))
+    return ordenados[posicao]
+
+
+def resumir(latencias_ms, erros, duracao_s):
+    """Resumo de uma rota: latências só das respostas OK; erros contam na taxa."""
+    ordenadas = sorted(latencias_ms)
+    total = len(ordenadas) + erros
+    return {
+        "requisicoes": total,
+        "erros": erros,
+        "taxa_erro": round(erros / total, 4) if total else None,
+        "rps": round(len(ordenadas) / duracao_s, 2) if duracao_s > 0 else None,
+        "p50_ms": _arredondar(percentil(ordenadas, 50)),
+        "p95_ms": _arredondar(percentil(ordenadas, 95)),
+        "p99_ms": _arredondar(percentil(ordenadas, 99)),
+        "media_ms": _arredondar(sum(ordenadas) / len(ordenadas)) if ordenadas else None,
+        "max_ms": _arredondar(ordenadas[-1]) if ordenadas else None,
+        "duracao_s": round(duracao_s, 2),
+    }
+
+
+def _arredondar(valor):
+    return None if valor is None else round(valor, 2)
+
+
+# =================================================================
+# CLIENTE HTTP
+# =================================================================
+class ClienteHttp:
+    """Uma conexão keep-alive por cliente simulado (reconecta após erro de rede)."""
+
+    def __init__(self, url, timeout):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.porta = partes.port or 80
+        self.timeout = timeout
+        self.conexao = None
+
+    def requisitar(self, metodo, caminho, corpo=None):
+        """Retorna (status, corpo em bytes). Exceções de rede sobem para quem chamou."""
+        if self.conexao is None:
+            self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+
+        cabecalhos = {}
+        dados = None
+        if corpo is not None:
+            dados = json.dumps(corpo).encode()
+            cabecalhos['Content-Type'] = 'application/json'
+
+        try:
+            self.conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            return resposta.status, resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.fechar()
+            raise
+
+    def obter_json(self, caminho):
+        status, corpo = self.requisitar('GET', caminho)
+        if status != 200:
+            raise RuntimeError(f"GET {caminho} respondeu {status}")
+        return json.loads(corpo)
+
+    def fechar(self):
+        if self.conexao is not None:
+            self.conexao.close()
+            self.conexao = None
+
+
+# =================================================================
+# ROTAS
+# =================================================================
+def montar_rotas(cliente, qtd_clientes, com_escritas):
+    """
+    Lista de (nome, gerador) onde gerador(rng) -> (metodo, caminho, corpo).
+    Produtos e gráficos são descobertos no próprio servidor.
+    """
+    produtos = _produtos(cliente)
+    graficos = sorted(cliente.obter_json('/api/graficos/_cache'))
+    ids = [pid for pid, _ in produtos]
+
+    def fixo(metodo, caminho, corpo=None):
+        return lambda rng: (metodo, caminho, corpo)
+
+    rotas = [
+        ("GET /api/produtos", fixo('GET', '/api/produtos')),
+        ("GET /api/produtos?limite=20", fixo('GET', '/api/produtos?limite=20&em_estoque=1')),
+        ("GET /api/produtos?formato=ndjson", fixo('GET', '/api/produtos?formato=ndjson')),
+        ("GET /api/clientes", fixo('GET', '/api/clientes')),
+        ("GET /api/descontos", fixo('GET', '/api/descontos')),
+        ("GET /api/clientes/fidelidade", fixo('GET', '/api/clientes/fidelidade')),
+        ("GET /api/clientes/promocional", fixo('GET', '/api/clientes/promocional')),
+        ("GET /api/clientes/primeira-compra", fixo('GET', '/api/clientes/primeira-compra')),
+        ("GET /api/clientes/inativos", fixo('GET', '/api/clientes/inativos')),
+        ("GET /api/clientes/high-ticket", fixo('GET', '/api/clientes/high-ticket')),
+        ("GET /api/produtos/<id>/recomendacoes",
+         lambda rng: ('GET', f'/api/produtos/{rng.choice(ids)}/recomendacoes', None)),
+        ("POST /api/recomendacoes/batch",
+         lambda rng: ('POST', '/api/recomendacoes/batch', {"ids": rng.sample(ids, min(3, len(ids))), "k": 3})),
+        ("GET /api/graficos/batch", fixo('GET', '/api/graficos/batch')),
+        ("GET /api/graficos/_cache", fixo('GET', '/api/graficos/_cache')),
+    ]
+    rotas += [(f"GET /api/graficos/{nome}", fixo('GET', f'/api/graficos/{nome}')) for nome in graficos]
+
+    if com_escritas:
+        def checkout(rng):
+            carrinho = rng.sample(produtos, min(rng.randint(1, 3), len(produtos)))
+            subtotal = sum(preco for _, preco in carrinho)
+            return ('POST', '/api/checkout', {
+                "cliente_id": rng.randint(1, qtd_clientes),
+                "items": [{"id_produto": pid, "preco": preco} for pid, preco in carrinho],
+                "total": round(subtotal + 20, 2),
+                "metodo_pagamento": rng.choice(['pix', 'cartao_credito', 'boleto']),
+            })
+
+        rotas += [
+            ("POST /api/checkout", checkout),
+            ("POST /api/clientes", lambda rng: ('POST', '/api/clientes', {
+                "nome": f"Cliente Benchmark {rng.randint(1, 10**9)}", "cidade": "São Paulo", "estado": "SP",
+            })),
+            ("POST /api/produtos", lambda rng: ('POST', '/api/produtos', {
+                "nome": f"Produto Benchmark {rng.randint(1, 10**9)}", "categoria": "Periférico",
+                "preco": 99.9, "custo": 50, "estoque_atual": 100, "estoque_minimo": 10,
+            })),
+        ]
+
+    return rotas
+
+
+def _produtos(cliente):
+    """(id, preço) dos produtos, lidos da listagem paginada (primeiras 1000 linhas)."""
+    resposta = cliente.obter_json('/api/produtos?limite=1000')
+    itens = resposta['produtos'] if isinstance(resposta, dict) else resposta
+    produtos = [(p['id'], float(p['preco'])) for p in itens]
+    if not produtos:
+        raise RuntimeError("O banco não tem produtos para o benchmark.")
+    return produtos
+
+
+# =================================================================
+# EXECUÇÃO DE UMA ROTA
+# =================================================================
+def medir_rota(url, gerador, concorrencia, requisicoes, tempo_maximo, timeout, aquecimento, semente):
+    """
+    Dispara `requisicoes` chamadas (ou até `tempo_maximo` segundos) com
+    `concorrencia` clientes simultâneos. As `aquecimento` primeiras de cada
+    cliente não entram na medição.
+    """
+    restantes = [requisicoes]
+    trava = threading.Lock()
+    latencias = []
+    erros = [0]
+    limite = [None]
+
+    def proxima():
+        with trava:
+            if restantes[0] <= 0 or (limite[0] is not None and time.monotonic() > limite[0]):
+                return False
+            restantes[0] -= 1
+            return True
+
+    def trabalhar(indice):
+        rng = random.Random(semente * 1000 + indice)
+        cliente = ClienteHttp(url, timeout)
+        locais, erros_locais = [], 0
+        try:
+            for _ in range(aquecimento):
+                try:
+                    cliente.requisitar(*gerador(rng))
+                except (OSError, http.client.HTTPException):
+                    pass
+            barreira.wait()
+
+            while proxima():
+                metodo, caminho, corpo = gerador(rng)
+                inicio = time.perf_counter()
+                try:
+                    status, _ = cliente.requisitar(metodo, caminho, corpo)
+                    ok = status < 400
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                if ok:
+                    locais.append((time.perf_counter() - inicio) * 1000)
+                else:
+                    erros_locais += 1
+        finally:
+            cliente.fechar()
+            with trava:
+                latencias.extend(locais)
+                erros[0] += erros_locais
+
+    # Todos os clientes começam a medir juntos, depois do aquecimento
+    barreira = threading.Barrier(concorrencia + 1)
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        futuros = [pool.submit(trabalhar, i) for i in range(concorrencia)]
+        barreira.wait()
+        inicio = time.perf_counter()
+        limite[0] = time.monotonic() + tempo_maximo
+        for futuro in futuros:
+            futuro.result()
+        duracao = time.perf_counter() - inicio
+
+    return resumir(latencias, erros[0], duracao)
+
+
+def medir_camada(url, args, qtd_clientes):
+    cliente = ClienteHttp(url, args.timeout)
+    try:
+        rotas = montar_rotas(cliente, qtd_clientes, args.com_escritas)
+    finally:
+        cliente.fechar()
+
+    if args.rotas:
+        rotas = [(nome, g) for nome, g in rotas if any(filtro in nome for filtro in args.rotas)]
+
+    resultados = {}
+    for nome, gerador in rotas:
+        resultado = medir_rota(url, gerador, args.concorrencia, args.requisicoes, args.tempo_maximo,
+                               args.timeout, args.aquecimento, args.semente)
+        resultados[nome] = resultado
+        print(f"   {nome:<50} p50 {_ms(resultado['p50_ms'])}  p95 {_ms(resultado['p95_ms'])}  "
+              f"p99 {_ms(resultado['p99_ms'])}  {resultado['rps'] or 0:>8.1f} req/s  "
+              f"erros {resultado['erros']}/{resultado['requisicoes']}")
+    return resultados
+
+
+def _ms(valor):
+    return f"{'-' if valor is None else f'{valor:.1f}':>8} ms"
+
+
+# =================================================================
+# PROVISIONAMENTO (banco populado + servidor)
+# =================================================================
+def _conectar(args, banco):
+    return psycopg2.connect(dbname=banco, user=args.usuario, password=args.senha,
+                            host=args.host, port=args.porta_db)
+
+
+def _estado_banco(args, banco):
+    """'vazio', 'incompleto' (população interrompida) ou 'pronto', e a qtd. de pedidos."""
+    try:
+        conn = _conectar(args, banco)
+    except psycopg2.OperationalError:
+        return 'vazio', 0
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pedido') IS NOT NULL, to_regclass('execucao_populacao') IS NOT NULL;")
+            tem_pedido, tem_execucao = cursor.fetchone()
+            if not tem_pedido:
+                return 'vazio', 0
+
+            cursor.execute("SELECT COUNT(*) FROM Pedido;")
+            pedidos = cursor.fetchone()[0]
+
+            if tem_execucao:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM Execucao_Populacao WHERE concluida_em IS NULL);")
+                if cursor.fetchone()[0]:
+                    return 'incompleto', pedidos
+
+            return ('pronto' if pedidos else 'vazio'), pedidos
+    finally:
+        conn.close()
+
+
+def provisionar(args, camada):
+    """Garante o banco da camada populado (roda o Criador_e_Populador.py se preciso)."""
+    qtd_clientes, qtd_pedidos = CAMADAS[camada]
+    banco = f"{args.prefixo_banco}_{camada}"
+    estado, pedidos = _estado_banco(args, banco)
+
+    if estado == 'pronto':
+        if pedidos != qtd_pedidos:
+            print(f"⚠️ {banco} tem {pedidos} pedidos (esperado {qtd_pedidos}); usando como está.")
+        else:
+            print(f"ℹ️ {banco} já populado ({pedidos} pedidos).")
+        return banco
+
+    comando = [
+        sys.executable, 'Criador_e_Populador.py',
+        '--usuario', args.usuario, '--senha', args.senha, '--host', args.host, '--porta', str(args.porta_db),
+        '--banco', banco, '--clientes', str(qtd_clientes), '--pedidos', str(qtd_pedidos),
+        '--semente', str(args.semente), '--workers', str(args.workers_populador),
+        '--distribuicao', args.distribuicao,
+    ]
+    if estado == 'vazio':
+        # Banco descartável: vale a carga sem WAL, com FKs e índices recriados no fim
+        comando += ['--otimizar-carga', 'unlogged']
+    else:
+        print(f"↩️ Retomando a população interrompida de {banco}.")
+
+    print(f"🔧 Populando {banco}: {qtd_clientes} clientes, {qtd_pedidos} pedidos...")
+    subprocess.run(comando, cwd=DIRETORIO_POPULADOR, check=True)
+    return banco
+
+
+class Servidor:
+    """Sobe o app.py num processo separado apontando para `banco` e espera ficar pronto."""
+
+    def __init__(self, args, banco, camada):
+        self.args = args
+        self.url = f"http://127.0.0.1:{args.porta_servidor}"
+        self.banco = banco
+        self.log = os.path.join(DIRETORIO_RESULTADOS, f"servidor-{camada}.log")
+        self.processo = None
+
+    def __enter__(self):
+        env = dict(os.environ, DB_NAME=self.banco, DB_USER=self.args.usuario, DB_PASSWORD=self.args.senha,
+                   DB_HOST=self.args.host, DB_PORT=str(self.args.porta_db))
+        if self.args.sem_cache:
+            env.update(GRAFICOS_TTL='0', POPULARES_TTL='0')
+
+        comando = shlex.split(self.args.comando_servidor.format(porta=self.args.porta_servidor))
+        with open(self.log, 'w') as saida:
+            self.processo = subprocess.Popen(comando, cwd=DIRETORIO_BACKEND, env=env,
+                                             stdout=saida, stderr=subprocess.STDOUT)
+
+        limite = time.monotonic() + 60
+        cliente = ClienteHttp(self.url, timeout=5)
+        while True:
+            try:
+                cliente.obter_json('/api/graficos/_cache')
+                break
+            except (OSError, http.client.HTTPException, RuntimeError):
+                if self.processo.poll() is not None or time.monotonic() > limite:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError(f"O servidor não subiu (veja {self.log})")
+                time.sleep(0.5)
+            finally:
+                cliente.fechar()
+        return self
+
+    def __exit__(self, *exc):
+        if self.processo is not None and self.processo.poll() is None:
+            self.processo.terminate()
+            try:
+                self.processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+
+
+# =================================================================
+# CONTENÇÃO NO CHECKOUT
+# =================================================================
+# Tabela travada por um backend em espera: pela relação do lock (quando o
+# pg_locks informa) ou pelo texto da instrução do checkout que está esperando
+TABELAS_CHECKOUT = [
+    ('fidelidade_cliente', re.compile(r'Fidelidade_Cliente', re.IGNORECASE)),
+    ('coocorrencia_produto', re.compile(r'Coocorrencia_Produto', re.IGNORECASE)),
+    ('produto', re.compile(r'\bProduto\b', re.IGNORECASE)),
+]
+
+
+def escolha_zipf(rng, opcoes, expoente):
+    """Sorteador com peso ∝ 1/posição^expoente, com a ordem de popularidade embaralhada."""
+    opcoes = list(opcoes)
+    rng.shuffle(opcoes)
+    acumulados = list(itertools.accumulate(1 / (i + 1) ** expoente for i in range(len(opcoes))))
+    total = acumulados[-1]
+    return lambda r: opcoes[bisect.bisect_left(acumulados, r.random() * total)]
+
+
+class AmostradorDeLocks(threading.Thread):
+    """
+    A cada `intervalo` segundos lista os locks não concedidos do banco. Cada
+    backend esperando soma `intervalo` ao tempo de espera da tabela envolvida.
+    """
+
+    CONSULTA = """
+        SELECT a.pid, l.locktype, l.relation::regclass::text, a.query
+        FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE NOT l.granted AND a.datname = current_database() AND a.pid <> pg_backend_pid();
+    """
+
+    def __init__(self, conn, intervalo):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.espera_s = {}
+        self.amostras = 0
+        self.max_esperando = 0
+
+    def _tabela(self, relacao, query):
+        if relacao:
+            return relacao.lower()
+        for tabela, padrao in TABELAS_CHECKOUT:
+            if padrao.search(query or ''):
+                return tabela
+        return 'outras'
+
+    def run(self):
+        with self.conn.cursor() as cursor:
+            while not self.parar.wait(self.intervalo):
+                cursor.execute(self.CONSULTA)
+                esperando = {}
+                for pid, _, relacao, query in cursor.fetchall():
+                    esperando.setdefault(pid, self._tabela(relacao, query))
+                self.amostras += 1
+                self.max_esperando = max(self.max_esperando, len(esperando))
+                for tabela in esperando.values():
+                    self.espera_s[tabela] = self.espera_s.get(tabela, 0) + self.intervalo
+
+    def resultado(self):
+        return {
+            "espera_lock_s": {t: round(v, 2) for t, v in sorted(self.espera_s.items(), key=lambda x: -x[1])},
+            "max_backends_esperando": self.max_esperando,
+            "amostras": self.amostras,
+        }
+
+
+def _preparar_estoque(conn, estoque_inicial):
+    """Repõe o estoque (se pedido) e retorna (último id_pedido, {id_produto: estoque})."""
+    with conn.cursor() as cursor:
+        if estoque_inicial is not None:
+            cursor.execute("UPDATE Produto SET estoque_atual = %s;", (estoque_inicial,))
+        cursor.execute("SELECT COALESCE(MAX(id_pedido), 0) FROM Pedido;")
+        ultimo_pedido = cursor.fetchone()[0]
+        cursor.execute("SELECT id_produto, estoque_atual FROM Produto;")
+        estoque = dict(cursor.fetchall())
+    conn.commit()
+    return ultimo_pedido, estoque
+
+
+def _verificar_oversell(conn, ultimo_pedido, estoque_antes):
+    """
+    Confere, produto a produto, estoque_antes - vendido no nível == estoque atual
+    e estoque atual >= 0. Qualquer diferença é venda sem estoque ou baixa perdida.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id_produto, p.estoque_atual, COALESCE(SUM(i.quantidade), 0)
+            FROM Produto p
+            LEFT JOIN Item_Pedido i ON i.id_produto = p.id_produto AND i.id_pedido > %s
+            GROUP BY p.id_produto, p.estoque_atual;
+        """, (ultimo_pedido,))
+        linhas = cursor.fetchall()
+    conn.commit()
+
+    negativos = [pid for pid, atual, _ in linhas if atual < 0]
+    divergentes = [pid for pid, atual, vendido in linhas
+                   if pid in estoque_antes and estoque_antes[pid] - vendido != atual]
+    return {
+        "oversell": bool(negativos or divergentes),
+        "produtos_negativos": negativos,
+        "produtos_divergentes": divergentes,
+        "itens_vendidos": sum(vendido for _, _, vendido in linhas),
+    }
+
+
+def medir_nivel_checkout(url, args, conn, conn_amostras, produtos, qtd_clientes, concorrencia):
+    """Roda `concorrencia` compradores por `args.duracao` segundos e resume o nível."""
+    ultimo_pedido, estoque_antes = _preparar_estoque(conn, args.estoque_inicial)
+
+    rng_base = random.Random(args.semente)
+    produto_zipf = escolha_zipf(rng_base, produtos, args.zipf_produtos)
+    cliente_zipf = escolha_zipf(rng_base, range(1, qtd_clientes + 1), args.zipf_clientes)
+
+    trava = threading.Lock()
+    latencias, motivos = [], {}
+    sucesso, rollback = [0], [0]
+
+    def comprador(indice):
+        rng = random.Random(args.semente * 1000 + concorrencia * 100 + indice)
+        cliente = ClienteHttp(url, args.timeout)
+        locais, motivos_locais, ok, falhas = [], {}, 0, 0
+        barreira.wait()
+        try:
+            while time.monotonic() < limite[0]:
+                carrinho = {}
+                for _ in range(rng.randint(1, args.max_itens)):
+                    pid, preco = produto_zipf(rng)
+                    carrinho[pid] = preco
+                corpo = {
+                    "cliente_id": cliente_zipf(rng),
+                    "items": [{"id_produto": pid, "preco": preco} for pid, preco in carrinho.items()],
+                    "total": round(sum(carrinho.values()) + 20, 2),
+                    "metodo_pagamento": 'pix',
+                }
+
+                inicio = time.perf_counter()
+                try:
+                    status, resposta = cliente.requisitar('POST', '/api/checkout', corpo)
+                except (OSError, http.client.HTTPException) as e:
+                    status, resposta = None, type(e).__name__.encode()
+                duracao_ms = (time.perf_counter() - inicio) * 1000
+
+                if status == 201:
+                    ok += 1
+                    locais.append(duracao_ms)
+                else:
+                    falhas += 1
+                    motivo = 'sem estoque' if b'sem estoque' in resposta else f"status {status}"
+                    motivos_locais[motivo] = motivos_locais.get(motivo, 0) + 1
+        finally:
+            cliente.fechar()
+            with trava:
+                latencias.extend(locais)
+                sucesso[0] += ok
+                rollback[0] += falhas
+                for motivo, qtd in motivos_locais.items():
+                    motivos[motivo] = motivos.get(motivo, 0) + qtd
+
+    limite = [None]
+    barreira = threading.Barrier(concorrencia + 1)
+    amostrador = AmostradorDeLocks(conn_amostras, args.intervalo_amostra)
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        futuros = [pool.submit(comprador, i) for i in range(concorrencia)]
+        limite[0] = time.monotonic() + args.duracao
+        amostrador.start()
+        inicio = time.perf_counter()
+        barreira.wait()
+        for futuro in futuros:
+            futuro.result()
+        duracao = time.perf_counter() - inicio
+    amostrador.parar.set()
+    amostrador.join()
+
+    ordenadas = sorted(latencias)
+    total = sucesso[0] + rollback[0]
+    return {
+        "concorrencia": concorrencia,
+        "checkouts": sucesso[0],
+        "checkouts_por_s": round(sucesso[0] / duracao, 2) if duracao > 0 else None,
+        "commit_p50_ms": _arredondar(percentil(ordenadas, 50)),
+        "commit_p95_ms": _arredondar(percentil(ordenadas, 95)),
+        "commit_p99_ms": _arredondar(percentil(ordenadas, 99)),
+        "rollbacks": rollback[0],
+        "taxa_rollback": round(rollback[0] / total, 4) if total else None,
+        "motivos_rollback": motivos,
+        **amostrador.resultado(),
+        **_verificar_oversell(conn, ultimo_pedido, estoque_antes),
+        "duracao_s": round(duracao, 2),
+    }
+
+
+def contencao_checkout(args):
+    """Curva vazão x concorrência do checkout, um nível de `args.niveis` por vez."""
+    os.makedirs(DIRETORIO_RESULTADOS, exist_ok=True)
+    qtd_clientes, _ = CAMADAS[args.camada]
+    banco = args.banco or f"{args.prefixo_banco}_{args.camada}"
+    if args.url:
+        qtd_clientes = args.clientes
+        servidor = None
+    else:
+        banco = provisionar(args, args.camada)
+        servidor = Servidor(args, banco, f"checkout-{args.camada}")
+
+    conn = _conectar(args, banco)
+    conn_amostras = _conectar(args, banco)
+    conn_amostras.autocommit = True
+    curva = []
+    try:
+        with (servidor or _SemServidor(args.url)) as srv:
+            cliente = ClienteHttp(srv.url, args.timeout)
+            try:
+                produtos = _produtos(cliente)
+            finally:
+                cliente.fechar()
+
+            print(f"📋 Checkout em {banco}: {len(produtos)} produtos, {qtd_clientes} clientes, "
+                  f"Zipf {args.zipf_produtos}/{args.zipf_clientes}")
+            for concorrencia in args.niveis:
+                nivel = medir_nivel_checkout(srv.url, args, conn, conn_amostras, produtos, qtd_clientes, concorrencia)
+                curva.append(nivel)
+                espera = ", ".join(f"{t} {v:.1f}s" for t, v in nivel["espera_lock_s"].items()) or "-"
+                print(f"   {concorrencia:>4} compradores  {nivel['checkouts_por_s'] or 0:>8.1f} checkouts/s  "
+                      f"p95 {_ms(nivel['commit_p95_ms'])}  rollback {(nivel['taxa_rollback'] or 0):6.1%}  "
+                      f"espera por lock: {espera}  {'❌ OVERSELL' if nivel['oversell'] else ''}")
+    finally:
+        conn.close()
+        conn_amostras.close()
+
+    resultado = {
+        "gerado_em": datetime.now().isoformat(timespec='seconds'),
+        "commit": _commit_atual(),
+        "banco": banco,
+        "parametros": {
+            "niveis": args.niveis, "duracao": args.duracao, "zipf_produtos": args.zipf_produtos,
+            "zipf_clientes": args.zipf_clientes, "max_itens": args.max_itens,
+            "estoque_inicial": args.estoque_inicial, "semente": args.semente,
+            "comando_servidor": args.comando_servidor,
+        },
+        "curva": curva,
+    }
+    saida = args.saida or os.path.join(
+        DIRETORIO_RESULTADOS, f"checkout-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados em {saida}")
+    return 1 if any(n["oversell"] for n in curva) else 0
+
+
+class _SemServidor:
+    """Mesmo formato do Servidor para quando o app já está rodando (--url)."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+# =================================================================
+# COMANDOS
+# =================================================================
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRETORIO_BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(args):
+    os.makedirs(DIRETORIO_RESULTADOS, exist_ok=True)
+    resultado = {
+        "gerado_em": datetime.now().isoformat(timespec='seconds'),
+        "commit": _commit_atual(),
+        "parametros": {
+            "concorrencia": args.concorrencia, "requisicoes": args.requisicoes,
+            "tempo_maximo": args.tempo_maximo, "aquecimento": args.aquecimento,
+            "semente": args.semente, "com_escritas": args.com_escritas, "sem_cache": args.sem_cache,
+            "distribuicao": args.distribuicao, "comando_servidor": args.comando_servidor,
+        },
+        "camadas": {},
+    }
+
+    if args.url:
+        print(f"📋 Servidor externo {args.url}")
+        resultado["camadas"]["externo"] = {"url": args.url, "rotas": medir_camada(args.url, args, args.clientes)}
+    else:
+        for camada in args.camadas:
+            qtd_clientes, qtd_pedidos = CAMADAS[camada]
+            banco = provisionar(args, camada)
+            print(f"📋 Camada {camada} ({qtd_pedidos} pedidos)")
+            with Servidor(args, banco, camada) as servidor:
+                resultado["camadas"][camada] = {
+                    "banco": banco, "clientes": qtd_clientes, "pedidos": qtd_pedidos,
+                    "rotas": medir_camada(servidor.url, args, qtd_clientes),
+                }
+
+    saida = args.saida or os.path.join(
+        DIRETORIO_RESULTADOS, f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados em {saida}")
+
+
+def comparar(args):
+    """Compara dois resultados rota a rota; retorna 1 se alguma piorou além da tolerância."""
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.novo, encoding='utf-8') as f:
+        novo = json.load(f)
+
+    regressoes = 0
+    for camada, dados_novo in novo["camadas"].items():
+        dados_base = base["camadas"].get(camada)
+        if dados_base is None:
+            continue
+        print(f"📋 Camada {camada}")
+        for rota, n in dados_novo["rotas"].items():
+            b = dados_base["rotas"].get(rota)
+            if b is None or b["p95_ms"] is None or n["p95_ms"] is None:
+                continue
+
+            motivos = []
+            if n["p95_ms"] > b["p95_ms"] * (1 + args.tolerancia):
+                motivos.append("p95")
+            if b["rps"] and (n["rps"] or 0) < b["rps"] * (1 - args.tolerancia):
+                motivos.append("vazão")
+            if (n["taxa_erro"] or 0) > (b["taxa_erro"] or 0) + 0.01:
+                motivos.append("erros")
+            regressoes += bool(motivos)
+
+            variacao = (n["p95_ms"] / b["p95_ms"] - 1) * 100 if b["p95_ms"] else 0
+            marca = f"❌ {', '.join(motivos)}" if motivos else "✅"
+            print(f"   {rota:<50} p95 {b['p95_ms']:>9.1f} → {n['p95_ms']:>9.1f} ms ({variacao:+6.1f}%)  {marca}")
+
+    print(f"{'❌' if regressoes else '✅'} {regressoes} rota(s) com regressão (tolerância {args.tolerancia:.0%}).")
+    return 1 if regressoes else 0
+
+
+def _argumentos_ambiente(parser):
+    """Conexão com o Postgres, provisionamento das camadas e servidor (comum a executar e checkout)."""
+    parser.add_argument('--usuario', default='postgres')
+    parser.add_argument('--senha', default='123')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--porta-db', default='5432')
+    parser.add_argument('--prefixo-banco', default='loja_bench')
+    parser.add_argument('--workers-populador', type=int, default=4)
+    parser.add_argument('--distribuicao', default='realista', help="perfil do populador (uniforme/realista)")
+    parser.add_argument('--porta-servidor', type=int, default=5055)
+    parser.add_argument('--sem-cache', action='store_true', help="GRAFICOS_TTL=0 e POPULARES_TTL=0")
+    parser.add_argument('--comando-servidor', default=COMANDO_SERVIDOR,
+                        help="comando que sobe o app; {porta} é substituído (ex.: gunicorn -w 4 -b 127.0.0.1:{porta} app:app)")
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark das rotas do backend.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    exe = sub.add_parser('executar', help="provisiona as camadas e mede todas as rotas")
+    exe.add_argument('--camadas', nargs='+', choices=CAMADAS, default=['1k', '100k'])
+    exe.add_argument('--url', help="mede um servidor já rodando (sem provisionar)")
+    exe.add_argument('--clientes', type=int, default=100, help="qtd. de clientes do banco com --url (checkout)")
+    exe.add_argument('--concorrencia', type=int, default=8, help="clientes simultâneos por rota")
+    exe.add_argument('--requisicoes', type=int, default=200, help="requisições medidas por rota")
+    exe.add_argument('--tempo-maximo', type=float, default=60, help="segundos no máximo por rota")
+    exe.add_argument('--aquecimento', type=int, default=2, help="requisições não medidas por cliente")
+    exe.add_argument('--timeout', type=float, default=120)
+    exe.add_argument('--rotas', nargs='+', help="mede só as rotas cujo nome contém algum destes trechos")
+    exe.add_argument('--com-escritas', action='store_true', help="inclui checkout e cadastros")
+    exe.add_argument('--semente', type=int, default=42)
+    exe.add_argument('--saida', help="arquivo JSON de saída")
+
+    _argumentos_ambiente(exe)
+
+    chk = sub.add_parser('checkout', help="curva vazão x concorrência do checkout com SKUs quentes")
+    chk.add_argument('--camada', choices=CAMADAS, default='100k')
+    chk.add_argument('--url', help="usa um servidor já rodando (informe também --banco)")
+    chk.add_argument('--banco', help="banco usado pelo servidor (padrão: o da camada)")
+    chk.add_argument('--clientes', type=int, default=100, help="qtd. de clientes do banco com --url")
+    chk.add_argument('--niveis', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32],
+                     help="quantidades de compradores simultâneos")
+    chk.add_argument('--duracao', type=float, default=20, help="segundos por nível")
+    chk.add_argument('--zipf-produtos', type=float, default=1.2, help="0 = produtos uniformes")
+    chk.add_argument('--zipf-clientes', type=float, default=0.8, help="0 = clientes uniformes")
+    chk.add_argument('--max-itens', type=int, default=3, help="itens por carrinho (1 a N)")
+    chk.add_argument('--estoque-inicial', type=int, default=1_000_000,
+                     help="estoque de todos os produtos no início de cada nível (altera o banco!)")
+    chk.add_argument('--manter-estoque', dest='estoque_inicial', action='store_const', const=None,
+                     help="não repõe o estoque (mede também rollbacks por falta de estoque)")
+    chk.add_argument('--intervalo-amostra', type=float, default=0.05, help="segundos entre amostras de pg_locks")
+    chk.add_argument('--timeout', type=float, default=60)
+    chk.add_argument('--semente', type=int, default=42)
+    chk.add_argument('--saida', help="arquivo JSON de saída")
+    _argumentos_ambiente(chk)
+
+    cmp_ = sub.add_parser('comparar', help="compara dois resultados e aponta regressões")
+    cmp_.add_argument('base')
+    cmp_.add_argument('novo')
+    cmp_.add_argument('--tolerancia', type=float, default=0.2, help="piora relativa aceita (0.2 = 20%%)")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = ler_argumentos()
+    if args.comando == 'executar':
+        executar(args)
+    elif args.comando == 'checkout':
+        sys.exit(contencao_checkout(args))
+    else:
+        sys.exit(comparar(args))
@@ -0,0 +1,166 @@
+"""
+Cache em memória para os resultados dos gráficos (/api/graficos/...).
+
+Cada entrada tem um TTL próprio. Depois de vencida, a entrada ainda é
+servida por mais `janela_stale` segundos enquanto uma thread em segundo
+plano recalcula o valor (stale-while-revalidate). As rotas que escrevem no
+banco chamam `invalidar_tabelas(...)` para descartar o que ficou desatualizado.
+
+Obs.: o cache é por processo. Com vários workers cada um tem o seu, e a
+invalidação só atinge o worker que atendeu a escrita (os outros expiram pelo TTL).
+"""
+import threading
+import time
+
+
+class _Entrada:
+    __slots__ = ("valor", "calculado_em", "geracao", "atualizando")
+
+    def __init__(self):
+        self.valor = None
+        self.calculado_em = None   # None = nunca calculado / invalidado
+        self.geracao = 0           # incrementa a cada invalidação
+        self.atualizando = False   # já existe refresh em segundo plano
+
+
+class CacheDeResultados:
+    def __init__(self, ttl_padrao=300, janela_stale=None):
+        self.ttl_padrao = ttl_padrao
+        # Por padrão, um valor vencido ainda pode ser servido por mais 1 TTL
+        self.janela_stale = janela_stale
+        self._entradas = {}
+        self._ttls = {}
+        self._tabelas = {}     # chave -> tabelas que o cálculo lê
+        self._locks = {}       # chave -> lock do cálculo síncrono (evita stampede)
+        self._lock = threading.Lock()
+        self._contadores = {}
+
+    # -----------------------------------------------------------------
+    # Registro
+    # -----------------------------------------------------------------
+    def registrar(self, chave, ttl=None, tabelas=()):
+        with self._lock:
+            self._ttls[chave] = self.ttl_padrao if ttl is None else ttl
+            self._tabelas[chave] = {t.lower() for t in tabelas}
+            self._entradas.setdefault(chave, _Entrada())
+            self._locks.setdefault(chave, threading.Lock())
+            self._contadores.setdefault(chave, {
+                "hits": 0, "stale_hits": 0, "misses": 0,
+                "refreshes": 0, "invalidacoes": 0, "erros_refresh": 0,
+            })
+
+    def _contar(self, chave, campo):
+        with self._lock:
+            self._contadores[chave][campo] += 1
+
+    def _janela(self, chave):
+        return self._ttls[chave] if self.janela_stale is None else self.janela_stale
+
+    # -----------------------------------------------------------------
+    # Leitura
+    # -----------------------------------------------------------------
+    def obter(self, chave, calcular):
+        """
+        Retorna o valor em cache para `chave`, chamando `calcular()` quando
+        necessário. A chave precisa ter sido registrada antes.
+        """
+        if chave not in self._entradas:
+            self.registrar(chave)
+
+        entrada = self._entradas[chave]
+        ttl = self._ttls[chave]
+        agora = time.monotonic()
+
+        with self._lock:
+            calculado_em = entrada.calculado_em
+            valor = entrada.valor
+
+            if calculado_em is not None:
+                idade = agora - calculado_em
+                if idade < ttl:
+                    self._contadores[chave]["hits"] += 1
+                    return valor
+                if idade < ttl + self._janela(chave):
+                    self._contadores[chave]["stale_hits"] += 1
+                    if not entrada.atualizando:
+                        entrada.atualizando = True
+                        threading.Thread(
+                            target=self._atualizar_em_segundo_plano,
+                            args=(chave, calcular, entrada.geracao),
+                            daemon=True,
+                        ).start()
+                    return valor
+
+        # Miss: calcula de forma síncrona, uma thread por chave de cada vez
+        with self._locks[chave]:
+            with self._lock:
+                # Outra thread pode ter calculado enquanto esperávamos o lock
+                if entrada.calculado_em is not None and time.monotonic() - entrada.calculado_em < ttl:
+                    self._contadores[chave]["hits"] += 1
+                    return entrada.valor
+                self._contadores[chave]["misses"] += 1
+                geracao = entrada.geracao
+
+            valor = calcular()
+            self._guardar(chave, valor, geracao)
+            return valor
+
+    def _guardar(self, chave, valor, geracao):
+        entrada = self._entradas[chave]
+        with self._lock:
+            # Se houve invalidação durante o cálculo, o resultado já nasceu velho
+            if entrada.geracao == geracao:
+                entrada.valor = valor
+                entrada.calculado_em = time.monotonic()
+
+    def _atualizar_em_segundo_plano(self, chave, calcular, geracao):
+        try:
+            with self._locks[chave]:
+                valor = calcular()
+            self._guardar(chave, valor, geracao)
+            self._contar(chave, "refreshes")
+        except Exception as e:
+            self._contar(chave, "erros_refresh")
+            print(f"Erro ao atualizar cache '{chave}': {e}")
+        finally:
+            with self._lock:
+                self._entradas[chave].atualizando = False
+
+    # -----------------------------------------------------------------
+    # Invalidação
+    # -----------------------------------------------------------------
+    def invalidar(self, *chaves):
+        """Descarta as chaves informadas (ou todas, se nenhuma for passada)."""
+        with self._lock:
+            for chave in (chaves or list(self._entradas)):
+                entrada = self._entradas.get(chave)
+                if entrada is None:
+                    continue
+                entrada.valor = None
+                entrada.calculado_em = None
+                entrada.geracao += 1
+                self._contadores[chave]["invalidacoes"] += 1
+
+    def invalidar_tabelas(self, *tabelas):
+        """Descarta toda chave cujo cálculo lê alguma das tabelas escritas."""
+        escritas = {t.lower() for t in tabelas}
+        with self._lock:
+            afetadas = [c for c, lidas in self._tabelas.items() if lidas & escritas]
+        if afetadas:
+            self.invalidar(*afetadas)
+
+    # -----------------------------------------------------------------
+    # Estatísticas
+    # -----------------------------------------------------------------
+    def estatisticas(self):
+        with self._lock:
+            agora = time.monotonic()
+            return {
+                chave: {
+                    **contadores,
+                    "ttl": self._ttls[chave],
+                    "idade": None if self._entradas[chave].calculado_em is None
+                             else round(agora - self._entradas[chave].calculado_em, 1),
+                }
+                for chave, contadores in self._contadores.items()
+            }
@@ -0,0 +1,193 @@
+"""
+Log de consultas lentas, com captura do plano por amostragem.
+
+Toda consulta executada pelos cursores medidos (ver metricas.py) que passar
+de `limite_ms` é registrada com SQL, parâmetros, duração e rota. Parte delas
+(`amostra`, de 0 a 1) também tem o plano capturado com
+EXPLAIN (ANALYZE, BUFFERS), no máximo uma vez a cada `intervalo_explain`
+segundos para o mesmo SQL.
+
+O trabalho pesado (serializar, gravar em disco, rodar o EXPLAIN) fica numa
+thread em segundo plano com conexão própria; a requisição só paga o
+mogrify() e um put na fila, e apenas quando a consulta já foi lenta. Se a fila
+encher, os registros excedentes são descartados (e contados).
+
+Cursores nomeados (o stream do catálogo) são medidos do execute até o fim da
+leitura e registrados uma vez, sem plano (o EXPLAIN releria tudo).
+
+Arquivos (em `diretorio`):
+  - consultas.jsonl : um JSON por consulta lenta
+  - planos.txt      : os planos capturados, identificados pelo mesmo "id"
+
+O EXPLAIN ANALYZE executa a consulta de novo, então:
+  - roda numa transação que é sempre desfeita, com statement_timeout;
+  - só é usado em leituras (SELECT/WITH sem INSERT/UPDATE/DELETE e sem
+    FOR UPDATE/SHARE). Para escritas o plano é só estimado (EXPLAIN simples).
+"""
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extensions
+
+# Leituras que podem ser reexecutadas com ANALYZE sem efeito nem lock de linha
+_SOMENTE_LEITURA = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_ESCRITA_OU_LOCK = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b|\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE)\b',
+                              re.IGNORECASE)
+
+TAMANHO_MAXIMO_PARAMS = 4000
+
+
+class RegistroDeConsultasLentas:
+    """
+    - config_banco: parâmetros do psycopg2.connect para a conexão do EXPLAIN
+    - limite_ms: a partir de quantos ms a consulta é considerada lenta
+    - amostra: fração das consultas lentas que tem o plano capturado
+    - intervalo_explain: segundos mínimos entre dois EXPLAIN do mesmo SQL
+    - timeout_explain: statement_timeout (s) do EXPLAIN ANALYZE
+    """
+
+    def __init__(self, config_banco, diretorio, limite_ms=500, amostra=0.2,
+                 intervalo_explain=300, timeout_explain=60, tamanho_fila=200):
+        self.config_banco = dict(config_banco)
+        self.diretorio = diretorio
+        self.limite_s = limite_ms / 1000
+        self.amostra = amostra
+        self.intervalo_explain = intervalo_explain
+        self.timeout_explain = timeout_explain
+
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._ultimo_explain = {}   # SQL -> instante do último EXPLAIN
+        self._conn = None
+        self._sequencia = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.contadores = {"registradas": 0, "planos": 0, "descartadas": 0, "erros_explain": 0}
+
+    # -----------------------------------------------------------------
+    # Lado da requisição (precisa ser barato)
+    # -----------------------------------------------------------------
+    def observar(self, cursor, query, params, duracao, rota, metodo, erro=False):
+        """
+        Chamado pelo cursor medido quando a consulta passou do limite. Cursor
+        nomeado chega uma vez, no fim da leitura, com execute + todos os fetches.
+        """
+        nomeado = cursor.name is not None
+        sql_final = None
+        if not nomeado:
+            # Cliente-side: monta o SQL final com os parâmetros, sem ir ao banco
+            try:
+                codificacao = extensions.encodings.get(cursor.connection.encoding, 'utf-8')
+                sql_final = cursor.mogrify(query, params).decode(codificacao, 'replace')
+            except Exception:
+                pass
+        # Com sql_final None não há EXPLAIN: num cursor nomeado seria reler o
+        # resultado inteiro (o catálogo todo) só para ter o plano
+
+        with self._lock:
+            self._sequencia += 1
+            id_registro = f"{os.getpid()}-{self._sequencia}"
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._trabalhar, name='consultas_lentas', daemon=True)
+                self._thread.start()
+
+        registro = {
+            "id": id_registro,
+            "em": datetime.now().isoformat(timespec='milliseconds'),
+            "rota": rota,
+            "metodo": metodo,
+            "duracao_ms": round(duracao * 1000, 2),
+            "erro": erro,
+            "cursor_nomeado": nomeado,
+            "sql": query if isinstance(query, str) else str(query),
+            "params": params,
+        }
+        try:
+            self._fila.put_nowait((registro, sql_final))
+        except queue.Full:
+            with self._lock:
+                self.contadores["descartadas"] += 1
+
+    # -----------------------------------------------------------------
+    # Thread em segundo plano
+    # -----------------------------------------------------------------
+    def _trabalhar(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        while True:
+            registro, sql_final = self._fila.get()
+            try:
+                self._processar(registro, sql_final)
+            except Exception as e:
+                print(f"Erro ao registrar consulta lenta: {e}")
+
+    def _deve_explicar(self, registro, sql_final):
+        if registro["erro"] or sql_final is None or random.random() >= self.amostra:
+            return False
+        agora = time.monotonic()
+        ultimo = self._ultimo_explain.get(registro["sql"])
+        if ultimo is not None and agora - ultimo < self.intervalo_explain:
+            return False
+        self._ultimo_explain[registro["sql"]] = agora
+        return True
+
+    def _processar(self, registro, sql_final):
+        print(f"Consulta lenta ({registro['duracao_ms']:.0f} ms) em {registro['metodo']} {registro['rota']}")
+
+        plano = None
+        if self._deve_explicar(registro, sql_final):
+            plano = self._explicar(sql_final)
+        registro["plano_capturado"] = None if plano is None else plano[0]
+
+        params = json.dumps(registro.pop("params"), ensure_ascii=False, default=str)
+        registro["params"] = params if len(params) <= TAMANHO_MAXIMO_PARAMS else params[:TAMANHO_MAXIMO_PARAMS] + "..."
+
+        with open(os.path.join(self.diretorio, 'consultas.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+        if plano is not None:
+            tipo, linhas = plano
+            with open(os.path.join(self.diretorio, 'planos.txt'), 'a', encoding='utf-8') as f:
+                f.write(f"==== {registro['id']}  {registro['em']}  {registro['metodo']} {registro['rota']}  "
+                        f"{registro['duracao_ms']} ms  ({tipo})\n")
+                f.write(sql_final.strip() + "\n\n")
+                f.write("\n".join(linhas) + "\n\n")
+
+        with self._lock:
+            self.contadores["registradas"] += 1
+            if plano is not None:
+                self.contadores["planos"] += 1
+
+    def _explicar(self, sql_final):
+        """Retorna ('analyze' | 'estimado', linhas do plano) ou None se falhar."""
+        analisar = bool(_SOMENTE_LEITURA.match(sql_final)) and not _ESCRITA_OU_LOCK.search(sql_final)
+        explain = "EXPLAIN (ANALYZE, BUFFERS) " if analisar else "EXPLAIN "
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg2.connect(**self.config_banco)
+            with self._conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s;", (int(self.timeout_explain * 1000),))
+                cursor.execute(explain + sql_final)
+                linhas = [linha for (linha,) in cursor.fetchall()]
+            return ('analyze' if analisar else 'estimado'), linhas
+        except psycopg2.Error as e:
+            with self._lock:
+                self.contadores["erros_explain"] += 1
+            print(f"Erro ao capturar plano da consulta lenta: {e}")
+            return None
+        finally:
+            # Mesmo uma leitura não deve deixar transação aberta nessa conexão
+            if self._conn is not None and not self._conn.closed:
+                try:
+                    self._conn.rollback()
+                except psycopg2.Error:
+                    self._conn.close()
+
+    def estatisticas(self):
+        with self._lock:
+            return {**self.contadores, "na_fila": self._fila.qsize(), "limite_ms": self.limite_s * 1000}
@@ -0,0 +1,197 @@
+"""
+Pool de conexões com o PostgreSQL usado por todas as rotas do backend.
+
+Em vez de abrir (TCP + autenticação) e fechar uma conexão a cada requisição,
+as conexões ficam guardadas e são emprestadas/devolvidas pelas rotas através
+do context manager `pool.conexao()`.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolEsgotadoError(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite de checkout."""
+
+
+def dimensionar_por_worker(maximo_total, workers):
+    """
+    Divide o orçamento total de conexões entre os processos do servidor
+    (ex.: workers do gunicorn), garantindo pelo menos 1 conexão por worker.
+    """
+    return max(1, int(maximo_total) // max(1, int(workers)))
+
+
+class PoolDeConexoes:
+    """
+    Pool thread-safe de conexões psycopg2.
+
+    - minimo / maximo: quantidade de conexões mantidas abertas / permitidas
+    - timeout: segundos que uma rota espera por uma conexão livre
+    - intervalo_verificacao: conexões paradas há mais que isso (segundos)
+      passam por um `SELECT 1` antes de serem emprestadas (0 = sempre)
+    """
+
+    def __init__(self, config, minimo=1, maximo=10, timeout=5.0, intervalo_verificacao=30.0):
+        if minimo > maximo:
+            raise ValueError("minimo não pode ser maior que maximo")
+
+        self.config = dict(config)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.intervalo_verificacao = intervalo_verificacao
+
+        self._cond = threading.Condition()
+        self._iniciar_estado()
+
+    def _iniciar_estado(self):
+        self._livres = []   # pilha de (conexao, instante em que foi devolvida)
+        self._total = 0     # conexões abertas (livres + emprestadas)
+        self._pid = os.getpid()
+
+    # -----------------------------------------------------------------
+    # Helpers internos
+    # -----------------------------------------------------------------
+    def _nova_conexao(self):
+        return psycopg2.connect(**self.config)
+
+    def _verificar_processo(self):
+        # Após um fork (gunicorn --preload) as conexões herdadas pertencem ao
+        # processo pai: não podem ser usadas nem fechadas aqui, só esquecidas.
+        if self._pid != os.getpid():
+            self._iniciar_estado()
+
+    def _saudavel(self, conn, ultimo_uso):
+        if conn.closed:
+            return False
+        if time.monotonic() - ultimo_uso < self.intervalo_verificacao:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    # -----------------------------------------------------------------
+    # API pública
+    # -----------------------------------------------------------------
+    def preencher(self):
+        """Abre as conexões mínimas de uma vez (opcional, evita latência no 1º acesso)."""
+        with self._cond:
+            self._verificar_processo()
+            while self._total < self.minimo:
+                self._livres.append((self._nova_conexao(), time.monotonic()))
+                self._total += 1
+
+    def emprestar(self):
+        """
+        Retorna uma conexão do pool. Se todas estiverem em uso e o limite
+        já foi atingido, espera até `timeout` segundos e então levanta
+        PoolEsgotadoError.
+        """
+        limite = time.monotonic() + self.timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                self._verificar_processo()
+                while True:
+                    if self._livres:
+                        conn, ultimo_uso = self._livres.pop()
+                        break
+                    if self._total < self.maximo:
+                        self._total += 1
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotadoError(
+                            f"Nenhuma conexão livre após {self.timeout}s (máximo = {self.maximo})"
+                        )
+                    self._cond.wait(restante)
+
+            # Vaga nova: abre a conexão fora do lock
+            if conn is None:
+                try:
+                    return self._nova_conexao()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._saudavel(conn, ultimo_uso):
+                return conn
+
+            # Conexão quebrada (queda do banco, restart...): descarta e tenta de novo
+            self._fechar(conn)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool, desfazendo qualquer transação deixada aberta."""
+        if self._pid != os.getpid():
+            return
+
+        if not descartar and not conn.closed:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    descartar = True
+
+        with self._cond:
+            if descartar or conn.closed or len(self._livres) >= self.maximo:
+                self._fechar(conn)
+                self._total -= 1
+            else:
+                self._livres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        """
+        Uso:
+            with pool.conexao() as conn:
+                ...
+        A conexão sempre volta para o pool, mesmo se a rota levantar exceção.
+        """
+        conn = self.emprestar()
+        quebrada = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            quebrada = True
+            raise
+        finally:
+            self.devolver(conn, descartar=quebrada)
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "total": self._total,
+                "livres": len(self._livres),
+                "em_uso": self._total - len(self._livres),
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+            }
+
+    def fechar_tudo(self):
+        with self._cond:
+            for conn, _ in self._livres:
+                self._fechar(conn)
+            self._total -= len(self._livres)
+            self._livres = []
@@ -0,0 +1,409 @@
+"""
+Métricas por rota e por consulta, expostas em formato texto do Prometheus.
+
+Duas peças:
+
+- `instrumentar(app)` liga hooks de before/after_request no Flask e troca o
+  provedor JSON por um que cronometra a serialização;
+- `ConexaoMedida` é a connection_factory do psycopg2 usada pelo pool: todo
+  cursor criado nela (qualquer cursor_factory, inclusive cursores nomeados)
+  cronometra execute/fetch e conta as linhas retornadas.
+
+Durante a requisição os números vão para um acumulador da própria requisição
+(guardado numa ContextVar) e só são somados aos totais globais, sob um único
+lock, quando a resposta termina de ser enviada. Consultas feitas fora de uma
+requisição (refresh do cache em segundo plano) entram na rota "_segundo_plano".
+
+Para cada rota (o molde da URL, ex.: /api/produtos/<int:id_produto>/recomendacoes):
+  - requisições por status e histograma da latência total
+  - tempo no banco, na serialização JSON e o restante (Python)
+  - histograma de consultas por requisição e total de linhas retornadas
+  - histograma da duração das consultas por operação (SELECT, INSERT, WITH...)
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+from psycopg2 import extensions
+
+# Limites (inclusivos) dos buckets dos histogramas
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+ROTA_SEGUNDO_PLANO = '_segundo_plano'
+ROTA_DESCONHECIDA = '_nao_encontrada'
+
+_requisicao_atual = ContextVar('metricas_requisicao', default=None)
+
+
+class _Histograma:
+    __slots__ = ("limites", "contagens", "soma")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)   # último = acima do maior limite
+        self.soma = 0.0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+
+    def linhas(self, nome, rotulos):
+        acumulado = 0
+        for limite, qtd in zip(self.limites, self.contagens):
+            acumulado += qtd
+            yield f'{nome}_bucket{{{rotulos},le="{limite}"}} {acumulado}'
+        acumulado += self.contagens[-1]
+        yield f'{nome}_bucket{{{rotulos},le="+Inf"}} {acumulado}'
+        yield f'{nome}_sum{{{rotulos}}} {self.soma:.6f}'
+        yield f'{nome}_count{{{rotulos}}} {acumulado}'
+
+
+class _Requisicao:
+    """O que uma requisição acumulou até agora (pode receber consultas de várias threads)."""
+    __slots__ = ("rota", "metodo", "inicio", "tempo_banco", "tempo_json", "linhas", "consultas", "lock")
+
+    def __init__(self, rota, metodo):
+        self.rota = rota
+        self.metodo = metodo
+        self.inicio = time.perf_counter()
+        self.tempo_banco = 0.0
+        self.tempo_json = 0.0
+        self.linhas = 0
+        self.consultas = []     # (operação, duração)
+        self.lock = threading.Lock()
+
+
+class ColetorDeMetricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requisicoes = {}   # (rota, metodo, status) -> qtd
+        self._rotas = {}         # (rota, metodo) -> dict com histogramas e tempos
+        self._consultas = {}     # (rota, operacao) -> _Histograma
+        self.consultas_lentas = None   # RegistroDeConsultasLentas ou outro objeto com limite_s e observar()
+
+    # -----------------------------------------------------------------
+    # Registro
+    # -----------------------------------------------------------------
+    def _rota(self, chave):
+        dados = self._rotas.get(chave)
+        if dados is None:
+            dados = self._rotas[chave] = {
+                "duracao": _Histograma(BUCKETS_SEGUNDOS),
+                "consultas": _Histograma(BUCKETS_CONSULTAS),
+                "banco": 0.0, "json": 0.0, "python": 0.0, "linhas": 0,
+            }
+        return dados
+
+    def _observar_consulta(self, rota, operacao, duracao):
+        histograma = self._consultas.get((rota, operacao))
+        if histograma is None:
+            histograma = self._consultas[(rota, operacao)] = _Histograma(BUCKETS_SEGUNDOS)
+        histograma.observar(duracao)
+
+    def registrar_consulta(self, operacao, duracao, linhas, nova=True):
+        """
+        Chamado pelos cursores. `nova=False` é um fetch de cursor nomeado: soma
+        tempo e linhas à consulta que já foi contada no execute.
+        """
+        atual = _requisicao_atual.get()
+        if atual is not None:
+            with atual.lock:
+                atual.tempo_banco += duracao
+                atual.linhas += linhas
+                if nova:
+                    atual.consultas.append((operacao, duracao))
+            return
+
+        with self._lock:
+            dados = self._rota((ROTA_SEGUNDO_PLANO, ''))
+            dados["banco"] += duracao
+            dados["linhas"] += linhas
+            if nova:
+                self._observar_consulta(ROTA_SEGUNDO_PLANO, operacao, duracao)
+
+    def rota_atual(self):
+        atual = _requisicao_atual.get()
+        return (atual.rota, atual.metodo) if atual is not None else (ROTA_SEGUNDO_PLANO, '')
+
+    def registrar_json(self, duracao):
+        atual = _requisicao_atual.get()
+        if atual is not None:
+            with atual.lock:
+                atual.tempo_json += duracao
+
+    def iniciar_requisicao(self, rota, metodo):
+        atual = _Requisicao(rota, metodo)
+        _requisicao_atual.set(atual)
+        return atual
+
+    def finalizar_requisicao(self, atual, status):
+        if _requisicao_atual.get() is atual:
+            _requisicao_atual.set(None)
+
+        total = time.perf_counter() - atual.inicio
+        with atual.lock:
+            consultas = list(atual.consultas)
+            banco, json_, linhas = atual.tempo_banco, atual.tempo_json, atual.linhas
+
+        with self._lock:
+            chave = (atual.rota, atual.metodo, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+
+            dados = self._rota((atual.rota, atual.metodo))
+            dados["duracao"].observar(total)
+            dados["consultas"].observar(len(consultas))
+            dados["banco"] += banco
+            dados["json"] += json_
+            dados["python"] += max(0.0, total - banco - json_)
+            dados["linhas"] += linhas
+            for operacao, duracao in consultas:
+                self._observar_consulta(atual.rota, operacao, duracao)
+
+    # -----------------------------------------------------------------
+    # Exposição
+    # -----------------------------------------------------------------
+    def renderizar(self, pool=None, caches=None):
+        """Texto no formato de exposição do Prometheus (version 0.0.4)."""
+        saida = []
+
+        def cabecalho(nome, tipo, ajuda):
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} {tipo}")
+
+        with self._lock:
+            cabecalho("loja_http_requisicoes_total", "counter", "Requisições atendidas por rota, método e status.")
+            for (rota, metodo, status), qtd in sorted(self._requisicoes.items()):
+                saida.append(f'loja_http_requisicoes_total{{{_rotulos(rota=rota, metodo=metodo, status=status)}}} {qtd}')
+
+            cabecalho("loja_http_duracao_segundos", "histogram", "Latência total da requisição (até o fim do envio).")
+            for (rota, metodo), dados in sorted(self._rotas.items()):
+                if metodo:
+                    saida.extend(dados["duracao"].linhas("loja_http_duracao_segundos", _rotulos(rota=rota, metodo=metodo)))
+
+            cabecalho("loja_http_consultas_por_requisicao", "histogram", "Consultas SQL executadas por requisição.")
+            for (rota, metodo), dados in sorted(self._rotas.items()):
+                if metodo:
+                    saida.extend(dados["consultas"].linhas("loja_http_consultas_por_requisicao",
+                                                           _rotulos(rota=rota, metodo=metodo)))
+
+            cabecalho("loja_http_tempo_segundos_total", "counter",
+                      "Tempo gasto por parte: banco (execute/fetch), json (serialização) e python (o resto).")
+            for (rota, metodo), dados in sorted(self._rotas.items()):
+                for parte in ("banco", "json", "python"):
+                    if metodo or parte == "banco":
+                        saida.append(f'loja_http_tempo_segundos_total{{{_rotulos(rota=rota, metodo=metodo, parte=parte)}}} '
+                                     f'{dados[parte]:.6f}')
+
+            cabecalho("loja_db_linhas_retornadas_total", "counter", "Linhas devolvidas pelo banco às consultas da rota.")
+            for (rota, metodo), dados in sorted(self._rotas.items()):
+                saida.append(f'loja_db_linhas_retornadas_total{{{_rotulos(rota=rota, metodo=metodo)}}} {dados["linhas"]}')
+
+            cabecalho("loja_db_consulta_segundos", "histogram", "Duração de cada consulta SQL por rota e operação.")
+            for (rota, operacao), histograma in sorted(self._consultas.items()):
+                saida.extend(histograma.linhas("loja_db_consulta_segundos", _rotulos(rota=rota, operacao=operacao)))
+
+        if self.consultas_lentas is not None:
+            estatisticas = self.consultas_lentas.estatisticas()
+            cabecalho("loja_consultas_lentas_total", "counter",
+                      "Consultas acima do limite: registradas, com plano capturado, descartadas (fila cheia).")
+            for evento in ("registradas", "planos", "descartadas", "erros_explain"):
+                saida.append(f'loja_consultas_lentas_total{{{_rotulos(evento=evento)}}} {estatisticas[evento]}')
+
+        if pool is not None:
+            cabecalho("loja_pool_conexoes", "gauge", "Conexões do pool deste processo.")
+            for campo, valor in pool.items():
+                saida.append(f'loja_pool_conexoes{{{_rotulos(estado=campo)}}} {valor}')
+
+        if caches:
+            cabecalho("loja_cache_eventos_total", "counter", "Eventos dos caches de resultados por chave.")
+            idades = []
+            for nome_cache, estatisticas in sorted(caches.items()):
+                for chave, campos in sorted(estatisticas.items()):
+                    for evento, valor in campos.items():
+                        if evento in ("ttl", "idade"):
+                            continue
+                        saida.append(f'loja_cache_eventos_total{{{_rotulos(cache=nome_cache, chave=chave, evento=evento)}}} {valor}')
+                    if campos.get("idade") is not None:
+                        idades.append((nome_cache, chave, campos["idade"]))
+            cabecalho("loja_cache_idade_segundos", "gauge", "Idade do valor guardado em cada chave do cache.")
+            for nome_cache, chave, idade in idades:
+                saida.append(f'loja_cache_idade_segundos{{{_rotulos(cache=nome_cache, chave=chave)}}} {idade}')
+
+        return "\n".join(saida) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(**rotulos):
+    return ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items())
+
+
+def _operacao(query):
+    partes = query.lstrip().split(None, 1) if isinstance(query, str) else None
+    return partes[0].upper() if partes else '?'
+
+
+coletor = ColetorDeMetricas()
+
+
+# =================================================================
+# CURSORES E CONEXÃO (psycopg2)
+# =================================================================
+class _CursorMedido:
+    """Mixin aplicado por cima de qualquer cursor_factory (cursor, RealDictCursor...)."""
+
+    # Cursor nomeado: [query, vars, duração até agora, rota, método, erro] da consulta
+    # aberta, entregue ao log de consultas lentas quando a leitura termina
+    _nomeado = None
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        erro = True
+        try:
+            resultado = super().execute(query, vars)
+            erro = False
+            return resultado
+        finally:
+            duracao = time.perf_counter() - inicio
+            # Cursor nomeado só declara no execute: as linhas vêm nos fetches
+            linhas = self.rowcount if self.name is None and self.description is not None else 0
+            coletor.registrar_consulta(_operacao(query), duracao, max(linhas, 0))
+
+            lentas = coletor.consultas_lentas
+            if lentas is None:
+                pass
+            elif self.name is not None:
+                # A demora está nos fetches: a rota é guardada agora (ainda dentro da
+                # requisição) e o total vai para o log em _encerrar_nomeado()
+                rota, metodo = coletor.rota_atual()
+                self._nomeado = [query, vars, duracao, rota, metodo, erro]
+            elif duracao >= lentas.limite_s:
+                rota, metodo = coletor.rota_atual()
+                lentas.observar(self, query, vars, duracao, rota, metodo, erro=erro)
+
+    def _somar_fetch(self, duracao, linhas):
+        coletor.registrar_consulta(None, duracao, linhas, nova=False)
+        if self._nomeado is not None:
+            self._nomeado[2] += duracao
+
+    def _encerrar_nomeado(self):
+        """Fim da leitura do cursor nomeado: execute + fetches viram um registro só."""
+        pendente, self._nomeado = self._nomeado, None
+        lentas = coletor.consultas_lentas
+        if pendente is None or lentas is None:
+            return
+        query, vars, duracao, rota, metodo, erro = pendente
+        if duracao >= lentas.limite_s:
+            lentas.observar(self, query, vars, duracao, rota, metodo, erro=erro)
+
+    def close(self):
+        if self.name is not None:
+            self._encerrar_nomeado()
+        return super().close()
+
+    def fetchmany(self, size=None):
+        if self.name is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._somar_fetch(time.perf_counter() - inicio, len(linhas))
+        return linhas
+
+    def fetchall(self):
+        if self.name is None:
+            return super().fetchall()
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._somar_fetch(time.perf_counter() - inicio, len(linhas))
+        self._encerrar_nomeado()
+        return linhas
+
+    def __iter__(self):
+        if self.name is None:
+            return super().__iter__()
+        return self._iterar_medido(super().__iter__())
+
+    def _iterar_medido(self, iterador):
+        # Cursor nomeado: cada lote de itersize linhas é um FETCH no servidor.
+        # Tempo e linhas são somados aqui e registrados uma vez por lote (e no
+        # fim), não a cada linha: o stream do catálogo não paga lock por linha.
+        tempo, linhas = 0.0, 0
+        lote = max(1, self.itersize)
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    linha = next(iterador)
+                except StopIteration:
+                    tempo += time.perf_counter() - inicio
+                    return
+                tempo += time.perf_counter() - inicio
+                linhas += 1
+                if linhas == lote:
+                    self._somar_fetch(tempo, linhas)
+                    tempo, linhas = 0.0, 0
+                yield linha
+        finally:
+            # Também no fim antecipado (cliente desconectou, gerador fechado)
+            if tempo or linhas:
+                self._somar_fetch(tempo, linhas)
+            self._encerrar_nomeado()
+
+
+_cursores_medidos = {}
+
+
+def _cursor_medido(fabrica):
+    classe = _cursores_medidos.get(fabrica)
+    if classe is None:
+        classe = _cursores_medidos[fabrica] = type(f"{fabrica.__name__}Medido", (_CursorMedido, fabrica), {})
+    return classe
+
+
+class ConexaoMedida(extensions.connection):
+    """connection_factory do psycopg2: todos os cursores criados nela são medidos."""
+
+    def cursor(self, *args, **kwargs):
+        fabrica = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _cursor_medido(fabrica)
+        return super().cursor(*args, **kwargs)
+
+
+# =================================================================
+# FLASK
+# =================================================================
+class ProvedorJsonMedido(DefaultJSONProvider):
+    """Mesmo JSON do Flask, cronometrando a serialização (jsonify e app.json.dumps)."""
+
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            coletor.registrar_json(time.perf_counter() - inicio)
+
+
+def instrumentar(app):
+    """Liga a coleta por requisição no app (chamar logo depois de criar o Flask)."""
+    app.json = ProvedorJsonMedido(app)
+
+    @app.before_request
+    def _iniciar_metricas():
+        regra = request.url_rule
+        g.metricas = coletor.iniciar_requisicao(regra.rule if regra is not None else ROTA_DESCONHECIDA,
+                                                request.method)
+
+    @app.after_request
+    def _finalizar_metricas(response):
+        atual = g.pop('metricas', None)
+        if atual is not None:
+            # Respostas em streaming ainda vão consultar o banco: fecha só no fim do envio
+            status = response.status_code
+            response.call_on_close(lambda: coletor.finalizar_requisicao(atual, status))
+        return response
@@ -0,0 +1,364 @@
+"""
+Verificação de regressão dos planos de execução das consultas do backend.
+
+    python backend/verificar_planos.py --banco loja_bench_10m --senha 123
+    python backend/verificar_planos.py --banco loja_bench_10m --gravar-orcamento backend/orcamento_planos.json
+    python backend/verificar_planos.py --banco loja_bench_10m --orcamento backend/orcamento_planos.json
+
+Como as consultas são extraídas: o app.py é importado apontando para o banco
+informado e cada rota de leitura é chamada pelo test client do Flask. O
+cursor medido (metricas.py) entrega cada SQL executado, já com os
+parâmetros, para o capturador daqui. Assim entram todas as consultas que a
+rota realmente faz (catálogo e suas variações de filtro/paginação,
+segmentos de clientes, recomendações, todos os gráficos...), inclusive as
+montadas dinamicamente. Toda rota GET sem parâmetros na URL é descoberta
+sozinha; as com parâmetros e os POSTs de leitura estão em `casos_especificos`.
+
+As conexões do app são abertas com default_transaction_read_only, então
+nenhuma rota consegue escrever no banco durante a verificação.
+
+Cada consulta capturada passa por EXPLAIN (FORMAT JSON) (só estimativa, não
+executa de novo) e a verificação falha se:
+  - o plano tem Seq Scan em Pedido/Item_Pedido e a tabela tem mais que
+    --limite-linhas linhas (exceto nas rotas de VARREDURA_PERMITIDA, que
+    agregam o histórico inteiro sem filtro; --estrito ignora a lista);
+  - o custo total da rota passa do orçamento (--orcamento, gravado antes com
+    --gravar-orcamento a partir de uma versão boa) mais --tolerancia;
+  - alguma consulta passa de --custo-maximo;
+  - a rota responde com erro.
+
+O custo dos planos com Index Only Scan depende do visibility map: num banco
+recém populado (sem VACUUM) as estimativas mudam depois do primeiro VACUUM e
+não batem com o orçamento. Use --vacuum (VACUUM ANALYZE em Pedido e
+Item_Pedido antes da verificação) na primeira vez e antes de gravar o orçamento.
+
+Sai com código 1 se houver falha (dá para usar em CI com um banco grande).
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extensions
+
+# Tabelas grandes em que um Seq Scan numa rota "quente" é regressão
+TABELAS_VIGIADAS = ('pedido', 'item_pedido')
+
+# Rotas que não são verificadas: diagnóstico e o batch (repete os gráficos individuais)
+ROTAS_IGNORADAS = {'/api/_metrics', '/api/graficos/_cache', '/api/graficos/batch'}
+
+# Rotas que agregam o histórico inteiro SEM filtrar a tabela: ler a tabela toda é o
+# plano certo (Seq Scan + HashAggregate) e a regressão aparece no custo/orçamento.
+# Rota exata -> tabelas liberadas. Entram os gráficos e os segmentos de clientes
+# que percorrem todos os pedidos; catálogo, recomendações e /api/clientes/fidelidade não
+# leem Pedido/Item_Pedido sem filtro e continuam verificados. Rota nova (gráfico ou
+# segmento) entra verificada até ser classificada aqui.
+VARREDURA_PERMITIDA = {
+    'GET /api/graficos/vendas-por-categoria': {'item_pedido'},
+    'GET /api/graficos/top-produtos': {'item_pedido'},
+    'GET /api/graficos/vendas-por-produto': {'item_pedido'},
+    'GET /api/graficos/lucro-por-produto': {'item_pedido'},
+    'GET /api/graficos/pedidos-por-mes': {'pedido'},
+    'GET /api/graficos/pedidos-por-status': {'pedido'},
+    'GET /api/graficos/pedidos-por-prioridade': {'pedido'},
+    'GET /api/graficos/pedidos-por-estado': {'pedido'},
+    'GET /api/graficos/faturamento-por-cliente': {'pedido'},
+    'GET /api/graficos/ticket-medio-mensal': {'pedido'},
+    'GET /api/graficos/recorrencia-clientes': {'pedido'},
+    'GET /api/graficos/recorrencia-mensal': {'pedido'},
+    # Segmentos de clientes: nenhum filtra Pedido/Item_Pedido, todos agregam ou
+    # cruzam o histórico inteiro com Cliente
+    'GET /api/clientes': {'pedido'},                    # COUNT de pedidos de cada cliente
+    'GET /api/clientes/promocional': {'pedido', 'item_pedido'},   # só junta com Periferico (não seletivo)
+    'GET /api/clientes/primeira-compra': {'pedido'},    # anti-join com todos os pedidos
+    'GET /api/clientes/inativos': {'pedido'},           # MAX(data_pedido) de cada cliente
+    'GET /api/clientes/high-ticket': {'pedido'},        # ticket médio sobre todas as vendas
+    # Fallback das recomendações: ranking de populares (em cache no app)
+    'GET /api/produtos/<int:id_produto>/recomendacoes [sem coocorrencia]': {'item_pedido'},
+}
+
+
+class CapturadorDeConsultas:
+    """Recebe do cursor medido todo SQL executado (limite_s = 0: nenhum fica de fora)."""
+
+    limite_s = 0.0
+
+    def __init__(self):
+        self.consultas = []
+
+    def observar(self, cursor, query, params, duracao, rota, metodo, erro=False):
+        codificacao = extensions.encodings.get(cursor.connection.encoding, 'utf-8')
+        self.consultas.append(cursor.mogrify(query, params).decode(codificacao, 'replace'))
+
+
+# =================================================================
+# CASOS (rota + parâmetros)
+# =================================================================
+def _um(conn, sql):
+    with conn.cursor() as cursor:
+        cursor.execute(sql)
+        linha = cursor.fetchone()
+    conn.rollback()
+    return linha[0] if linha else None
+
+
+def casos_especificos(conn):
+    """Rotas com parâmetros, usando valores reais do banco (os piores casos possíveis)."""
+    casos = []
+    regra_recomendacoes = '/api/produtos/<int:id_produto>/recomendacoes'
+
+    # Catálogo paginado: 1ª página, página do meio, filtros combinados
+    meio = _um(conn, "SELECT id_produto FROM Produto ORDER BY id_produto OFFSET (SELECT COUNT(*) / 2 FROM Produto) LIMIT 1;")
+    categoria = _um(conn, "SELECT categoria FROM Produto GROUP BY categoria ORDER BY COUNT(*) DESC LIMIT 1;")
+    preco = _um(conn, "SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY preco_unitario) FROM Produto;")
+    casos.append(('GET /api/produtos?limite=50', 'GET', '/api/produtos?limite=50', None))
+    if meio is not None:
+        casos.append(('GET /api/produtos?limite=50&apos', 'GET', f'/api/produtos?limite=50&apos={meio}', None))
+    if categoria is not None and preco is not None:
+        casos.append(('GET /api/produtos?limite=50&categoria&em_estoque&preco_max', 'GET',
+                      f'/api/produtos?limite=50&categoria={categoria}&em_estoque=1&preco_max={float(preco)}', None))
+    casos.append(('GET /api/produtos?limite=50&tipo_produto', 'GET', '/api/produtos?limite=50&tipo_produto=Hardware', None))
+
+    # Recomendações: o produto com mais vizinhos e um sem nenhum (cai no fallback)
+    com_vizinhos = _um(conn, """
+        SELECT id_produto FROM Coocorrencia_Produto GROUP BY id_produto ORDER BY COUNT(*) DESC LIMIT 1;
+    """)
+    sem_vizinhos = _um(conn, """
+        SELECT p.id_produto FROM Produto p
+        WHERE NOT EXISTS (SELECT 1 FROM Coocorrencia_Produto c WHERE c.id_produto = p.id_produto)
+        LIMIT 1;
+    """)
+    if com_vizinhos is not None:
+        casos.append((f'GET {regra_recomendacoes}', 'GET', f'/api/produtos/{com_vizinhos}/recomendacoes', None))
+    if sem_vizinhos is not None:
+        casos.append((f'GET {regra_recomendacoes} [sem coocorrencia]', 'GET',
+                      f'/api/produtos/{sem_vizinhos}/recomendacoes', None))
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id_produto FROM Coocorrencia_Produto GROUP BY id_produto ORDER BY COUNT(*) DESC LIMIT 3;")
+        mais_vizinhos = [i for (i,) in cursor.fetchall()]
+    conn.rollback()
+    if mais_vizinhos:
+        casos.append(('POST /api/recomendacoes/batch', 'POST', '/api/recomendacoes/batch',
+                      {"ids": mais_vizinhos, "k": 3}))
+
+    return casos, {regra_recomendacoes, '/api/recomendacoes/batch'}
+
+
+def montar_casos(flask_app, conn):
+    casos, cobertas = casos_especificos(conn)
+    sem_caso = []
+    for regra in sorted(flask_app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not regra.rule.startswith('/api/') or regra.rule in ROTAS_IGNORADAS or regra.rule in cobertas:
+            continue
+        if 'GET' in regra.methods and not regra.arguments:
+            casos.append((f"GET {regra.rule}", 'GET', regra.rule, None))
+        else:
+            sem_caso.append(f"{','.join(sorted(regra.methods - {'HEAD', 'OPTIONS'}))} {regra.rule}")
+    return casos, sem_caso
+
+
+# =================================================================
+# PLANOS
+# =================================================================
+def _nos(plano):
+    yield plano
+    for filho in plano.get('Plans', []):
+        yield from _nos(filho)
+
+
+def tamanho_tabelas(conn):
+    """Linhas estimadas (reltuples) das tabelas vigiadas; conta de verdade se nunca houve ANALYZE."""
+    tamanhos = {}
+    with conn.cursor() as cursor:
+        for tabela in TABELAS_VIGIADAS:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (tabela,))
+            linhas = cursor.fetchone()[0]
+            if linhas < 0:
+                cursor.execute(f"SELECT COUNT(*) FROM {tabela};")
+                linhas = cursor.fetchone()[0]
+            tamanhos[tabela] = linhas
+    conn.rollback()
+    return tamanhos
+
+
+def preparar_estatisticas(args, tamanhos):
+    """VACUUM ANALYZE das tabelas vigiadas (--vacuum) ou aviso se nunca passaram por VACUUM."""
+    conn = psycopg2.connect(dbname=args.banco, user=args.usuario, password=args.senha,
+                            host=args.host, port=args.porta_db)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            if args.vacuum:
+                for tabela in TABELAS_VIGIADAS:
+                    print(f"🔧 VACUUM ANALYZE {tabela}...")
+                    cursor.execute(f"VACUUM (ANALYZE) {tabela};")
+                return
+            cursor.execute("""
+                SELECT relname FROM pg_stat_user_tables
+                WHERE relname = ANY(%s) AND last_vacuum IS NULL AND last_autovacuum IS NULL;
+            """, (list(TABELAS_VIGIADAS),))
+            sem_vacuum = [t for (t,) in cursor.fetchall() if tamanhos.get(t, 0) > args.limite_linhas]
+    finally:
+        conn.close()
+    if sem_vacuum:
+        print(f"⚠️ {', '.join(sem_vacuum)} nunca passaram por VACUUM: Index Only Scan fica caro no plano "
+              "e os custos não batem com os de um banco já vacuumado. Rode com --vacuum.")
+
+
+def explicar(conn, sql):
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plano = cursor.fetchone()[0][0]['Plan']
+    conn.rollback()
+    return plano
+
+
+def _liberadas(rotulo, estrito):
+    return set() if estrito else VARREDURA_PERMITIDA.get(rotulo, set())
+
+
+def avaliar_caso(conn, rotulo, consultas, tamanhos, args):
+    """Explica as consultas do caso e devolve (resultado, lista de falhas)."""
+    falhas = []
+    liberadas = _liberadas(rotulo, args.estrito)
+    detalhes = []
+
+    for sql in consultas:
+        plano = explicar(conn, sql)
+        custo = plano['Total Cost']
+        varreduras = sorted({
+            no['Relation Name'].lower() for no in _nos(plano)
+            if no['Node Type'] == 'Seq Scan' and no.get('Relation Name', '').lower() in TABELAS_VIGIADAS
+        })
+        resumo_sql = " ".join(sql.split())[:120]
+
+        for tabela in varreduras:
+            if tamanhos[tabela] > args.limite_linhas and tabela not in liberadas:
+                falhas.append(f"Seq Scan em {tabela} ({tamanhos[tabela]} linhas): {resumo_sql}")
+        if args.custo_maximo is not None and custo > args.custo_maximo:
+            falhas.append(f"custo {custo:.0f} > {args.custo_maximo:.0f}: {resumo_sql}")
+
+        detalhes.append({"sql": sql, "custo": custo, "seq_scans": varreduras, "no_raiz": plano['Node Type']})
+
+    return {
+        "consultas": detalhes,
+        "custo_total": round(sum(d["custo"] for d in detalhes), 2),
+    }, falhas
+
+
+# =================================================================
+# EXECUÇÃO
+# =================================================================
+def carregar_app(args):
+    """Importa o app.py apontando para o banco, só leitura e sem o log de consultas lentas."""
+    os.environ.update({
+        'DB_NAME': args.banco, 'DB_USER': args.usuario, 'DB_PASSWORD': args.senha,
+        'DB_HOST': args.host, 'DB_PORT': str(args.porta_db), 'CONSULTA_LENTA_MS': '-1',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as modulo_app
+    import metricas
+
+    modulo_app.pool.config['options'] = '-c default_transaction_read_only=on'
+    capturador = CapturadorDeConsultas()
+    metricas.coletor.consultas_lentas = capturador
+    return modulo_app.app, capturador
+
+
+def verificar(args):
+    flask_app, capturador = carregar_app(args)
+    conn = psycopg2.connect(dbname=args.banco, user=args.usuario, password=args.senha,
+                            host=args.host, port=args.porta_db)
+    try:
+        tamanhos = tamanho_tabelas(conn)
+        preparar_estatisticas(args, tamanhos)
+        if all(linhas <= args.limite_linhas for linhas in tamanhos.values()):
+            print(f"⚠️ {args.banco} é pequeno demais ({tamanhos}): a regra de Seq Scan "
+                  f"(> {args.limite_linhas} linhas) não tem como disparar.")
+
+        casos, sem_caso = montar_casos(flask_app, conn)
+        orcamento = {}
+        if args.orcamento:
+            with open(args.orcamento, encoding='utf-8') as f:
+                orcamento = json.load(f)["custos"]
+
+        cliente = flask_app.test_client()
+        resultados, total_falhas = {}, 0
+        print(f"📋 {len(casos)} casos em {args.banco} ({', '.join(f'{t}: {n}' for t, n in tamanhos.items())})")
+
+        for rotulo, metodo, url, corpo in casos:
+            capturador.consultas = []
+            resposta = cliente.open(url, method=metodo, json=corpo)
+            resposta.get_data()
+            resposta.close()
+
+            resultado, falhas = avaliar_caso(conn, rotulo, capturador.consultas, tamanhos, args)
+            if resposta.status_code >= 400:
+                falhas.append(f"rota respondeu {resposta.status_code}")
+            base = orcamento.get(rotulo)
+            if base is not None and resultado["custo_total"] > base * (1 + args.tolerancia):
+                falhas.append(f"custo {resultado['custo_total']:.0f} > orçamento {base:.0f} "
+                              f"(+{args.tolerancia:.0%})")
+
+            resultado["falhas"] = falhas
+            resultados[rotulo] = resultado
+            total_falhas += len(falhas)
+
+            marca = '❌' if falhas else '✅'
+            print(f"{marca} {rotulo:<70} {len(resultado['consultas']):>3} consultas  custo {resultado['custo_total']:>14.0f}")
+            for falha in falhas:
+                print(f"      ↳ {falha}")
+    finally:
+        conn.close()
+
+    for rota in sem_caso:
+        print(f"ℹ️ Sem caso de verificação: {rota}")
+    if args.orcamento:
+        for rotulo in sorted(set(resultados) - set(orcamento)):
+            print(f"ℹ️ {rotulo} não está no orçamento ({args.orcamento})")
+
+    if args.gravar_orcamento:
+        with open(args.gravar_orcamento, 'w', encoding='utf-8') as f:
+            json.dump({
+                "gerado_em": datetime.now().isoformat(timespec='seconds'),
+                "banco": args.banco,
+                "linhas": tamanhos,
+                "custos": {rotulo: r["custo_total"] for rotulo, r in resultados.items()},
+            }, f, ensure_ascii=False, indent=2)
+        print(f"✅ Orçamento gravado em {args.gravar_orcamento}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({"banco": args.banco, "linhas": tamanhos, "casos": resultados}, f, ensure_ascii=False, indent=2)
+
+    if total_falhas:
+        print(f"❌ {total_falhas} problema(s) de plano.")
+        return 1
+    print("✅ Nenhuma regressão de plano.")
+    return 0
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Verifica os planos de execução das consultas das rotas.")
+    parser.add_argument('--banco', default='loja_bench_10m', help="banco grande e populado (ex.: camada 10m do benchmark)")
+    parser.add_argument('--usuario', default='postgres')
+    parser.add_argument('--senha', default='123')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--porta-db', default='5432')
+    parser.add_argument('--limite-linhas', type=int, default=100_000,
+                        help="tamanho a partir do qual Seq Scan em Pedido/Item_Pedido reprova")
+    parser.add_argument('--custo-maximo', type=float, default=None, help="custo máximo de qualquer consulta")
+    parser.add_argument('--orcamento', help="JSON com o custo de cada rota (gerado por --gravar-orcamento)")
+    parser.add_argument('--tolerancia', type=float, default=0.25, help="folga sobre o orçamento (0.25 = 25%%)")
+    parser.add_argument('--gravar-orcamento', help="grava os custos atuais como orçamento")
+    parser.add_argument('--estrito', action='store_true', help="ignora VARREDURA_PERMITIDA")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM ANALYZE em Pedido e Item_Pedido antes")
+    parser.add_argument('--saida', help="JSON com os planos resumidos de cada caso")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(verificar(ler_argumentos()))
@@ -89,6 +89,20 @@ export async function buscarRecomendacoes(idProduto) {
     }
 }
 
+export async function buscarRecomendacoesLote(idsProdutos, k = 3) {
+    try {
+        const res = await fetch(`${API_URL}/recomendacoes/batch`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ ids: idsProdutos, k })
+        });
+        return await res.json();
+    } catch (e) {
+        console.error(e);
+        return { por_produto: {}, combinado: [] };
+    }
+}
+
 export async function criarCliente(dadosCliente) {
     try {
         const response = await fetch(`${API_URL}/clientes`, {
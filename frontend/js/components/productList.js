@@ -116,7 +116,7 @@ export function renderProductList(container, produtos, onAddToCart) {
                         <div style="border:1px solid #eee; padding:10px; border-radius:6px; margin-bottom:5px; display:flex; justify-content:space-between; align-items:center;">
                             <div>
                                 <strong style="font-size:0.9rem; display:block;">${rec.nome}</strong>
-                                <small class="tag ${rec.tipo ? rec.tipo.toLowerCase() : ''}" style="font-size:0.7rem; padding:2px 5px;">${rec.tipo}</small>
+                                <small class="tag ${(rec.tipo || rec.categoria || '').toLowerCase()}" style="font-size:0.7rem; padding:2px 5px;">${rec.tipo || rec.categoria || ''}</small>
                             </div>
                             <span style="color:#0066cc; font-weight:bold;">${formatCurrency(rec.preco)}</span>
                         </div>
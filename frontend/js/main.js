@@ -1,4 +1,4 @@
-import { buscarProdutos, buscarClientes, enviarPedido, buscarDescontos, buscarClientesFidelidade, buscarClientesPromocionais, buscarClientesPrimeiraCompra, buscarClientesInativos, buscarClientesHighTicket} from './api.js';
+import { buscarProdutos, buscarClientes, enviarPedido, buscarDescontos, buscarClientesFidelidade, buscarClientesPromocionais, buscarClientesPrimeiraCompra, buscarClientesInativos, buscarClientesHighTicket, buscarRecomendacoesLote} from './api.js';
 import { state, cache } from './state.js';
 import { formatCurrency } from './utils.js';
 
@@ -225,8 +225,29 @@ function renderCarrinho(container) {
             
             <button id="btn-checkout" class="btn-primary" style="width:100%; margin-top:20px; padding:15px; font-size:1.1rem;">Finalizar Compra</button>
         </div>
+
+        <div id="cart-sugestoes"></div>
     `;
 
+    // Sugestões para o carrinho inteiro (uma única requisição)
+    const idsCarrinho = [...new Set(state.cart.map(p => p.id))];
+    buscarRecomendacoesLote(idsCarrinho, 3).then(({ combinado }) => {
+        const box = container.querySelector('#cart-sugestoes');
+        if (!box || !combinado || combinado.length === 0) return;
+
+        box.innerHTML = `
+            <div style="background:#f9f9f9; padding:15px; border-radius:8px; margin-top:20px;">
+                <h4 style="margin-bottom:10px; color:#333;">Quem comprou estes itens, levou também:</h4>
+                ${combinado.map(rec => `
+                    <div style="border:1px solid #eee; background:white; padding:10px; border-radius:6px; margin-bottom:5px; display:flex; justify-content:space-between;">
+                        <strong style="font-size:0.9rem;">${rec.nome}</strong>
+                        <span style="color:#0066cc; font-weight:bold;">${formatCurrency(rec.preco)}</span>
+                    </div>
+                `).join('')}
+            </div>
+        `;
+    });
+
     // 4. Eventos
     
     // Botão Adicionar Cupom
@@ -4,19 +4,82 @@
 Created on Wed Nov 19 13:18:01 2025
 
 @author: pablo
+
+Cria o banco e popula todas as tabelas.
+
+    python Criador_e_Populador.py                                   # escala pequena, padrões abaixo
+    python Criador_e_Populador.py --escala media --semente 42 --workers 8
+    python Criador_e_Populador.py --clientes 5000 --pedidos 200000 --distribuicao realista
+    python Criador_e_Populador.py --etapas coocorrencia fidelidade  # só recalcula essas etapas
+
+Use --help para ver todas as opções.
 """
+import argparse
 
+import carga_adiada as ca
 import criacao_banco as cb
 import funcoes_populacao as fp
+import geracao_vetorizada as gv
+from carga_em_massa import MODOS_CARGA
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Cria e popula o banco da loja de eletrônicos.")
+
+    conexao = parser.add_argument_group("conexão")
+    conexao.add_argument("--usuario", default="postgres")
+    conexao.add_argument("--senha", default="123")
+    conexao.add_argument("--host", default="localhost")
+    conexao.add_argument("--porta", default="5432")
+    conexao.add_argument("--banco", default="loja_vendas")
+
+    escala = parser.add_argument_group("escala")
+    escala.add_argument("--escala", choices=fp.ESCALAS, default="pequena",
+                        help="qtd. de clientes e pedidos pré-definida (%(default)s)")
+    escala.add_argument("--clientes", type=int, help="sobrescreve a qtd. de clientes da escala")
+    escala.add_argument("--pedidos", type=int, help="sobrescreve a qtd. de pedidos da escala")
+    escala.add_argument("--distribuicao", choices=gv.PERFIS_DISTRIBUICAO, default="uniforme")
+
+    execucao = parser.add_argument_group("execução")
+    execucao.add_argument("--semente", type=int, default=None, help="fixe para gerar sempre o mesmo banco")
+    execucao.add_argument("--workers", type=int, default=4,
+                          help="processos para pedidos, itens, vendas, pagamentos e descontos")
+    execucao.add_argument("--etapas-paralelas", type=int, default=4,
+                          help="etapas independentes rodando ao mesmo tempo")
+    execucao.add_argument("--etapas", nargs="+", choices=fp.DEPENDENCIAS, metavar="ETAPA",
+                          help=f"roda só estas etapas ({', '.join(fp.DEPENDENCIAS)})")
+    execucao.add_argument("--tamanho-shard", type=int, default=50_000, help="ids de pedido por shard")
+    execucao.add_argument("--nova", action="store_true", help="não retoma a última execução interrompida")
+    execucao.add_argument("--limite-memoria-mb", type=int, default=None)
+
+    carga = parser.add_argument_group("carga")
+    carga.add_argument("--modo-carga", choices=MODOS_CARGA, default="copy")
+    carga.add_argument("--tamanho-lote", type=int, default=10_000, help="linhas acumuladas antes de cada escrita")
+    carga.add_argument("--otimizar-carga", choices=ca.MODOS_OTIMIZACAO, default=None,
+                       help="adia FKs/índices (e WAL, com unlogged) até o fim da carga")
+
+    return parser.parse_args()
 
-usuario = 'postgres'
-senha = '123'
-host = 'localhost'
-porta = '5432'
-banco = 'loja_vendas'
 
-qtd_clientes = 200 # altere para quantos quiser
-qtd_pedidos = 1000 # altere para quantos quiser
+# O guard é necessário: os processos do pool reimportam este arquivo
+if __name__ == "__main__":
+    args = ler_argumentos()
+    qtd_clientes, qtd_pedidos = fp.ESCALAS[args.escala]
 
-engine = cb.main(usuario, senha, host, porta, banco)
-fp.main(engine, qtd_clientes, qtd_pedidos)
+    engine = cb.main(args.usuario, args.senha, args.host, args.porta, args.banco)
+    fp.main(
+        engine,
+        qtd_clientes=args.clientes if args.clientes is not None else qtd_clientes,
+        qtd_pedidos=args.pedidos if args.pedidos is not None else qtd_pedidos,
+        modo_carga=args.modo_carga,
+        tamanho_lote=args.tamanho_lote,
+        workers=args.workers,
+        semente=args.semente,
+        tamanho_shard=args.tamanho_shard,
+        limite_memoria_mb=args.limite_memoria_mb,
+        retomar=not args.nova,
+        distribuicao=args.distribuicao,
+        otimizar_carga=args.otimizar_carga,
+        etapas=args.etapas,
+        etapas_paralelas=args.etapas_paralelas,
+    )
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agendador das etapas da população respeitando as dependências entre elas.
+
+Cada etapa declara de quais outras depende:
+
+    etapas = [
+        ("produto", [], popular_produto, engine),
+        ("dispositivo", ["produto"], popular_dispositivo, engine),
+        ("cliente", [], popular_cliente, engine, 200),
+        ...
+    ]
+
+Assim que todas as dependências de uma etapa terminam, ela é iniciada numa
+thread. Etapas independentes (ex.: dispositivo, hardware, periferico e
+cliente) rodam ao mesmo tempo, cada uma com a própria conexão do pool da
+engine. Dependências fora da lista (etapas não selecionadas) são
+consideradas já satisfeitas.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def validar(etapas):
+    """Confere nomes repetidos e ciclos. Retorna {nome: dependências dentro da lista}."""
+    nomes = [e[0] for e in etapas]
+    repetidos = {n for n in nomes if nomes.count(n) > 1}
+    if repetidos:
+        raise ValueError(f"Etapas repetidas: {', '.join(sorted(repetidos))}")
+
+    dependencias = {nome: [d for d in deps if d in nomes] for nome, deps, *_ in etapas}
+
+    # Ordenação topológica só para detectar ciclos
+    restantes = dict(dependencias)
+    while restantes:
+        prontas = [n for n, deps in restantes.items() if not any(d in restantes for d in deps)]
+        if not prontas:
+            raise ValueError(f"Dependências circulares entre: {', '.join(sorted(restantes))}")
+        for n in prontas:
+            del restantes[n]
+
+    return dependencias
+
+
+def executar_dag(etapas, executar, paralelas=1):
+    """
+    Roda as etapas respeitando as dependências, com até `paralelas` ao mesmo tempo.
+    `executar(nome, funcao, *args)` é chamada para cada etapa (é onde entram a
+    medição e o controle de progresso). Com paralelas=1 a ordem é a da lista.
+    Se uma etapa falhar, nenhuma outra é iniciada; as que já estão rodando
+    terminam e o erro é relançado.
+    """
+    dependencias = validar(etapas)
+    por_nome = {e[0]: e for e in etapas}
+    concluidas = set()
+    pendentes = [e[0] for e in etapas]
+    rodando = {}
+    erro = None
+
+    with ThreadPoolExecutor(max_workers=max(1, int(paralelas))) as pool:
+        while pendentes or rodando:
+            if erro is None:
+                prontas = [n for n in pendentes if all(d in concluidas for d in dependencias[n])]
+                for nome in prontas[:max(1, int(paralelas)) - len(rodando)]:
+                    pendentes.remove(nome)
+                    _, _, funcao, *args = por_nome[nome]
+                    rodando[pool.submit(executar, nome, funcao, *args)] = nome
+            elif not rodando:
+                break
+
+            feitos, _ = wait(rodando, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                nome = rodando.pop(futuro)
+                try:
+                    futuro.result()
+                    concluidas.add(nome)
+                except Exception as e:
+                    print(f"❌ Etapa {nome} falhou: {e}")
+                    erro = erro or e
+
+    if erro is not None:
+        raise erro
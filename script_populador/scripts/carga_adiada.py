@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modo de carga otimizada para a população inicial (opcional).
+
+Antes da carga, as chaves estrangeiras e os índices secundários das tabelas
+da loja são removidos e, no modo "unlogged", as tabelas deixam de gravar WAL.
+Depois da carga, `finalizar()` desfaz tudo em fases:
+
+    1. logged      → ALTER TABLE ... SET LOGGED
+    2. indices     → recria os índices secundários (CREATE INDEX normal, sem CONCURRENTLY)
+    3. chaves      → ADD CONSTRAINT ... NOT VALID e VALIDATE CONSTRAINT (transações separadas)
+    4. analyze     → ANALYZE das tabelas carregadas
+
+O que foi removido/alterado fica registrado em Objeto_Adiado (migração 4),
+então uma população interrompida no meio pode ser retomada e finalizada
+depois, mesmo por outro processo. As chaves primárias são mantidas: as
+etapas dependem delas (NOT EXISTS, ON CONFLICT).
+
+Atenção: tabelas UNLOGGED são esvaziadas pelo PostgreSQL se o SERVIDOR cair
+antes do SET LOGGED. Interromper só o script não perde nada.
+"""
+from sqlalchemy import text
+
+import execucao_paralela as ep
+
+MODOS_OTIMIZACAO = ("adiar", "unlogged")
+
+# Tabelas da loja afetadas (as de controle — migrações e progresso — ficam como estão)
+TABELAS_CARGA = [
+    "Cliente", "Produto", "Dispositivo", "Hardware", "Periferico", "Pedido", "Venda",
+    "Pagamento", "Desconto_Aplicado", "Item_Pedido", "Fidelidade_Cliente", "Coocorrencia_Produto",
+]
+
+
+####################################################################################################################
+###                                                 PREPARAR                                                     ###
+####################################################################################################################
+def _registrar(conn, tipo, tabela, nome, definicao=None):
+    conn.execute(text("""
+        INSERT INTO Objeto_Adiado (tipo, tabela, nome, definicao)
+        VALUES (:tipo, :tabela, :nome, :definicao)
+        ON CONFLICT (tipo, tabela, nome) DO NOTHING;
+    """), {"tipo": tipo, "tabela": tabela, "nome": nome, "definicao": definicao})
+
+
+def preparar(engine, modo):
+    """
+    Remove FKs e índices secundários das TABELAS_CARGA (e, no modo "unlogged",
+    marca as tabelas como UNLOGGED). Pode ser chamada de novo ao retomar:
+    o que já foi removido não aparece mais no catálogo.
+    As definições vêm do catálogo e vão por exec_driver_sql (podem ter "::").
+    """
+    if modo not in MODOS_OTIMIZACAO:
+        raise ValueError(f"Modo de otimização inválido: {modo} (use {', '.join(MODOS_OTIMIZACAO)})")
+
+    tabelas = [t.lower() for t in TABELAS_CARGA]
+    sql_chaves = """
+        SELECT c.conname, t.relname, pg_get_constraintdef(c.oid)
+        FROM pg_constraint c
+        JOIN pg_class t ON t.oid = c.conrelid
+        WHERE c.contype = 'f' AND t.relname = ANY(:tabelas) AND t.relnamespace = 'public'::regnamespace;
+    """
+    # Índices que não sustentam uma constraint (PK/UNIQUE continuam)
+    sql_indices = """
+        SELECT i.relname, t.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        WHERE t.relname = ANY(:tabelas) AND t.relnamespace = 'public'::regnamespace
+        AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid);
+    """
+    sql_logged = """
+        SELECT relname
+        FROM pg_class
+        WHERE relname = ANY(:tabelas) AND relnamespace = 'public'::regnamespace AND relpersistence = 'p';
+    """
+
+    with engine.begin() as conn:
+        chaves = conn.execute(text(sql_chaves), {"tabelas": tabelas}).fetchall()
+        indices = conn.execute(text(sql_indices), {"tabelas": tabelas}).fetchall()
+
+        for nome, tabela, definicao in chaves:
+            _registrar(conn, "chave", tabela, nome, definicao)
+            conn.exec_driver_sql(f'ALTER TABLE {tabela} DROP CONSTRAINT "{nome}";')
+
+        for nome, tabela, definicao in indices:
+            _registrar(conn, "indice", tabela, nome, definicao)
+            conn.exec_driver_sql(f'DROP INDEX "{nome}";')
+
+        # Sem as FKs, a ordem do SET UNLOGGED não importa
+        logged = []
+        if modo == "unlogged":
+            logged = [t for (t,) in conn.execute(text(sql_logged), {"tabelas": tabelas})]
+            for tabela in logged:
+                _registrar(conn, "logged", tabela, tabela)
+                conn.exec_driver_sql(f"ALTER TABLE {tabela} SET UNLOGGED;")
+
+    print(f"🔧 Carga otimizada ({modo}): {len(chaves)} FKs e {len(indices)} índices adiados, "
+          f"{len(logged)} tabelas UNLOGGED.")
+
+
+def ha_pendencias(engine):
+    """True se há objetos adiados por uma carga otimizada ainda não finalizada."""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT EXISTS (SELECT 1 FROM Objeto_Adiado);")).scalar()
+
+
+####################################################################################################################
+###                                                 FINALIZAR                                                    ###
+####################################################################################################################
+def _pendentes(conn, tipo):
+    return conn.execute(
+        text("SELECT tabela, nome, definicao FROM Objeto_Adiado WHERE tipo = :tipo ORDER BY adiado_em, nome;"),
+        {"tipo": tipo}
+    ).fetchall()
+
+
+def _concluir(conn, tipo, tabela, nome):
+    conn.execute(
+        text("DELETE FROM Objeto_Adiado WHERE tipo = :tipo AND tabela = :tabela AND nome = :nome;"),
+        {"tipo": tipo, "tabela": tabela, "nome": nome}
+    )
+
+
+def restaurar_logged(engine):
+    # Cada tabela numa transação: se cair no meio, as já restauradas saem da lista
+    with engine.connect() as conn:
+        pendentes = _pendentes(conn, "logged")
+    for tabela, nome, _ in pendentes:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {tabela} SET LOGGED;")
+            _concluir(conn, "logged", tabela, nome)
+    print(f"   ↳ {len(pendentes)} tabelas voltaram a ser LOGGED")
+
+
+def recriar_indices(engine):
+    with engine.connect() as conn:
+        pendentes = _pendentes(conn, "indice")
+    for tabela, nome, definicao in pendentes:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(definicao)
+            _concluir(conn, "indice", tabela, nome)
+    print(f"   ↳ {len(pendentes)} índices recriados")
+
+
+def validar_chaves(engine):
+    """
+    Recria cada FK como NOT VALID numa transação (instantâneo, sem varrer a
+    tabela; o SHARE ROW EXCLUSIVE nas duas tabelas sai no commit) e a valida
+    em outra: o VALIDATE varre a tabela só com SHARE UPDATE EXCLUSIVE e aponta
+    a constraint violada, se houver. Na mesma transação o lock do ADD ficaria
+    preso durante toda a varredura.
+    Se cair entre as duas, a FK fica criada e ainda pendente: a retomada pula
+    o ADD e só valida.
+    """
+    sql_existe = """
+        SELECT 1 FROM pg_constraint WHERE conrelid = CAST(:tabela AS regclass) AND conname = :nome;
+    """
+    with engine.connect() as conn:
+        pendentes = _pendentes(conn, "chave")
+    for tabela, nome, definicao in pendentes:
+        with engine.begin() as conn:
+            if conn.execute(text(sql_existe), {"tabela": tabela, "nome": nome}).fetchone() is None:
+                conn.exec_driver_sql(f'ALTER TABLE {tabela} ADD CONSTRAINT "{nome}" {definicao} NOT VALID;')
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'ALTER TABLE {tabela} VALIDATE CONSTRAINT "{nome}";')
+            _concluir(conn, "chave", tabela, nome)
+    print(f"   ↳ {len(pendentes)} FKs recriadas e validadas")
+
+
+def analisar(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql(f"ANALYZE {', '.join(TABELAS_CARGA)};")
+
+
+def finalizar(engine):
+    """Desfaz o que `preparar()` fez, em fases medidas (aparecem no resumo da população)."""
+    fases = [
+        ("carga: logged", restaurar_logged),
+        ("carga: indices", recriar_indices),
+        ("carga: chaves", validar_chaves),
+        ("carga: analyze", analisar),
+    ]
+    for nome, funcao in fases:
+        ep.medir_etapa(nome, funcao, engine)
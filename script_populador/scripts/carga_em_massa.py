@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escrita em lote para a população do banco.
+
+Em vez de um INSERT por linha, as linhas geradas ficam num buffer e são
+gravadas de `tamanho_lote` em `tamanho_lote`, usando um dos modos:
+
+- "copy"    → COPY ... FROM STDIN (CSV), o mais rápido
+- "valores" → INSERT ... VALUES (...), (...), ... (várias linhas por comando)
+- "linha"   → um INSERT por linha (comportamento original, útil para comparar)
+"""
+import csv
+import io
+import time
+
+from psycopg2.extras import execute_values
+
+MODOS_CARGA = ("copy", "valores", "linha")
+
+
+####################################################################################################################
+###                                              ESCRITOR EM LOTE                                                ###
+####################################################################################################################
+class EscritorEmLote:
+    """
+    Uso:
+        with EscritorEmLote(conn, "Cliente", ["nome_cliente", "cidade"], modo="copy") as esc:
+            esc.adicionar(("Ana", "Recife"))
+
+    `conn` é uma Connection do SQLAlchemy; a escrita acontece na mesma transação
+    dela, então quem chama continua responsável pelo conn.commit().
+    """
+
+    def __init__(self, conn, tabela, colunas, modo="copy", tamanho_lote=10_000, silencioso=False):
+        if modo not in MODOS_CARGA:
+            raise ValueError(f"Modo de carga inválido: {modo} (use {', '.join(MODOS_CARGA)})")
+
+        self.conn = conn
+        self.tabela = tabela
+        self.colunas = list(colunas)
+        self.modo = modo
+        self.tamanho_lote = max(1, int(tamanho_lote))
+        self.silencioso = silencioso
+
+        self.buffer = []
+        self.total = 0
+        self.inicio = time.perf_counter()
+
+        # O cursor cru do psycopg2 só participa da transação se o SQLAlchemy já tiver aberto uma
+        if not conn.in_transaction():
+            conn.begin()
+        self._cursor = conn.connection.cursor()
+
+        lista_colunas = ", ".join(self.colunas)
+        self._sql_copy = f"COPY {tabela} ({lista_colunas}) FROM STDIN WITH (FORMAT csv)"
+        self._sql_valores = f"INSERT INTO {tabela} ({lista_colunas}) VALUES %s"
+        self._sql_linha = f"INSERT INTO {tabela} ({lista_colunas}) VALUES ({', '.join(['%s'] * len(self.colunas))})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_erro, erro, tb):
+        if tipo_erro is None:
+            self.finalizar()
+        else:
+            self._cursor.close()
+        return False
+
+    # -----------------------------------------------------------------
+    def adicionar(self, linha):
+        self.buffer.append(linha)
+        if len(self.buffer) >= self.tamanho_lote:
+            self.descarregar()
+
+    def adicionar_varias(self, linhas):
+        for linha in linhas:
+            self.adicionar(linha)
+
+    def descarregar(self):
+        if not self.buffer:
+            return
+
+        if self.modo == "copy":
+            arquivo = io.StringIO()
+            csv.writer(arquivo, lineterminator="\n").writerows(self.buffer)
+            arquivo.seek(0)
+            self._cursor.copy_expert(self._sql_copy, arquivo)
+
+        elif self.modo == "valores":
+            execute_values(self._cursor, self._sql_valores, self.buffer, page_size=len(self.buffer))
+
+        else:
+            self._cursor.executemany(self._sql_linha, self.buffer)
+
+        self.total += len(self.buffer)
+        self.buffer = []
+
+    def finalizar(self):
+        """Grava o que sobrou no buffer, fecha o cursor e retorna o total de linhas escritas."""
+        self.descarregar()
+        self._cursor.close()
+
+        if not self.silencioso:
+            print(f"   ↳ {self.tabela}: {formatar_taxa(self.total, time.perf_counter() - self.inicio)} (modo {self.modo})")
+
+        return self.total
+
+
+def formatar_taxa(linhas, segundos):
+    taxa = linhas / segundos if segundos > 0 else float("inf")
+    return f"{linhas:,} linhas em {segundos:.2f}s ({taxa:,.0f} linhas/s)".replace(",", ".")
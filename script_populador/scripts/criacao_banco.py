@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine, text
 import psycopg2
 from psycopg2 import sql
+import re
+import time
 
 sql_script = """
 -- Tipos ENUM
@@ -135,6 +137,159 @@ CREATE TABLE IF NOT EXISTS Fidelidade_Cliente (
 );
 """
 
+####################################################################################################################
+###                                                MIGRAÇÕES                                                     ###
+####################################################################################################################
+# Cada migração é (versão, descrição, lista de comandos SQL) e é aplicada uma única vez, em ordem.
+# Comandos com CONCURRENTLY rodam fora de transação, sem bloquear escrita nas tabelas,
+# então as migrações podem ser aplicadas em um banco já populado e em uso.
+MIGRACOES = [
+    (1, "Índices de apoio para joins e agrupamentos dos relatórios", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pedido_cliente_data ON Pedido (id_cliente, data_pedido);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pedido_data ON Pedido (data_pedido);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_item_pedido_produto ON Item_Pedido (id_produto, id_pedido);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pagamento_forma ON Pagamento (forma_pagamento);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cliente_estado ON Cliente (estado);",
+    ]),
+    (2, "Modelo de coocorrência de produtos (recomendações)", [
+        """
+        CREATE TABLE IF NOT EXISTS Coocorrencia_Produto (
+            id_produto INT NOT NULL,
+            id_relacionado INT NOT NULL,
+            qtd_pedidos INT NOT NULL,
+            PRIMARY KEY (id_produto, id_relacionado),
+            FOREIGN KEY (id_produto) REFERENCES Produto(id_produto) ON DELETE CASCADE,
+            FOREIGN KEY (id_relacionado) REFERENCES Produto(id_produto) ON DELETE CASCADE
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_coocorrencia_ranking ON Coocorrencia_Produto (id_produto, qtd_pedidos DESC);",
+        # Carga inicial a partir do histórico já existente
+        """
+        INSERT INTO Coocorrencia_Produto (id_produto, id_relacionado, qtd_pedidos)
+        SELECT a.id_produto, b.id_produto, COUNT(*)
+        FROM Item_Pedido a
+        JOIN Item_Pedido b ON a.id_pedido = b.id_pedido AND a.id_produto <> b.id_produto
+        GROUP BY a.id_produto, b.id_produto
+        ON CONFLICT (id_produto, id_relacionado) DO NOTHING;
+        """,
+    ]),
+    (3, "Controle de progresso da população (retomada de execuções)", [
+        """
+        CREATE TABLE IF NOT EXISTS Execucao_Populacao (
+            id_execucao SERIAL PRIMARY KEY,
+            semente BIGINT NOT NULL,
+            parametros JSONB NOT NULL,
+            iniciada_em TIMESTAMP NOT NULL DEFAULT NOW(),
+            concluida_em TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Progresso_Populacao (
+            id_execucao INT NOT NULL,
+            etapa VARCHAR(50) NOT NULL,
+            indice INT NOT NULL,
+            inicio BIGINT NOT NULL,
+            fim BIGINT NOT NULL,
+            linhas BIGINT,
+            duracao_ms INT,
+            concluido_em TIMESTAMP,
+            PRIMARY KEY (id_execucao, etapa, indice),
+            FOREIGN KEY (id_execucao) REFERENCES Execucao_Populacao(id_execucao) ON DELETE CASCADE
+        );
+        """,
+    ]),
+    (4, "Registro de FKs/índices adiados pela carga otimizada", [
+        """
+        CREATE TABLE IF NOT EXISTS Objeto_Adiado (
+            tipo VARCHAR(10) NOT NULL CHECK (tipo IN ('chave', 'indice', 'logged')),
+            tabela VARCHAR(100) NOT NULL,
+            nome VARCHAR(100) NOT NULL,
+            definicao TEXT,
+            adiado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (tipo, tabela, nome)
+        );
+        """,
+    ]),
+]
+
+sql_tabela_migracoes = """
+CREATE TABLE IF NOT EXISTS Schema_Migracao (
+    versao INT PRIMARY KEY,
+    descricao VARCHAR(255) NOT NULL,
+    aplicada_em TIMESTAMP NOT NULL DEFAULT NOW(),
+    duracao_ms INT NOT NULL
+);
+"""
+
+# Chave arbitrária do advisory lock: impede dois processos migrando ao mesmo tempo
+LOCK_MIGRACOES = 7264001
+
+regex_indice_concorrente = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+def _remover_indice_invalido(conn, comando):
+    """
+    Um CREATE INDEX CONCURRENTLY interrompido deixa o índice marcado como inválido,
+    e o IF NOT EXISTS pularia ele. Nesse caso o índice é removido para ser recriado.
+    """
+    achado = regex_indice_concorrente.search(comando)
+    if not achado:
+        return
+
+    invalido = conn.execute(text("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :nome AND NOT i.indisvalid;
+    """), {"nome": achado.group(1).lower()}).fetchone()
+
+    if invalido:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {achado.group(1)};"))
+        print(f"⚠️ Índice inválido {achado.group(1)} removido para ser recriado.")
+
+
+def aplicar_migracoes(engine, migracoes=MIGRACOES):
+    """
+    Aplica, em ordem, as migrações cuja versão ainda não está em Schema_Migracao.
+    Pode ser executada quantas vezes quiser: as já aplicadas são ignoradas.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(sql_tabela_migracoes))
+        conn.execute(text("SELECT pg_advisory_lock(:chave);"), {"chave": LOCK_MIGRACOES})
+
+        try:
+            aplicadas = {v for (v,) in conn.execute(text("SELECT versao FROM Schema_Migracao;"))}
+            pendentes = [m for m in sorted(migracoes, key=lambda m: m[0]) if m[0] not in aplicadas]
+
+            if not pendentes:
+                print("ℹ️ Nenhuma migração pendente.")
+                return
+
+            for versao, descricao, comandos in pendentes:
+                inicio = time.perf_counter()
+
+                if any("CONCURRENTLY" in c.upper() for c in comandos):
+                    # Precisa rodar fora de transação (a conexão já está em autocommit)
+                    for comando in comandos:
+                        _remover_indice_invalido(conn, comando)
+                        conn.execute(text(comando))
+                else:
+                    # Migração comum: tudo ou nada, numa única transação
+                    with engine.begin() as conn_tx:
+                        for comando in comandos:
+                            conn_tx.execute(text(comando))
+
+                duracao_ms = int((time.perf_counter() - inicio) * 1000)
+                conn.execute(
+                    text("INSERT INTO Schema_Migracao (versao, descricao, duracao_ms) VALUES (:versao, :descricao, :duracao);"),
+                    {"versao": versao, "descricao": descricao, "duracao": duracao_ms}
+                )
+                print(f"🔧 Migração {versao} aplicada ({descricao}) em {duracao_ms} ms.")
+
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:chave);"), {"chave": LOCK_MIGRACOES})
+
+
 ####################################################################################################################
 ###                                         FUNÇÃO PARA CRIAR O BANCO                                           ###
 ####################################################################################################################
@@ -208,4 +363,21 @@ def main(usuario, senha, host, porta, banco, sql_script=sql_script):
     # 3. Criar tabelas
     criar_tabelas(engine, sql_script)
 
+    # 4. Aplicar migrações pendentes (índices etc.)
+    aplicar_migracoes(engine)
+
     return engine  # retorna engine para o resto do sistema
+
+
+####################################################################################################################
+###                                     APENAS MIGRAR UM BANCO JÁ EXISTENTE                                      ###
+####################################################################################################################
+if __name__ == "__main__":
+    # Ex.: python criacao_banco.py postgres 123 localhost 5432 loja_vendas
+    import sys
+
+    if len(sys.argv) != 6:
+        print("Uso: python criacao_banco.py <usuario> <senha> <host> <porta> <banco>")
+        sys.exit(1)
+
+    aplicar_migracoes(criar_engine(*sys.argv[1:]))
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Execução das etapas de população em shards (faixas de id_pedido) num pool de processos.
+
+Cada shard é uma faixa [inicio, fim) de ids processada por uma tarefa:
+
+    tarefa(conn, rng, inicio, fim, contexto) -> linhas gravadas
+
+- Cada processo do pool tem a sua própria engine/conexão com o banco.
+- Cada shard faz o próprio commit (um shard = uma transação).
+- O gerador NumPy de cada shard vem de uma semente mestre + (etapa, índice do
+  shard). O resultado depende só da semente e do tamanho dos shards, não da
+  quantidade de workers nem da ordem em que os shards terminam.
+
+Dentro do shard as tarefas seguem sempre o mesmo fluxo (lê um bloco → gera →
+grava em lote), então a memória usada depende de CARGA["tamanho_lote"] e não do
+tamanho do banco. `medir_etapa()` mostra o pico de memória (RSS) de cada etapa
+(com etapas em paralelo, o do processo principal sai uma vez no resumo).
+
+Com EXECUCAO["id_execucao"] definido, o plano de shards de cada etapa e os
+shards concluídos ficam gravados no banco (ver progresso.py) e uma nova
+chamada pula o que já foi feito.
+"""
+import multiprocessing
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextvars import ContextVar
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+import progresso
+from carga_em_massa import formatar_taxa
+
+try:
+    import resource  # não existe no Windows
+except ImportError:
+    resource = None
+
+# Configuração da execução. main() de funcoes_populacao.py pode alterar:
+#   workers: processos do pool (1 = roda tudo no processo atual, sem pool)
+#   semente: semente mestre (None = sorteada e exibida no início, para poder repetir)
+#   tamanho_shard: quantos ids de pedido cada shard cobre
+#   limite_memoria_mb: teto esperado de RSS por processo; etapas acima dele geram um aviso
+#   id_execucao: execução registrada em Execucao_Populacao (None = sem controle de progresso)
+#   etapas_paralelas: etapas rodando ao mesmo tempo (ver iniciar_medicao)
+EXECUCAO = {
+    "workers": 1, "semente": None, "tamanho_shard": 50_000, "limite_memoria_mb": None, "id_execucao": None,
+    "etapas_paralelas": 1,
+}
+
+# Acumulador de memória da etapa em andamento nesta thread, criado por medir_etapa()
+# e entregue a executar_em_shards(). Cada etapa tem o seu, mesmo rodando em paralelo.
+_memoria_da_etapa = ContextVar("memoria_da_etapa", default=None)
+
+# Uma entrada por etapa executada/pulada, para o resumo final
+RESUMO = []
+
+
+####################################################################################################################
+###                                                 MEMÓRIA                                                      ###
+####################################################################################################################
+def zerar_pico_memoria():
+    """Zera o pico de RSS do processo (só no Linux, via /proc/self/clear_refs)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def pico_memoria_mb():
+    """Pico de RSS do processo em MB (desde o último zerar_pico_memoria, quando suportado)."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _formatar_mb(valor):
+    return "n/d" if valor is None else f"{valor:,.0f} MB".replace(",", ".")
+
+
+def formatar_duracao(segundos):
+    segundos = int(round(segundos))
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    return f"{horas}h{minutos:02d}m{segundos:02d}s" if horas else f"{minutos}m{segundos:02d}s"
+
+
+def _verificar_limite(nome, pico):
+    limite = EXECUCAO["limite_memoria_mb"]
+    if limite and pico and pico > limite:
+        print(f"⚠️  {nome} passou do limite de memória ({_formatar_mb(limite)}): reduza tamanho_lote ou workers.")
+
+
+def iniciar_medicao(etapas_paralelas=1):
+    """
+    Começo de uma população: limpa o resumo e zera o pico do processo principal.
+    Com etapas_paralelas > 1 esse é o único ponto em que ele é zerado — o VmHWM
+    é do processo inteiro, e zerar por etapa apagaria o pico de outra que ainda
+    está rodando. O valor sai uma vez, no imprimir_resumo().
+    """
+    EXECUCAO["etapas_paralelas"] = max(1, int(etapas_paralelas))
+    RESUMO.clear()
+    zerar_pico_memoria()
+
+
+def medir_etapa(nome, funcao, *args):
+    """
+    Executa uma etapa e exibe a duração e o pico de memória dos workers da etapa
+    e, com etapas sequenciais, do processo principal. Retorna a duração em segundos.
+    """
+    sequencial = EXECUCAO["etapas_paralelas"] <= 1
+    if sequencial:
+        zerar_pico_memoria()
+    memoria = {"pico_workers_mb": 0.0}
+    token = _memoria_da_etapa.set(memoria)
+    inicio = time.perf_counter()
+    try:
+        funcao(*args)
+    finally:
+        _memoria_da_etapa.reset(token)
+
+    duracao = time.perf_counter() - inicio
+    pico = pico_memoria_mb() if sequencial else None
+    pico_workers = memoria["pico_workers_mb"]
+
+    if sequencial:
+        detalhe = f"pico de memória {_formatar_mb(pico)}"
+        if pico_workers:
+            detalhe += f" (maior worker: {_formatar_mb(pico_workers)})"
+    elif pico_workers:
+        detalhe = f"maior worker: {_formatar_mb(pico_workers)}"
+    else:
+        detalhe = "memória do processo principal no resumo (etapas em paralelo)"
+    print(f"⏱️  {nome}: {duracao:.2f}s | {detalhe}")
+
+    maior = max(pico or 0, pico_workers) or None
+    _verificar_limite(nome, maior)
+    RESUMO.append((nome, duracao, maior, "ok"))
+    return duracao
+
+
+def pular_etapa(nome):
+    print(f"⏭️  {nome}: já concluída nesta execução.")
+    RESUMO.append((nome, 0.0, None, "já concluída"))
+
+
+def imprimir_resumo(tempo_total=None):
+    """
+    Tabela final com a duração e o pico de memória de cada etapa.
+    tempo_total: tempo de relógio da população inteira. Com etapas em paralelo
+    a soma das durações passa do tempo real, então o total e os percentuais
+    (fração do tempo real em que a etapa esteve rodando) vêm daqui. Sem ele,
+    as etapas são consideradas sequenciais e o total é a soma.
+    """
+    if not RESUMO:
+        return
+
+    largura = max(len(nome) for nome, *_ in RESUMO + [("soma das etapas",), ("processo principal",)])
+    soma = sum(duracao for _, duracao, _, _ in RESUMO)
+    total = soma if tempo_total is None else tempo_total
+
+    print("\n📋 Resumo da população")
+    for nome, duracao, pico, situacao in RESUMO:
+        percentual = duracao / total * 100 if total else 0
+        print(f"   {nome:<{largura}}  {formatar_duracao(duracao):>9}  {percentual:5.1f}%  "
+              f"{_formatar_mb(pico):>9}  {situacao}")
+    if tempo_total is not None and abs(soma - tempo_total) >= 1:
+        print(f"   {'soma das etapas':<{largura}}  {formatar_duracao(soma):>9}  (etapas em paralelo)")
+    print(f"   {'total':<{largura}}  {formatar_duracao(total):>9}")
+
+    if EXECUCAO["etapas_paralelas"] > 1:
+        # Desde iniciar_medicao(): as etapas acima só mostram o pico dos próprios workers
+        pico = pico_memoria_mb()
+        print(f"   {'processo principal':<{largura}}  {'':>9}  {'':>6}  {_formatar_mb(pico):>9}  pico na população inteira")
+        _verificar_limite("O processo principal", pico)
+
+
+####################################################################################################################
+###                                                 SEMENTES                                                     ###
+####################################################################################################################
+def definir_semente(semente=None):
+    """Fixa a semente mestre da execução (sorteia uma se não for informada) e a retorna."""
+    if semente is None:
+        semente = int(np.random.SeedSequence().entropy % 2**63)
+    EXECUCAO["semente"] = int(semente)
+    return EXECUCAO["semente"]
+
+
+def gerador_do_shard(semente, etapa, indice):
+    """
+    Gerador independente para o shard `indice` da `etapa`. Equivale ao filho
+    (etapa, indice) de SeedSequence(semente).spawn(...), sem precisar gerar os demais.
+    """
+    return np.random.default_rng(np.random.SeedSequence(semente, spawn_key=(zlib.crc32(etapa.encode()), indice)))
+
+
+####################################################################################################################
+###                                                  SHARDS                                                      ###
+####################################################################################################################
+def dividir_intervalos(inicio, fim, tamanho):
+    """Divide [inicio, fim) em faixas consecutivas de até `tamanho` ids."""
+    return [(i, min(i + tamanho, fim)) for i in range(inicio, fim, max(1, int(tamanho)))]
+
+
+# Estado de cada processo do pool (preenchido pelo initializer)
+_PROCESSO = {}
+
+
+def _iniciar_processo(url, carga, ajustar_carga, contexto):
+    _PROCESSO["engine"] = create_engine(url, poolclass=NullPool)
+    _PROCESSO["contexto"] = contexto
+    if ajustar_carga is not None:
+        ajustar_carga(carga)
+
+
+def _executar_shard(tarefa, etapa, indice, inicio, fim, semente, contexto, id_execucao, engine=None):
+    # No pool, o pico de memória é medido por shard dentro do próprio worker e o
+    # contexto vem do initializer (enviado uma vez por processo, não por shard)
+    no_pool = engine is None
+    if no_pool:
+        engine = _PROCESSO["engine"]
+        contexto = _PROCESSO["contexto"]
+        zerar_pico_memoria()
+
+    rng = gerador_do_shard(semente, etapa, indice)
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        linhas = tarefa(conn, rng, inicio, fim, contexto)
+        duracao = time.perf_counter() - t0
+        if id_execucao is not None:
+            progresso.marcar_shard(conn, id_execucao, etapa, indice, linhas, int(duracao * 1000))
+        conn.commit()
+    return indice, linhas, duracao, (pico_memoria_mb() if no_pool else None)
+
+
+def _planejar(engine, etapa, planejar):
+    """Retorna (pendentes, total de shards) — do plano gravado quando há controle de progresso."""
+    id_execucao = EXECUCAO["id_execucao"]
+    if id_execucao is not None:
+        return progresso.shards_pendentes(engine, id_execucao, etapa, planejar)
+
+    with engine.begin() as conn:
+        intervalos = planejar(conn)
+    return [(i, ini, fim) for i, (ini, fim) in enumerate(intervalos)], len(intervalos)
+
+
+class _Acompanhamento:
+    """Linhas gravadas, linhas/s e ETA da etapa, exibidos a cada shard concluído."""
+
+    def __init__(self, etapa, pendentes, total_shards):
+        self.etapa = etapa
+        self.total_shards = total_shards
+        self.ja_feitos = total_shards - len(pendentes)
+        self.ids_total = sum(fim - ini for _, ini, fim in pendentes)
+        self.ids_feitos = 0
+        self.feitos = 0
+        self.linhas = 0
+        self.inicio = time.perf_counter()
+
+    def shard_concluido(self, inicio, fim, linhas):
+        self.feitos += 1
+        self.linhas += linhas
+        self.ids_feitos += fim - inicio
+
+        decorrido = time.perf_counter() - self.inicio
+        taxa = self.linhas / decorrido if decorrido > 0 else 0
+        fracao = self.ids_feitos / self.ids_total if self.ids_total else 1
+        eta = decorrido / fracao - decorrido if fracao > 0 else 0
+
+        print(f"   ↳ {self.etapa}: shard {self.ja_feitos + self.feitos}/{self.total_shards} | "
+              f"{self.linhas:,} linhas | {taxa:,.0f} linhas/s | ETA {formatar_duracao(eta)}".replace(",", "."))
+
+
+def executar_em_shards(engine, etapa, tarefa, planejar, contexto=None, carga=None, ajustar_carga=None,
+                       memoria=None):
+    """
+    Roda `tarefa` em cada shard pendente da etapa e retorna o total de linhas gravadas.
+
+    `planejar(conn)` devolve as faixas [(inicio, fim), ...] e só é chamada na
+    primeira vez que a etapa roda numa execução (depois o plano gravado é reutilizado).
+    `tarefa` precisa ser uma função de nível de módulo (é enviada aos processos).
+    `contexto` vai para cada processo uma única vez, então pode carregar arrays grandes
+    (ids de clientes, pesos das distribuições).
+    `carga`/`ajustar_carga` replicam nos processos filhos a configuração de
+    escrita do processo pai (ver CARGA em funcoes_populacao.py).
+    `memoria` recebe em "pico_workers_mb" o maior pico dos workers; por padrão é
+    o acumulador da etapa que medir_etapa() está medindo nesta thread.
+    """
+    if memoria is None:
+        memoria = _memoria_da_etapa.get()
+    workers = EXECUCAO["workers"]
+    semente = EXECUCAO["semente"]
+    if semente is None:
+        semente = definir_semente()
+    id_execucao = EXECUCAO["id_execucao"]
+
+    pendentes, total_shards = _planejar(engine, etapa, planejar)
+    if total_shards and len(pendentes) < total_shards:
+        print(f"   ↳ {etapa}: retomando — {total_shards - len(pendentes)}/{total_shards} shards já concluídos")
+
+    acompanhamento = _Acompanhamento(etapa, pendentes, total_shards)
+
+    if workers <= 1 or len(pendentes) <= 1:
+        for indice, ini, fim in pendentes:
+            _, linhas, _, _ = _executar_shard(
+                tarefa, etapa, indice, ini, fim, semente, contexto, id_execucao, engine=engine
+            )
+            acompanhamento.shard_concluido(ini, fim, linhas)
+    else:
+        # "spawn": as etapas podem estar rodando em threads (agendador.py), e fork
+        # com threads ativas pode herdar locks travados
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(pendentes)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_processo,
+            initargs=(engine.url, carga, ajustar_carga, contexto),
+        ) as pool:
+            futuros = {
+                pool.submit(_executar_shard, tarefa, etapa, indice, ini, fim, semente, None, id_execucao):
+                    (ini, fim)
+                for indice, ini, fim in pendentes
+            }
+            for futuro in as_completed(futuros):
+                _, linhas, _, pico = futuro.result()
+                if memoria is not None:
+                    memoria["pico_workers_mb"] = max(memoria["pico_workers_mb"], pico or 0)
+                acompanhamento.shard_concluido(*futuros[futuro], linhas)
+
+    print(f"   ↳ {etapa}: {formatar_taxa(acompanhamento.linhas, time.perf_counter() - acompanhamento.inicio)} "
+          f"({len(pendentes)} shards, {max(1, min(workers, len(pendentes)))} workers)")
+    return acompanhamento.linhas
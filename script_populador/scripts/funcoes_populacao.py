@@ -8,8 +8,17 @@ Created on Wed Nov 19 11:08:13 2025
 from sqlalchemy import text  # para executar SQL com parâmetros
 from faker import Faker       # para gerar dados (ex.: clientes) — usar depois
 import random                 # útil para gerar quantidades/valores aleatórios
-from datetime import datetime, timedelta   # útil para datas aleatórias futuramente
-from decimal import Decimal
+import time                   # tempo de relógio da população (resumo)
+from datetime import date, datetime, timedelta   # útil para datas aleatórias futuramente
+
+import numpy as np            # geração vetorizada dos pedidos e derivados
+
+import agendador
+import carga_adiada as ca
+import execucao_paralela as ep
+import geracao_vetorizada as gv
+import progresso as pg
+from carga_em_massa import EscritorEmLote, MODOS_CARGA
 
 
 ####################################################################################################################
@@ -18,16 +27,78 @@ from decimal import Decimal
 
 fake = Faker("pt_BR")  # inicializa faker apenas uma vez
 
-####################################################################################################################
-###                                                   PRODUTO                                                    ###
-####################################################################################################################
-def popular_produto(engine):
+# Como as linhas são gravadas (ver carga_em_massa.py). main() pode alterar:
+#   modo: "copy" (COPY FROM STDIN), "valores" (INSERT multi-linha) ou "linha" (um INSERT por linha)
+#   tamanho_lote: quantas linhas ficam em memória antes de cada escrita
+CARGA = {"modo": "copy", "tamanho_lote": 10_000}
+
+# Perfil de distribuição dos pedidos (ver PERFIS_DISTRIBUICAO em geracao_vetorizada.py).
+# main() pode trocar por "realista" ou por um dict com ajustes.
+DISTRIBUICAO = gv.montar_perfil("uniforme")
+
+
+def escritor(conn, tabela, colunas, silencioso=False):
+    """Cria o escritor em lote da tabela com a configuração atual de CARGA."""
+    return EscritorEmLote(
+        conn, tabela, colunas, modo=CARGA["modo"], tamanho_lote=CARGA["tamanho_lote"], silencioso=silencioso
+    )
+
+
+def ajustar_carga(carga):
+    """Aplica uma configuração de CARGA (usado para replicá-la nos processos do pool)."""
+    CARGA.update(carga)
+
+
+def ler_em_blocos(conn, sql, params=None):
     """
-    Popula a tabela Produto com uma lista fixa de produtos predefinidos.
+    Executa a consulta com cursor do lado do servidor e devolve as linhas em
+    blocos de CARGA["tamanho_lote"], sem trazer o resultado inteiro para a memória.
     """
+    resultado = conn.execute(text(sql), params or {}, execution_options={"stream_results": True})
+    return resultado.partitions(CARGA["tamanho_lote"])
+
 
-    produtos = [
-        
+def distribuicao_pedidos(perfil, semente, n_clientes, hoje):
+    """Pesos dos clientes (na ordem de id_cliente) e das datas; os mesmos para a mesma semente."""
+    return {
+        "pesos_clientes": gv.pesos_cauda_longa(
+            ep.gerador_do_shard(semente, "distribuicao_clientes", 0), n_clientes, perfil["cauda_clientes"]
+        ),
+        "pesos_dias": gv.pesos_sazonais(hoje) if perfil["sazonal"] else None,
+    }
+
+
+def distribuicao_itens(perfil, semente, n_produtos):
+    """Popularidade dos produtos (na ordem de id_produto) e tamanhos de cesta do perfil."""
+    return {
+        "pesos_produtos": gv.pesos_zipf(
+            ep.gerador_do_shard(semente, "distribuicao_produtos", 0), n_produtos, perfil["zipf_produtos"]
+        ),
+        "cesta": perfil["cesta"],
+    }
+
+
+def em_shards(engine, etapa, tarefa, planejar, contexto=None):
+    """Roda a tarefa em cada faixa de ids com a configuração de EXECUCAO (ver execucao_paralela.py)."""
+    return ep.executar_em_shards(
+        engine, etapa, tarefa, planejar, contexto, carga=dict(CARGA), ajustar_carga=ajustar_carga
+    )
+
+
+def intervalos_de_pedidos(conn):
+    """Faixas de id_pedido (do menor ao maior pedido existente) com EXECUCAO["tamanho_shard"] ids cada."""
+    menor, maior = conn.execute(text("SELECT MIN(id_pedido), MAX(id_pedido) FROM Pedido;")).fetchone()
+
+    if menor is None:
+        return []
+    return ep.dividir_intervalos(menor, maior + 1, ep.EXECUCAO["tamanho_shard"])
+
+####################################################################################################################
+###                                                   PRODUTO                                                    ###
+####################################################################################################################
+# Catálogo fixo: (nome, categoria, preço, custo, estoque atual, estoque mínimo).
+# Num banco vazio o id_produto de cada um é a posição na lista (1, 2, 3...).
+PRODUTOS = [
     # DISPOSITIVOS
     ("Samsung Galaxy A54", "Dispositivo", 1999.90, 1200.00, 50, 10),
     ("iPhone 13", "Dispositivo", 3999.90, 2500.00, 30, 5),
@@ -57,12 +128,15 @@ def popular_produto(engine):
     ("Controle Xbox Series", "Periférico", 349.90, 200.00, 50, 8)
 ]
 
-    sql_insert = """
-        INSERT INTO Produto
-        (nome_produto, categoria, preco_unitario, custo_unitario, estoque_atual, estoque_minimo)
-        VALUES (:nome, :categoria, :preco, :custo, :estoque, :estoque_min);
+
+def popular_produto(engine):
+    """
+    Popula a tabela Produto com uma lista fixa de produtos predefinidos.
     """
 
+    produtos = PRODUTOS
+    colunas = ["nome_produto", "categoria", "preco_unitario", "custo_unitario", "estoque_atual", "estoque_minimo"]
+
     # Verifica se já existe algo na tabela
     sql_check = "SELECT COUNT(*) FROM Produto;"
 
@@ -74,19 +148,9 @@ def popular_produto(engine):
             print("Produto já populado. Nenhuma inserção feita.")
             return
 
-        # Insere os produtos fixos
-        for p in produtos:
-            conn.execute(
-                text(sql_insert),
-                {
-                    "nome": p[0],
-                    "categoria": p[1],
-                    "preco": p[2],
-                    "custo": p[3],
-                    "estoque": p[4],
-                    "estoque_min": p[5]
-                }
-            )
+        # Insere os produtos fixos (as tuplas já estão na ordem das colunas)
+        with escritor(conn, "Produto", colunas) as esc:
+            esc.adicionar_varias(produtos)
 
         conn.commit()
 
@@ -95,6 +159,33 @@ def popular_produto(engine):
 ####################################################################################################################
 ###                                                 DISPOSITIVO                                                  ###
 ####################################################################################################################
+def linha_dispositivo(id_produto, nome):
+    """Monta a linha de Dispositivo (id_produto, cor, dimensao, tipo) a partir do nome do produto."""
+    cores = ["Preto", "Branco", "Cinza", "Azul"]
+    tipos_dispositivo = {
+        "Galaxy": "Smartphone",
+        "iPhone": "Smartphone",
+        "Xiaomi": "Smartphone",
+        "Motorola": "Smartphone",
+        "iPad": "Tablet",
+        "Tablet": "Tablet"
+    }
+
+    # Determina automaticamente o tipo
+    tipo = "Smartphone"  # padrão
+    for chave, valor in tipos_dispositivo.items():
+        if chave.lower() in nome.lower():
+            tipo = valor
+            break
+
+    return (
+        id_produto,
+        cores[id_produto % len(cores)],
+        "14x7 cm" if tipo == "Smartphone" else "25x17 cm",
+        tipo
+    )
+
+
 def popular_dispositivo(engine):
     """
     Popula a tabela Dispositivo para todos os produtos cuja categoria é 'Dispositivo'.
@@ -110,43 +201,14 @@ def popular_dispositivo(engine):
     """
 
     # Inserção
-    sql_insert = """
-        INSERT INTO Dispositivo (id_produto, cor, dimensao, tipo)
-        VALUES (:id_produto, :cor, :dimensao, :tipo);
-    """
-
-    cores = ["Preto", "Branco", "Cinza", "Azul"]
-    tipos_dispositivo = {
-        "Galaxy": "Smartphone",
-        "iPhone": "Smartphone",
-        "Xiaomi": "Smartphone",
-        "Motorola": "Smartphone",
-        "iPad": "Tablet",
-        "Tablet": "Tablet"
-    }
+    colunas = ["id_produto", "cor", "dimensao", "tipo"]
 
     with engine.connect() as conn:
         produtos = conn.execute(text(sql_busca)).fetchall()
 
-        for prod in produtos:
-            id_produto, nome = prod
-
-            # Determina automaticamente o tipo
-            tipo = "Smartphone"  # padrão
-            for chave, valor in tipos_dispositivo.items():
-                if chave.lower() in nome.lower():
-                    tipo = valor
-                    break
-
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_produto": id_produto,
-                    "cor": cores[id_produto % len(cores)],
-                    "dimensao": "14x7 cm" if tipo == "Smartphone" else "25x17 cm",
-                    "tipo": tipo
-                }
-            )
+        with escritor(conn, "Dispositivo", colunas) as esc:
+            for id_produto, nome in produtos:
+                esc.adicionar(linha_dispositivo(id_produto, nome))
 
         conn.commit()
 
@@ -155,6 +217,49 @@ def popular_dispositivo(engine):
 ####################################################################################################################
 ###                                                   HARDWARE                                                   ###
 ####################################################################################################################
+def linha_hardware(id_produto, nome):
+    """Monta a linha de Hardware (id_produto, consumo_energia, especificacao_tecnica, tipo)."""
+
+    # Tipos detectados automaticamente com base no nome
+    tipos_hardware = {
+        "Processador": "CPU",
+        "Placa-mãe": "Placa-mãe",
+        "Memória": "RAM",
+        "SSD": "SSD",
+        "Fonte": "Fonte",
+        "Vídeo": "GPU",
+        "Cooler": "Cooler",
+        "Gabinete": "Gabinete"
+    }
+
+    # Consumo de energia aproximado por tipo (Watts)
+    consumo_map = {
+        "CPU": 65,
+        "Placa-mãe": 50,
+        "RAM": 10,
+        "SSD": 5,
+        "Fonte": 650,
+        "GPU": 170,
+        "Cooler": 7,
+        "Gabinete": 0,
+        "Outro": 15
+    }
+
+    # Descobre tipo automaticamente
+    tipo = "Outro"
+    for chave, t in tipos_hardware.items():
+        if chave.lower() in nome.lower():
+            tipo = t
+            break
+
+    consumo = consumo_map.get(tipo, 20)
+
+    # Especificação padrão (simples)
+    especificacao = f"Componente do tipo {tipo}"
+
+    return (id_produto, consumo, especificacao, tipo)
+
+
 def popular_hardware(engine):
     """
     Popula a tabela Hardware para todos os produtos cuja categoria é 'Hardware'.
@@ -171,63 +276,14 @@ def popular_hardware(engine):
     """
 
     # Inserção no Hardware
-    sql_insert = """
-        INSERT INTO Hardware (id_produto, consumo_energia, especificacao_tecnica, tipo)
-        VALUES (:id_produto, :consumo, :especificacao, :tipo);
-    """
-
-    # Tipos detectados automaticamente com base no nome
-    tipos_hardware = {
-        "Processador": "CPU",
-        "Placa-mãe": "Placa-mãe",
-        "Memória": "RAM",
-        "SSD": "SSD",
-        "Fonte": "Fonte",
-        "Vídeo": "GPU",
-        "Cooler": "Cooler",
-        "Gabinete": "Gabinete"
-    }
+    colunas = ["id_produto", "consumo_energia", "especificacao_tecnica", "tipo"]
 
     with engine.connect() as conn:
         produtos = conn.execute(text(sql_busca)).fetchall()
 
-        for prod in produtos:
-            id_produto, nome = prod
-
-            # Descobre tipo automaticamente
-            tipo = "Outro"
-            for chave, t in tipos_hardware.items():
-                if chave.lower() in nome.lower():
-                    tipo = t
-                    break
-
-            # Consumo de energia aproximado por tipo (Watts)
-            consumo_map = {
-                "CPU": 65,
-                "Placa-mãe": 50,
-                "RAM": 10,
-                "SSD": 5,
-                "Fonte": 650,
-                "GPU": 170,
-                "Cooler": 7,
-                "Gabinete": 0,
-                "Outro": 15
-            }
-
-            consumo = consumo_map.get(tipo, 20)
-
-            # Especificação padrão (simples)
-            especificacao = f"Componente do tipo {tipo}"
-
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_produto": id_produto,
-                    "consumo": consumo,
-                    "especificacao": especificacao,
-                    "tipo": tipo
-                }
-            )
+        with escritor(conn, "Hardware", colunas) as esc:
+            for id_produto, nome in produtos:
+                esc.adicionar(linha_hardware(id_produto, nome))
 
         conn.commit()
 
@@ -236,6 +292,34 @@ def popular_hardware(engine):
 ####################################################################################################################
 ###                                                  PERIFERICO                                                  ###
 ####################################################################################################################
+def linha_periferico(id_produto, nome):
+    """Monta a linha de Periferico (id_produto, cor, conexao, tipo) a partir do nome do produto."""
+    cores = ["Preto", "Branco", "Cinza", "Vermelho"]
+    conexoes = ["USB", "Bluetooth", "Sem Fio", "P2"]
+
+    # Detectar tipo baseado no nome do produto
+    tipos_periferico = {
+        "Mouse": "Mouse",
+        "Teclado": "Teclado",
+        "Headset": "Headset",
+        "Webcam": "Webcam",
+        "Controle": "Controle",
+    }
+
+    tipo_detectado = "Outro"
+    for palavra, tipo in tipos_periferico.items():
+        if palavra.lower() in nome.lower():
+            tipo_detectado = tipo
+            break
+
+    return (
+        id_produto,
+        cores[id_produto % len(cores)],
+        conexoes[id_produto % len(conexoes)],
+        tipo_detectado
+    )
+
+
 def popular_periferico(engine):
     """
     Popula a tabela Periferico para todos os produtos cuja categoria é 'Periférico'.
@@ -252,45 +336,14 @@ def popular_periferico(engine):
     """
 
     # Inserção
-    sql_insert = """
-        INSERT INTO Periferico (id_produto, cor, conexao, tipo)
-        VALUES (:id_produto, :cor, :conexao, :tipo);
-    """
-
-    cores = ["Preto", "Branco", "Cinza", "Vermelho"]
-    conexoes = ["USB", "Bluetooth", "Sem Fio", "P2"]
-
-    # Detectar tipo baseado no nome do produto
-    tipos_periferico = {
-        "Mouse": "Mouse",
-        "Teclado": "Teclado",
-        "Headset": "Headset",
-        "Webcam": "Webcam",
-        "Controle": "Controle",
-    }
+    colunas = ["id_produto", "cor", "conexao", "tipo"]
 
     with engine.connect() as conn:
         produtos = conn.execute(text(sql_busca)).fetchall()
 
-        for prod in produtos:
-            id_produto, nome = prod
-
-            # Detecta tipo
-            tipo_detectado = "Outro"
-            for palavra, tipo in tipos_periferico.items():
-                if palavra.lower() in nome.lower():
-                    tipo_detectado = tipo
-                    break
-
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_produto": id_produto,
-                    "cor": cores[id_produto % len(cores)],
-                    "conexao": conexoes[id_produto % len(conexoes)],
-                    "tipo": tipo_detectado
-                }
-            )
+        with escritor(conn, "Periferico", colunas) as esc:
+            for id_produto, nome in produtos:
+                esc.adicionar(linha_periferico(id_produto, nome))
 
         conn.commit()
 
@@ -299,6 +352,23 @@ def popular_periferico(engine):
 ####################################################################################################################
 ###                                                   CLIENTE                                                    ###
 ####################################################################################################################
+def gerar_clientes(qtd_clientes):
+    """Gera as linhas de Cliente (nome_cliente, cidade, estado, pais, data_cadastro) com o Faker."""
+    for _ in range(qtd_clientes):
+        # Data aleatória de cadastro
+        hoje = datetime.now()
+        dias_atras = random.randint(0, 1500)  # ~4 anos
+        data_cadastro = hoje - timedelta(days=dias_atras)
+
+        yield (
+            fake.name(),
+            fake.city(),
+            fake.estado_sigla(),
+            "Brasil",
+            data_cadastro.date()
+        )
+
+
 def popular_cliente(engine, qtd_clientes):
     """
     Popula a tabela Cliente com a quantidade especificada de clientes.
@@ -310,10 +380,7 @@ def popular_cliente(engine, qtd_clientes):
     sql_check = "SELECT COUNT(*) FROM Cliente;"
 
     # Inserção
-    sql_insert = """
-        INSERT INTO Cliente (nome_cliente, cidade, estado, pais, data_cadastro)
-        VALUES (:nome, :cidade, :estado, :pais, :data);
-    """
+    colunas = ["nome_cliente", "cidade", "estado", "pais", "data_cadastro"]
 
     with engine.connect() as conn:
         qtd_atual = conn.execute(text(sql_check)).scalar()
@@ -322,22 +389,8 @@ def popular_cliente(engine, qtd_clientes):
             print(f"Cliente já populado ({qtd_atual} linhas). Nenhuma inserção realizada.")
             return
 
-        for _ in range(qtd_clientes):
-            # Data aleatória de cadastro
-            hoje = datetime.now()
-            dias_atras = random.randint(0, 1500)  # ~4 anos
-            data_cadastro = hoje - timedelta(days=dias_atras)
-
-            conn.execute(
-                text(sql_insert),
-                {
-                    "nome": fake.name(),
-                    "cidade": fake.city(),
-                    "estado": fake.estado_sigla(),
-                    "pais": "Brasil",
-                    "data": data_cadastro.date()
-                }
-            )
+        with escritor(conn, "Cliente", colunas) as esc:
+            esc.adicionar_varias(gerar_clientes(qtd_clientes))
 
         conn.commit()
 
@@ -346,216 +399,198 @@ def popular_cliente(engine, qtd_clientes):
 ####################################################################################################################
 ###                                                     PEDIDO                                                   ###
 ####################################################################################################################
+def _pedidos_do_intervalo(conn, rng, inicio, fim, contexto):
+    """Gera e grava os pedidos de id inicio..fim-1 (ids já reservados na sequência)."""
+    colunas = [
+        "id_pedido", "data_pedido", "prazo_estimado", "status_pedido", "prioridade_pedido",
+        "modo_envio", "id_cliente", "pontos_fidelidade_gerados"
+    ]
+
+    with escritor(conn, "Pedido", colunas, silencioso=True) as esc:
+        for ini in range(inicio, fim, CARGA["tamanho_lote"]):
+            ids = np.arange(ini, min(ini + CARGA["tamanho_lote"], fim), dtype=np.int64)
+            pedidos = gv.gerar_pedidos(
+                rng, len(ids), contexto["clientes"], contexto["hoje"],
+                contexto["pesos_clientes"], contexto["pesos_dias"]
+            )
+            pedidos["id_pedido"] = ids
+            pedidos["pontos_fidelidade_gerados"] = 0
+            esc.adicionar_varias(gv.linhas(pedidos, colunas))
+
+    return esc.total
+
+
 def popular_pedido(engine, qtd_pedidos):
     """
     Popula a tabela Pedido com dados realistas.
-    - Datas dentro do último ano
+    - Datas dentro do último ano (com sazonalidade no perfil "realista")
+    - Clientes escolhidos conforme DISTRIBUICAO["cauda_clientes"]
     - Status coerente com prazos
     - Prioridade afeta prazo estimado
     - Cancelados têm prazo igual à data do pedido
     - Pontos de fidelidade deixam 0 (serão calculados na etapa de Venda)
+    Os ids dos novos pedidos são reservados de uma vez na sequência e divididos
+    em shards (faixas de ids) gerados em paralelo.
     """
 
-    # Probabilidades dos status
-    status_lista = ["concluido", "enviando", "pendente", "iniciado", "cancelado"]
-    status_prob = [0.50, 0.15, 0.10, 0.15, 0.10]
-
-    # Prioridade
-    prioridade_lista = ["baixa", "media", "alta"]
-    prioridade_prob = [0.20, 0.60, 0.20]
-
-    # Modo envio
-    modo_envio_lista = ["entrega", "retirada"]
-    modo_envio_prob = [0.80, 0.20]
-
     # Buscar clientes existentes
-    sql_clientes = "SELECT id_cliente FROM Cliente;"
-    sql_insert = """
-        INSERT INTO Pedido (
-            data_pedido, prazo_estimado, status_pedido, prioridade_pedido, 
-            modo_envio, id_cliente, pontos_fidelidade_gerados
-        )
-        VALUES (
-            :data_pedido, :prazo_estimado, :status, :prioridade, 
-            :modo_envio, :id_cliente, 0
-        );
-    """
-
-    with engine.connect() as conn:
-        clientes = [c[0] for c in conn.execute(text(sql_clientes)).fetchall()]
-
-        if len(clientes) == 0:
-            print("❌ Não há clientes cadastrados. Não é possível gerar pedidos.")
-            return
-
-        for _ in range(qtd_pedidos):
-            
-            # DATA DO PEDIDO
-            hoje = datetime.now()
-            dias_atras = random.randint(0, 365)
-            data_pedido = hoje - timedelta(days=dias_atras)
-
-            # STATUS
-            status = random.choices(status_lista, status_prob)[0]
-
-            # PRIORIDADE
-            prioridade = random.choices(prioridade_lista, prioridade_prob)[0]
-
-            # MODO ENVIO
-            modo_envio = random.choices(modo_envio_lista, modo_envio_prob)[0]
-
-            # PRAZO ESTIMADO
-            if status == "cancelado":
-                # Cancelado → prazo = data do pedido
-                prazo_estimado = data_pedido
-
-            elif status == "concluido":
-                # Concluído → prazo deve estar NO PASSADO
-                dias = random.randint(5, 10)
-
-                # prioridade alta reduz o prazo
-                if prioridade == "alta":
-                    dias = max(2, dias - 2)
-
-                prazo_estimado = data_pedido + timedelta(days=dias)
-
-                # Garantir que esteja no passado
-                if prazo_estimado > hoje:
-                    prazo_estimado = hoje - timedelta(days=random.randint(1, 5))
+    sql_clientes = "SELECT id_cliente FROM Cliente ORDER BY id_cliente;"
 
-            elif status == "enviando":
-                dias = random.randint(1, 5)
+    # Reserva os ids [ultimo + 1, ultimo + qtd_pedidos] avançando a sequência do SERIAL
+    sql_ultimo = "SELECT COALESCE(MAX(id_pedido), 0) FROM Pedido;"
+    sql_reservar = "SELECT setval(pg_get_serial_sequence('pedido', 'id_pedido'), :ate);"
 
-                if prioridade == "alta":
-                    dias = max(1, dias - 1)
-
-                prazo_estimado = data_pedido + timedelta(days=dias)
+    with engine.connect() as conn:
+        clientes = np.array([c[0] for c in conn.execute(text(sql_clientes)).fetchall()])
 
-            else:
-                # pendente ou iniciado
-                dias = random.randint(3, 12)
+    if len(clientes) == 0:
+        print("❌ Não há clientes cadastrados. Não é possível gerar pedidos.")
+        return
 
-                if prioridade == "alta":
-                    dias = max(2, dias - 2)
+    if qtd_pedidos <= 0:
+        return
 
-                if prioridade == "baixa":
-                    dias = dias + 2  # aumenta o prazo
+    # Só roda uma vez por execução: ao retomar, os ids reservados vêm do plano gravado
+    def planejar(conn):
+        ultimo = conn.execute(text(sql_ultimo)).scalar()
+        conn.execute(text(sql_reservar), {"ate": ultimo + qtd_pedidos})
+        return ep.dividir_intervalos(ultimo + 1, ultimo + qtd_pedidos + 1, ep.EXECUCAO["tamanho_shard"])
 
-                prazo_estimado = data_pedido + timedelta(days=dias)
+    hoje = np.datetime64(date.today(), "D")
+    contexto = {
+        "clientes": clientes, "hoje": hoje,
+        **distribuicao_pedidos(DISTRIBUICAO, ep.EXECUCAO["semente"], len(clientes), hoje),
+    }
+    total = em_shards(engine, "pedido", _pedidos_do_intervalo, planejar, contexto)
 
-            # CLIENTE
-            id_cliente = random.choice(clientes)
+    print(f"Pedido populado: {total} pedidos inseridos.")
 
-            # INSERIR PEDIDO
-            conn.execute(
-                text(sql_insert),
-                {
-                    "data_pedido": data_pedido.date(),
-                    "prazo_estimado": prazo_estimado.date(),
-                    "status": status,
-                    "prioridade": prioridade,
-                    "modo_envio": modo_envio,
-                    "id_cliente": id_cliente
-                }
+####################################################################################################################
+###                                               ITEM DO PEDIDO                                                ###
+####################################################################################################################
+def _itens_do_intervalo(conn, rng, inicio, fim, contexto):
+    """Gera os itens dos pedidos sem item com id em [inicio, fim)."""
+    sql_pedidos = """
+        SELECT p.id_pedido
+        FROM Pedido p
+        WHERE p.id_pedido >= :inicio AND p.id_pedido < :fim
+        AND NOT EXISTS (SELECT 1 FROM Item_Pedido ip WHERE ip.id_pedido = p.id_pedido)
+        ORDER BY p.id_pedido;
+    """
+    colunas = ["id_pedido", "id_produto", "quantidade", "preco_unitario", "desconto_unitario", "valor_total_item"]
+    monetarias = ("preco_unitario", "desconto_unitario", "valor_total_item")
+
+    with escritor(conn, "Item_Pedido", colunas, silencioso=True) as esc:
+        for bloco in ler_em_blocos(conn, sql_pedidos, {"inicio": inicio, "fim": fim}):
+            pedidos = np.array([p[0] for p in bloco], dtype=np.int64)
+            itens = gv.gerar_itens(
+                rng, pedidos, contexto["ids_produto"], contexto["precos"], contexto["pesos_produtos"], contexto["cesta"]
             )
+            esc.adicionar_varias(gv.linhas(itens, colunas, monetarias))
 
-        conn.commit()
+    return esc.total
 
-    print(f"Pedido populado: {qtd_pedidos} pedidos inseridos.")
 
-####################################################################################################################
-###                                               ITEM DO PEDIDO                                                ###
-####################################################################################################################
 def popular_item_pedido(engine):
     """
     Popula a tabela Item_Pedido para todos os pedidos existentes.
     - Cada pedido terá pelo menos 1 item
-    - Nº de itens por pedido segue probabilidades realistas
-    - Produtos escolhidos aleatoriamente (sem repetição)
+    - Nº de itens por pedido segue DISTRIBUICAO["cesta"]
+    - Produtos escolhidos sem repetição, com popularidade DISTRIBUICAO["zipf_produtos"]
     - Quantidade = 1
     - Desconto_unitário permitido (pequeno)
     """
 
-    # Probabilidades do número de itens por pedido
-    num_itens_lista = [1, 2, 3, 4]
-    num_itens_prob  = [0.60, 0.25, 0.10, 0.05]
+    sql_produtos = "SELECT id_produto, ROUND(preco_unitario * 100)::bigint FROM Produto ORDER BY id_produto;"
 
-    # Probabilidades de desconto
-    desconto_categorias = ["sem_desconto", "pequeno", "grande"]
-    desconto_prob = [0.80, 0.15, 0.05]
+    with engine.connect() as conn:
+        produtos = conn.execute(text(sql_produtos)).fetchall()
 
-    # Queries
-    sql_pedidos = """
-    SELECT id_pedido 
-    FROM Pedido
-    WHERE id_pedido NOT IN (SELECT id_pedido FROM Item_Pedido);
+    if len(produtos) == 0:
+        print("❌ Não há produtos cadastrados. Não é possível gerar itens de pedido.")
+        return
+
+    contexto = {
+        "ids_produto": np.array([p[0] for p in produtos], dtype=np.int64),
+        "precos": np.array([p[1] for p in produtos], dtype=np.int64),
+        **distribuicao_itens(DISTRIBUICAO, ep.EXECUCAO["semente"], len(produtos)),
+    }
+    total = em_shards(engine, "item_pedido", _itens_do_intervalo, intervalos_de_pedidos, contexto)
+
+    print(f"Item_Pedido populado: {total} itens inseridos.")
+
+####################################################################################################################
+###                                       COOCORRÊNCIA (RECOMENDAÇÕES)                                          ###
+####################################################################################################################
+def popular_coocorrencia(engine):
+    """
+    Reconstrói a tabela Coocorrencia_Produto a partir de todo o Item_Pedido.
+    Para cada par de produtos comprados no mesmo pedido guarda em quantos pedidos
+    isso aconteceu. O backend lê as recomendações direto daqui e o checkout
+    atualiza os pares incrementalmente.
     """
-    sql_produtos = "SELECT id_produto, preco_unitario FROM Produto;"
 
-    # Inserção
+    sql_limpar = "TRUNCATE Coocorrencia_Produto;"
+
     sql_insert = """
-        INSERT INTO Item_Pedido (
-            id_pedido, id_produto, quantidade, preco_unitario, desconto_unitario, valor_total_item
-        )
-        VALUES (
-            :id_pedido, :id_produto, :quantidade, :preco, :desconto, :valor_total
-        );
+        INSERT INTO Coocorrencia_Produto (id_produto, id_relacionado, qtd_pedidos)
+        SELECT a.id_produto, b.id_produto, COUNT(*)
+        FROM Item_Pedido a
+        JOIN Item_Pedido b ON a.id_pedido = b.id_pedido AND a.id_produto <> b.id_produto
+        GROUP BY a.id_produto, b.id_produto;
     """
 
     with engine.connect() as conn:
-        pedidos = [p[0] for p in conn.execute(text(sql_pedidos)).fetchall()]
-        produtos = conn.execute(text(sql_produtos)).fetchall()
-
-        if len(produtos) == 0:
-            print("❌ Não há produtos cadastrados. Não é possível gerar itens de pedido.")
-            return
-
-        for id_pedido in pedidos:
-            num_itens = random.choices(num_itens_lista, num_itens_prob)[0]
-            produtos_escolhidos = random.sample(produtos, k=num_itens)
-
-            for prod in produtos_escolhidos:
-                id_produto, preco_decimal = prod
-                preco = Decimal(preco_decimal)
-
-                # DESCONTO UNITÁRIO 
-                tipo_desc = random.choices(desconto_categorias, desconto_prob)[0]
-
-                if tipo_desc == "sem_desconto":
-                    desconto = Decimal("0")
-                elif tipo_desc == "pequeno":
-                    desconto = Decimal(str(round(random.uniform(5, 30), 2)))
-                else:  # grande
-                    desconto = Decimal(str(round(random.uniform(30, 80), 2)))
-
-                # Limite de desconto: nunca mais que 75% do preço
-                desconto_max = preco * Decimal("0.75")
-                desconto = min(desconto, desconto_max)
-
-                # Quantidade sempre 1
-                quantidade = 1
-
-                valor_total = (preco - desconto) * quantidade
-
-                conn.execute(
-                    text(sql_insert),
-                    {
-                        "id_pedido": id_pedido,
-                        "id_produto": id_produto,
-                        "quantidade": quantidade,
-                        "preco": preco,
-                        "desconto": desconto,
-                        "valor_total": valor_total
-                    }
-                )
-
+        conn.execute(text(sql_limpar))
+        qtd = conn.execute(text(sql_insert)).rowcount
         conn.commit()
 
-    print(f"Item_Pedido populado para {len(pedidos)} pedidos.")
+    print(f"Coocorrencia_Produto reconstruída: {qtd} pares de produtos.")
 
 ####################################################################################################################
 ###                                                     VENDA                                                    ###
 ####################################################################################################################
+def _vendas_do_intervalo(conn, rng, inicio, fim, contexto):
+    """Gera as vendas dos pedidos sem venda com id em [inicio, fim)."""
+
+    # Pedidos sem venda, com subtotal e desconto já somados (em centavos)
+    sql_pedidos = """
+        SELECT
+            p.id_pedido,
+            p.modo_envio,
+            ROUND(SUM(ip.valor_total_item) * 100)::bigint AS subtotal,
+            ROUND(SUM(ip.desconto_unitario * ip.quantidade) * 100)::bigint AS desconto
+        FROM Pedido p
+        JOIN Item_Pedido ip ON ip.id_pedido = p.id_pedido
+        WHERE p.id_pedido >= :inicio AND p.id_pedido < :fim
+        AND NOT EXISTS (SELECT 1 FROM Venda v WHERE v.id_pedido = p.id_pedido)
+        GROUP BY p.id_pedido, p.modo_envio
+        ORDER BY p.id_pedido;
+    """
+
+    # Inserção
+    colunas = [
+        "id_pedido", "custo_envio", "custo_imposto_loja", "custo_taxa_pagamento", "valor_frete",
+        "valor_imposto_cliente", "subtotal", "valor_desconto", "valor_total"
+    ]
+
+    with escritor(conn, "Venda", colunas, silencioso=True) as esc:
+        for bloco in ler_em_blocos(conn, sql_pedidos, {"inicio": inicio, "fim": fim}):
+            ids = np.array([p[0] for p in bloco], dtype=np.int64)
+            modos = np.array([p[1] for p in bloco])
+            subtotal = np.array([p[2] for p in bloco], dtype=np.int64)
+            desconto = np.array([p[3] for p in bloco], dtype=np.int64)
+
+            # Se não tem valor, não cria venda
+            com_valor = subtotal != 0
+            vendas = gv.gerar_vendas(
+                rng, ids[com_valor], modos[com_valor], subtotal[com_valor], desconto[com_valor]
+            )
+            esc.adicionar_varias(gv.linhas(vendas, colunas, monetarias=colunas[1:]))
+
+    return esc.total
+
+
 def popular_venda(engine):
     """
     Popula a tabela Venda com base nos itens dos pedidos.
@@ -565,120 +600,47 @@ def popular_venda(engine):
     - Calcula frete (se aplicável)
     - Calcula descontos totais
     - Define valor_total
+    Subtotal e desconto vêm de uma consulta agregada por shard, lida em blocos.
     """
 
-    # Buscar pedidos que ainda não têm venda
-    sql_pedidos = """
-        SELECT p.id_pedido, p.modo_envio
-        FROM Pedido p
-        WHERE p.id_pedido NOT IN (SELECT id_pedido FROM Venda);
-    """
-
-    # Buscar subtotal e desconto do pedido
-    sql_item = """
-        SELECT 
-            COALESCE(SUM(valor_total_item), 0) AS subtotal,
-            COALESCE(SUM(desconto_unitario * quantidade), 0) AS desconto
-        FROM Item_Pedido
-        WHERE id_pedido = :id_pedido;
-    """
+    total = em_shards(engine, "venda", _vendas_do_intervalo, intervalos_de_pedidos)
 
-    # Inserção
-    sql_insert = """
-        INSERT INTO Venda (
-            id_pedido,
-            custo_envio,
-            custo_imposto_loja,
-            custo_taxa_pagamento,
-            valor_frete,
-            valor_imposto_cliente,
-            subtotal,
-            valor_desconto,
-            valor_total
-        )
-        VALUES (
-            :id_pedido,
-            :custo_envio,
-            :custo_imposto_loja,
-            :custo_taxa_pagamento,
-            :valor_frete,
-            :valor_imposto_cliente,
-            :subtotal,
-            :valor_desconto,
-            :valor_total
-        );
-    """
+    if total == 0:
+        print("Venda já populada ou não há pedidos para processar.")
+        return
 
-    with engine.connect() as conn:
-        pedidos = conn.execute(text(sql_pedidos)).fetchall()
+    print(f"Venda populada para {total} pedidos.")
 
-        if len(pedidos) == 0:
-            print("Venda já populada ou não há pedidos para processar.")
-            return
+####################################################################################################################
+###                                                 PAGAMENTO                                                    ###
+####################################################################################################################
+def _pagamentos_do_intervalo(conn, rng, inicio, fim, contexto):
+    """Gera os pagamentos das vendas sem pagamento com id_pedido em [inicio, fim)."""
+    sql_vendas = """
+        SELECT v.id_pedido, ROUND(v.valor_total * 100)::bigint, p.data_pedido
+        FROM Venda v
+        JOIN Pedido p ON p.id_pedido = v.id_pedido
+        WHERE v.id_pedido >= :inicio AND v.id_pedido < :fim
+        AND NOT EXISTS (SELECT 1 FROM Pagamento pg WHERE pg.id_pedido = v.id_pedido)
+        ORDER BY v.id_pedido;
+    """
 
-        for id_pedido, modo_envio in pedidos:
-
-            # Buscar subtotal e desconto 
-            item_info = conn.execute(
-                text(sql_item),
-                {"id_pedido": id_pedido}
-            ).fetchone()
-
-            subtotal = Decimal(item_info[0])
-            valor_desconto = Decimal(item_info[1])
-
-            if subtotal == 0:
-                # Se não tem item, não cria venda
-                continue
-
-            # Custos da loja
-            # Custo de envio para a loja (não é cobrado ao cliente)
-            if modo_envio == "entrega":
-                custo_envio = Decimal(random.uniform(15, 40)).quantize(Decimal("0.01"))
-            else:
-                custo_envio = Decimal("0.00")
-
-            # imposto interno (3% a 8%)
-            custo_imposto_loja = (subtotal * Decimal(random.uniform(0.03, 0.08))).quantize(Decimal("0.01"))
-
-            # taxa de pagamento (1.5% a 3%)
-            custo_taxa_pagamento = (subtotal * Decimal(random.uniform(0.015, 0.03))).quantize(Decimal("0.01"))
-
-            # Valores cobrados do cliente 
-            if modo_envio == "entrega":
-                valor_frete = Decimal(random.uniform(20, 60)).quantize(Decimal("0.01"))
-            else:
-                valor_frete = Decimal("0.00")
-
-            # imposto cobrado ao cliente (5% a 15%)
-            valor_imposto_cliente = (subtotal * Decimal(random.uniform(0.05, 0.15))).quantize(Decimal("0.01"))
-
-            # Valor total final
-            valor_total = subtotal - valor_desconto + valor_frete + valor_imposto_cliente
-
-            # Inserção
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_pedido": id_pedido,
-                    "custo_envio": custo_envio,
-                    "custo_imposto_loja": custo_imposto_loja,
-                    "custo_taxa_pagamento": custo_taxa_pagamento,
-                    "valor_frete": valor_frete,
-                    "valor_imposto_cliente": valor_imposto_cliente,
-                    "subtotal": subtotal,
-                    "valor_desconto": valor_desconto,
-                    "valor_total": valor_total
-                }
+    # Inserção
+    colunas = ["id_pedido", "forma_pagamento", "parcelas", "data_pagamento", "valor_pago"]
+
+    with escritor(conn, "Pagamento", colunas, silencioso=True) as esc:
+        for bloco in ler_em_blocos(conn, sql_vendas, {"inicio": inicio, "fim": fim}):
+            pagamentos = gv.gerar_pagamentos(
+                rng,
+                np.array([v[0] for v in bloco], dtype=np.int64),
+                np.array([v[1] for v in bloco], dtype=np.int64),
+                np.array([v[2] for v in bloco], dtype="datetime64[D]"),
             )
+            esc.adicionar_varias(gv.linhas(pagamentos, colunas, monetarias=("valor_pago",)))
 
-        conn.commit()
+    return esc.total
 
-    print(f"Venda populada para {len(pedidos)} pedidos.")
 
-####################################################################################################################
-###                                                 PAGAMENTO                                                    ###
-####################################################################################################################
 def popular_pagamento(engine):
     """
     Popula a tabela Pagamento com uma lógica realista:
@@ -688,173 +650,67 @@ def popular_pagamento(engine):
     - Valor pago = valor_total da venda
     """
 
-    # Formas de pagamento
-    formas = ["pix", "cartao_credito", "cartao_debito", "boleto", "transferencia", "dinheiro"]
-    formas_prob = [0.30, 0.40, 0.10, 0.10, 0.05, 0.05]
-
-    # Buscar vendas sem pagamento
-    sql_vendas = """
-        SELECT v.id_pedido, v.valor_total, p.data_pedido
-        FROM Venda v
-        JOIN Pedido p ON p.id_pedido = v.id_pedido
-        WHERE v.id_pedido NOT IN (SELECT id_pedido FROM Pagamento);
-    """
-
-    # Inserção
-    sql_insert = """
-        INSERT INTO Pagamento (
-            id_pedido,
-            forma_pagamento,
-            parcelas,
-            data_pagamento,
-            valor_pago
-        )
-        VALUES (
-            :id_pedido,
-            :forma,
-            :parcelas,
-            :data_pagamento,
-            :valor_pago
-        );
-    """
-
-    with engine.connect() as conn:
-        vendas = conn.execute(text(sql_vendas)).fetchall()
+    total = em_shards(engine, "pagamento", _pagamentos_do_intervalo, intervalos_de_pedidos)
 
-        if len(vendas) == 0:
-            print("Pagamento já populado ou não há vendas.")
-            return
-
-        for id_pedido, valor_total, data_pedido in vendas:
-
-            forma = random.choices(formas, formas_prob)[0]
-
-            # PARCELAS
-            if forma == "cartao_credito":
-                escolha = random.random()
-
-                if escolha <= 0.40:
-                    parcelas = 1
-                elif escolha <= 0.70:
-                    parcelas = random.randint(2, 3)
-                elif escolha <= 0.90:
-                    parcelas = random.randint(4, 6)
-                else:
-                    parcelas = random.randint(7, 12)
-            else:
-                parcelas = 1
-
-            # DATA DO PAGAMENTO
-            dias = random.randint(0, 5)
-            data_pagamento = data_pedido + timedelta(days=dias)
-
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_pedido": id_pedido,
-                    "forma": forma,
-                    "parcelas": parcelas,
-                    "data_pagamento": data_pagamento,
-                    "valor_pago": Decimal(valor_total)
-                }
-            )
-
-        conn.commit()
+    if total == 0:
+        print("Pagamento já populado ou não há vendas.")
+        return
 
-    print(f"Pagamento populado para {len(vendas)} vendas.")
+    print(f"Pagamento populado para {total} vendas.")
     
 ####################################################################################################################
 ###                                             DESCONTO APLICADO                                               ###
 ####################################################################################################################
-def popular_desconto(engine):
-    """
-    Popula a tabela Desconto_Aplicado com base NOS DESCONTOS DOS ITENS.
-    - Apenas pedidos com desconto real entram
-    - Apenas 1 tipo de desconto por pedido (via probabilidade)
-    - Porcentagem = total_desconto / subtotal_original * 100
-    """
+def _descontos_do_intervalo(conn, rng, inicio, fim, contexto):
+    """Gera os descontos dos pedidos com id em [inicio, fim) que tiveram desconto nos itens."""
 
-    # Tipos de desconto (ENUM)
-    tipos = ["promocional", "cupom", "fidelidade", "parceria", "outros"]
-    tipos_prob = [0.60, 0.20, 0.10, 0.05, 0.05]
-
-    # Buscar pedidos que ainda NÃO têm registro em Desconto_Aplicado
+    # Pedidos com desconto que ainda NÃO têm registro em Desconto_Aplicado (valores em centavos)
     sql_pedidos = """
-        SELECT DISTINCT p.id_pedido
-        FROM Pedido p
-        JOIN Item_Pedido ip ON ip.id_pedido = p.id_pedido
-        WHERE p.id_pedido NOT IN (
-            SELECT id_pedido FROM Desconto_Aplicado
-        );
-    """
-
-    # Buscar subtotal original e total de desconto
-    sql_descontos = """
-        SELECT 
-            SUM(ip.quantidade * ip.preco_unitario) AS subtotal_original,
-            SUM(ip.quantidade * ip.desconto_unitario) AS desconto_total
+        SELECT
+            ip.id_pedido,
+            ROUND(SUM(ip.quantidade * ip.preco_unitario) * 100)::bigint AS subtotal_original,
+            ROUND(SUM(ip.quantidade * ip.desconto_unitario) * 100)::bigint AS desconto_total
         FROM Item_Pedido ip
-        WHERE ip.id_pedido = :id_pedido;
+        WHERE ip.id_pedido >= :inicio AND ip.id_pedido < :fim
+        AND NOT EXISTS (SELECT 1 FROM Desconto_Aplicado d WHERE d.id_pedido = ip.id_pedido)
+        GROUP BY ip.id_pedido
+        HAVING SUM(ip.quantidade * ip.desconto_unitario) > 0
+        ORDER BY ip.id_pedido;
     """
 
     # Inserção
-    sql_insert = """
-        INSERT INTO Desconto_Aplicado (
-            id_pedido, tipo, porcentagem, descricao
-        )
-        VALUES (
-            :id_pedido, :tipo, :porcentagem, :descricao
-        );
-    """
-
-    with engine.connect() as conn:
-        pedidos = conn.execute(text(sql_pedidos)).fetchall()
-
-        if len(pedidos) == 0:
-            print("Não há novos descontos a aplicar.")
-            return
-
-        for (id_pedido,) in pedidos:
-
-            # Buscar valores
-            info = conn.execute(
-                text(sql_descontos),
-                {"id_pedido": id_pedido}
-            ).fetchone()
-
-            subtotal_original = Decimal(info[0])
-            desconto_total   = Decimal(info[1])
-
-            # Se não houve desconto nos itens → pula
-            if desconto_total <= 0:
-                continue
-
-            # Porcentagem calculada
-            porcentagem = (desconto_total / subtotal_original) * Decimal(100)
-            porcentagem = porcentagem.quantize(Decimal("0.01"))
+    colunas = ["id_pedido", "tipo", "porcentagem", "descricao"]
+
+    with escritor(conn, "Desconto_Aplicado", colunas, silencioso=True) as esc:
+        for bloco in ler_em_blocos(conn, sql_pedidos, {"inicio": inicio, "fim": fim}):
+            descontos = gv.gerar_descontos(
+                rng,
+                np.array([p[0] for p in bloco], dtype=np.int64),
+                np.array([p[1] for p in bloco], dtype=np.int64),
+                np.array([p[2] for p in bloco], dtype=np.int64),
+            )
+            descontos["descricao"] = "Desconto calculado com base nos itens do pedido."
+            esc.adicionar_varias(gv.linhas(descontos, colunas, monetarias=("porcentagem",)))
 
-            # Limite máximo de 80%
-            if porcentagem > Decimal("80.00"):
-                porcentagem = Decimal("80.00")
+    return esc.total
 
-            # Escolher tipo de desconto
-            tipo = random.choices(tipos, tipos_prob)[0]
 
-            descricao = "Desconto calculado com base nos itens do pedido."
+def popular_desconto(engine):
+    """
+    Popula a tabela Desconto_Aplicado com base NOS DESCONTOS DOS ITENS.
+    - Apenas pedidos com desconto real entram
+    - Apenas 1 tipo de desconto por pedido (via probabilidade)
+    - Porcentagem = total_desconto / subtotal_original * 100
+    Os totais vêm de uma consulta agregada por shard, lida em blocos.
+    """
 
-            conn.execute(
-                text(sql_insert),
-                {
-                    "id_pedido": id_pedido,
-                    "tipo": tipo,
-                    "porcentagem": porcentagem,
-                    "descricao": descricao
-                }
-            )
+    total = em_shards(engine, "desconto", _descontos_do_intervalo, intervalos_de_pedidos)
 
-        conn.commit()
+    if total == 0:
+        print("Não há novos descontos a aplicar.")
+        return
 
-    print("Desconto_Aplicado populado com base nos descontos dos itens.")
+    print(f"Desconto_Aplicado populado: {total} pedidos com desconto.")
 
 ####################################################################################################################
 ###                                            FIDELIDADE DO CLIENTE                                             ###
@@ -868,103 +724,201 @@ def popular_fidelidade(engine):
       - Acima de 2000  → 3%
 
     Pontos são:
-      1) adicionados no Pedido (pontos_fidelidade_gerados)
-      2) acumulados na tabela Fidelidade_Cliente
-    """
+      1) gravados no Pedido (pontos_fidelidade_gerados) — um único UPDATE para todas as vendas
+      2) somados por cliente em Fidelidade_Cliente — um único upsert agregado
 
-    # Buscar todas as vendas com o cliente associado
-    sql_vendas = """
-        SELECT v.id_pedido, v.valor_total, p.id_cliente
-        FROM Venda v
-        JOIN Pedido p ON p.id_pedido = v.id_pedido;
+    O saldo do cliente é recalculado como a soma dos pontos dos seus pedidos
+    (e não somado ao que já existia), então rodar a etapa de novo não duplica pontos.
     """
 
-    # Atualizar pontos no Pedido
+    # Pontos de cada venda (truncados para inteiro), aplicados no Pedido.
+    # Só reescreve as linhas cujo valor muda.
     sql_update_pedido = """
-        UPDATE Pedido
-        SET pontos_fidelidade_gerados = :pontos
-        WHERE id_pedido = :id_pedido;
-    """
-
-    # Consultar se cliente já tem conta fidelidade
-    sql_check_cliente = """
-        SELECT pontos_acumulados
-        FROM Fidelidade_Cliente
-        WHERE id_cliente = :id_cliente;
-    """
-
-    # Inserir novo cliente no fidelidade
-    sql_insert_fid = """
+        UPDATE Pedido p
+        SET pontos_fidelidade_gerados = calc.pontos
+        FROM (
+            SELECT
+                id_pedido,
+                TRUNC(valor_total * CASE
+                    WHEN valor_total <= 500  THEN 0.01
+                    WHEN valor_total <= 2000 THEN 0.02
+                    ELSE 0.03
+                END)::int AS pontos
+            FROM Venda
+        ) calc
+        WHERE p.id_pedido = calc.id_pedido
+          AND p.pontos_fidelidade_gerados IS DISTINCT FROM calc.pontos;
+    """
+
+    # Saldo de cada cliente = soma dos pontos dos seus pedidos
+    sql_upsert_fid = """
         INSERT INTO Fidelidade_Cliente (id_cliente, pontos_acumulados)
-        VALUES (:id_cliente, :pontos);
-    """
-
-    # Atualizar pontos do cliente
-    sql_update_fid = """
-        UPDATE Fidelidade_Cliente
-        SET pontos_acumulados = pontos_acumulados + :pontos
-        WHERE id_cliente = :id_cliente;
+        SELECT id_cliente, SUM(pontos_fidelidade_gerados)
+        FROM Pedido
+        GROUP BY id_cliente
+        HAVING SUM(pontos_fidelidade_gerados) > 0
+        ON CONFLICT (id_cliente)
+        DO UPDATE SET pontos_acumulados = EXCLUDED.pontos_acumulados
+        WHERE Fidelidade_Cliente.pontos_acumulados IS DISTINCT FROM EXCLUDED.pontos_acumulados;
     """
 
     with engine.connect() as conn:
-        vendas = conn.execute(text(sql_vendas)).fetchall()
-
-        for id_pedido, valor_total, id_cliente in vendas:
-
-            valor = Decimal(valor_total)
-
-            # CALCULAR PONTOS ESCALONADOS
-            if valor <= 500:
-                pontos = valor * Decimal("0.01")
-            elif valor <= 2000:
-                pontos = valor * Decimal("0.02")
-            else:
-                pontos = valor * Decimal("0.03")
-
-            pontos = int(pontos)  # arredondar para inteiro
-
-            # ATUALIZAR PEDIDO
-            conn.execute(
-                text(sql_update_pedido),
-                {"pontos": pontos, "id_pedido": id_pedido}
-            )
-
-            # ATUALIZAR / INSERIR NO FIDELIDADE
-            existente = conn.execute(
-                text(sql_check_cliente),
-                {"id_cliente": id_cliente}
-            ).fetchone()
-
-            if existente is None:
-                # Novo cliente no programa de fidelidade
-                conn.execute(
-                    text(sql_insert_fid),
-                    {"id_cliente": id_cliente, "pontos": pontos}
-                )
-            else:
-                # Atualizar pontos acumulados
-                conn.execute(
-                    text(sql_update_fid),
-                    {"id_cliente": id_cliente, "pontos": pontos}
-                )
-
+        pedidos = conn.execute(text(sql_update_pedido)).rowcount
+        clientes = conn.execute(text(sql_upsert_fid)).rowcount
         conn.commit()
 
-    print("Fidelidade_Cliente populado e pontos atualizados nos pedidos.")
+    print(f"Fidelidade_Cliente populado: {pedidos} pedidos com pontos atualizados, {clientes} clientes com saldo alterado.")
 
 ####################################################################################################################
 ###                                                       MAIN                                                   ###
 ####################################################################################################################
-def main(engine, qtd_clientes=50, qtd_pedidos=200):
-    popular_produto(engine)
-    popular_dispositivo(engine)
-    popular_hardware(engine)
-    popular_periferico(engine)
-    popular_cliente(engine, qtd_clientes)
-    popular_pedido(engine, qtd_pedidos)
-    popular_item_pedido(engine)
-    popular_venda(engine)
-    popular_pagamento(engine)
-    popular_desconto(engine)
-    popular_fidelidade(engine)
-
+# Etapas na ordem padrão e de quais outras cada uma depende (ver agendador.py)
+DEPENDENCIAS = {
+    "produto": [],
+    "dispositivo": ["produto"],
+    "hardware": ["produto"],
+    "periferico": ["produto"],
+    "cliente": [],
+    "pedido": ["cliente"],
+    "item_pedido": ["pedido", "produto"],
+    "coocorrencia": ["item_pedido"],
+    "venda": ["item_pedido"],
+    "pagamento": ["venda"],
+    "desconto": ["venda"],
+    "fidelidade": ["venda"],
+}
+
+# Etapas recalculadas a partir das tabelas inteiras (rodar de novo não duplica nada).
+# Se alguma etapa de que dependem gerou dados nesta chamada, elas rodam de novo
+# mesmo que a execução retomada já as tenha como concluídas.
+DERIVADAS = {"coocorrencia", "fidelidade"}
+
+
+def _ancestrais(etapa):
+    """Todas as etapas de que `etapa` depende, direta ou indiretamente."""
+    pendentes, vistas = list(DEPENDENCIAS[etapa]), set()
+    while pendentes:
+        dep = pendentes.pop()
+        if dep not in vistas:
+            vistas.add(dep)
+            pendentes.extend(DEPENDENCIAS[dep])
+    return vistas
+
+
+# Escalas prontas (qtd_clientes, qtd_pedidos)
+ESCALAS = {
+    "pequena": (200, 1_000),
+    "media": (20_000, 1_000_000),
+    "grande": (200_000, 10_000_000),
+}
+
+
+def main(engine, qtd_clientes=50, qtd_pedidos=200, modo_carga="copy", tamanho_lote=10_000,
+         workers=1, semente=None, tamanho_shard=50_000, limite_memoria_mb=None, retomar=True,
+         distribuicao="uniforme", otimizar_carga=None, etapas=None, etapas_paralelas=1):
+    """
+    Popula todas as tabelas respeitando DEPENDENCIAS.
+    modo_carga: "copy" (padrão), "valores" ou "linha" — ver carga_em_massa.py
+    tamanho_lote: linhas acumuladas em memória antes de cada escrita
+    workers: processos usados nas etapas de pedido, item, venda, pagamento e desconto
+    semente: semente mestre; com a mesma semente (e o mesmo tamanho_shard) o
+             banco gerado é o mesmo, qualquer que seja o número de workers
+    tamanho_shard: ids de pedido por shard — ver execucao_paralela.py
+    limite_memoria_mb: avisa quando o pico de RSS de uma etapa passar disso
+    retomar: continua a última execução interrompida (mesma semente, pulando
+             etapas e shards já concluídos) em vez de começar outra — ver progresso.py.
+             Com `semente` informada, ela tem que ser a da execução interrompida
+             (senão ValueError: use retomar=False)
+    distribuicao: "uniforme" (padrão), "realista" (produtos Zipf, clientes de cauda
+                  longa, datas sazonais, cestas maiores) ou dict com ajustes —
+                  ver PERFIS_DISTRIBUICAO em geracao_vetorizada.py
+    otimizar_carga: None (padrão), "adiar" (remove FKs e índices secundários e os
+                    recria/valida no fim) ou "unlogged" (idem + tabelas UNLOGGED
+                    durante a carga) — ver carga_adiada.py
+    etapas: nomes das etapas a rodar (None = todas); as dependências que ficarem
+            de fora são consideradas já populadas. Uma chamada parcial tem a
+            própria execução (só é retomada por outra chamada com as mesmas etapas)
+    etapas_paralelas: quantas etapas independentes podem rodar ao mesmo tempo,
+                      cada uma com a própria conexão (1 = uma por vez, na ordem
+                      de DEPENDENCIAS). As etapas em shards têm o próprio pool
+                      de `workers` processos cada.
+    """
+    if modo_carga not in MODOS_CARGA:
+        raise ValueError(f"modo_carga inválido: {modo_carga} (use {', '.join(MODOS_CARGA)})")
+    if otimizar_carga is not None and otimizar_carga not in ca.MODOS_OTIMIZACAO:
+        raise ValueError(f"otimizar_carga inválido: {otimizar_carga} (use {', '.join(ca.MODOS_OTIMIZACAO)})")
+    desconhecidas = set(etapas or []) - set(DEPENDENCIAS)
+    if desconhecidas:
+        raise ValueError(f"Etapas inválidas: {', '.join(sorted(desconhecidas))} (use {', '.join(DEPENDENCIAS)})")
+
+    CARGA["modo"] = modo_carga
+    CARGA["tamanho_lote"] = tamanho_lote
+    DISTRIBUICAO.clear()
+    DISTRIBUICAO.update(gv.montar_perfil(distribuicao))
+
+    ep.EXECUCAO["workers"] = max(1, int(workers))
+    ep.EXECUCAO["tamanho_shard"] = tamanho_shard
+    ep.EXECUCAO["limite_memoria_mb"] = limite_memoria_mb
+    parametros = {
+        "qtd_clientes": qtd_clientes, "qtd_pedidos": qtd_pedidos, "tamanho_shard": tamanho_shard,
+        "distribuicao": DISTRIBUICAO,
+        "etapas": sorted(etapas) if etapas is not None else None,
+    }
+    # Sorteada só se não foi informada; numa retomada vale a semente da execução salva
+    semente_desta_chamada = ep.definir_semente(semente)
+    id_execucao, semente = pg.iniciar_execucao(
+        engine, semente_desta_chamada, parametros, retomar, semente_fixa=semente is not None
+    )
+    ep.EXECUCAO["id_execucao"] = id_execucao
+    ep.EXECUCAO["semente"] = semente
+    print(f"🎲 Semente: {semente} (use-a para gerar o mesmo banco de novo)")
+
+    # Clientes vêm do Faker/random, no processo principal. Só a etapa de cliente
+    # usa random/fake, então rodar etapas em paralelo não muda o resultado.
+    random.seed(semente)
+    fake.seed_instance(semente)
+
+    funcoes = {
+        "produto": (popular_produto, engine),
+        "dispositivo": (popular_dispositivo, engine),
+        "hardware": (popular_hardware, engine),
+        "periferico": (popular_periferico, engine),
+        "cliente": (popular_cliente, engine, qtd_clientes),
+        "pedido": (popular_pedido, engine, qtd_pedidos),
+        "item_pedido": (popular_item_pedido, engine),
+        "coocorrencia": (popular_coocorrencia, engine),
+        "venda": (popular_venda, engine),
+        "pagamento": (popular_pagamento, engine),
+        "desconto": (popular_desconto, engine),
+        "fidelidade": (popular_fidelidade, engine),
+    }
+    selecionadas = [
+        (nome, deps, *funcoes[nome]) for nome, deps in DEPENDENCIAS.items() if etapas is None or nome in etapas
+    ]
+
+    executadas = set()   # etapas que rodaram (não foram puladas) nesta chamada
+
+    def executar(nome, funcao, *args):
+        if pg.etapa_concluida(engine, id_execucao, nome):
+            if not (nome in DERIVADAS and executadas & _ancestrais(nome)):
+                ep.pular_etapa(nome)
+                return
+            print(f"🔁 {nome}: já concluída, mas recalculada (etapas anteriores geraram dados nesta chamada)")
+        duracao = ep.medir_etapa(nome, funcao, *args)
+        pg.concluir_etapa(engine, id_execucao, nome, int(duracao * 1000))
+        executadas.add(nome)
+
+    ep.iniciar_medicao(etapas_paralelas)
+    inicio = time.perf_counter()
+    if otimizar_carga:
+        ep.medir_etapa("carga: preparar", ca.preparar, engine, otimizar_carga)
+
+    agendador.executar_dag(selecionadas, executar, etapas_paralelas)
+
+    # Também finaliza o que ficou pendente de uma execução anterior com carga otimizada
+    if otimizar_carga or ca.ha_pendencias(engine):
+        ca.finalizar(engine)
+
+    pg.concluir_execucao(engine, id_execucao)
+    # Tempo de relógio: com etapas em paralelo a soma das durações não serve de total
+    ep.imprimir_resumo(time.perf_counter() - inicio)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Geração vetorizada (NumPy) dos dados sintéticos de pedidos, itens, vendas,
+pagamentos e descontos.
+
+Cada função recebe um bloco (chunk) inteiro e sorteia todas as colunas de
+uma vez, como arrays. As mesmas regras de negócio das versões linha a linha
+são mantidas. Valores monetários são tratados em CENTAVOS (int64), então as
+contas são exatas; a conversão para Decimal só acontece em `linhas()`, na
+hora de gravar.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+####################################################################################################################
+###                                               PROBABILIDADES                                                 ###
+####################################################################################################################
+STATUS = np.array(["concluido", "enviando", "pendente", "iniciado", "cancelado"])
+STATUS_PROB = [0.50, 0.15, 0.10, 0.15, 0.10]
+
+PRIORIDADES = np.array(["baixa", "media", "alta"])
+PRIORIDADES_PROB = [0.20, 0.60, 0.20]
+
+MODOS_ENVIO = np.array(["entrega", "retirada"])
+MODOS_ENVIO_PROB = [0.80, 0.20]
+
+NUM_ITENS = np.array([1, 2, 3, 4])
+NUM_ITENS_PROB = [0.60, 0.25, 0.10, 0.05]
+
+FORMAS_PAGAMENTO = np.array(["pix", "cartao_credito", "cartao_debito", "boleto", "transferencia", "dinheiro"])
+FORMAS_PAGAMENTO_PROB = [0.30, 0.40, 0.10, 0.10, 0.05, 0.05]
+
+TIPOS_DESCONTO = np.array(["promocional", "cupom", "fidelidade", "parceria", "outros"])
+TIPOS_DESCONTO_PROB = [0.60, 0.20, 0.10, 0.05, 0.05]
+
+
+####################################################################################################################
+###                                               DISTRIBUIÇÕES                                                  ###
+####################################################################################################################
+# Perfis de distribuição dos pedidos:
+#   zipf_produtos: expoente s da popularidade dos produtos (peso ∝ 1/posição^s; 0 = uniforme)
+#   cauda_clientes: sigma da lognormal da atividade dos clientes (0 = todos compram igual)
+#   sazonal: datas seguem PESO_MES × PESO_DIA_SEMANA em vez de uniformes no último ano
+#   cesta: (tamanhos possíveis, probabilidades) do nº de itens por pedido
+PERFIS_DISTRIBUICAO = {
+    "uniforme": {
+        "zipf_produtos": 0.0,
+        "cauda_clientes": 0.0,
+        "sazonal": False,
+        "cesta": [[1, 2, 3, 4], [0.60, 0.25, 0.10, 0.05]],
+    },
+    "realista": {
+        "zipf_produtos": 1.1,
+        "cauda_clientes": 1.5,
+        "sazonal": True,
+        "cesta": [[1, 2, 3, 4, 5, 6, 7, 8], [0.45, 0.25, 0.13, 0.07, 0.04, 0.03, 0.02, 0.01]],
+    },
+}
+
+# Jan..Dez: Dia das Mães (mai), Dia dos Pais (ago), Black Friday (nov) e Natal (dez)
+PESO_MES = np.array([0.90, 0.85, 0.90, 0.90, 1.05, 0.95, 0.95, 1.05, 0.95, 1.00, 1.60, 1.40])
+# Seg..Dom: compras online concentradas no início da semana
+PESO_DIA_SEMANA = np.array([1.10, 1.05, 1.00, 1.00, 0.95, 0.80, 0.75])
+
+
+def montar_perfil(distribuicao="uniforme"):
+    """Aceita o nome de um perfil ou um dict com ajustes sobre o perfil "uniforme"."""
+    if isinstance(distribuicao, str):
+        if distribuicao not in PERFIS_DISTRIBUICAO:
+            raise ValueError(f"Distribuição inválida: {distribuicao} (use {', '.join(PERFIS_DISTRIBUICAO)})")
+        perfil = dict(PERFIS_DISTRIBUICAO[distribuicao])
+    else:
+        perfil = {**PERFIS_DISTRIBUICAO["uniforme"], **distribuicao}
+    # listas (e não tuplas) para o perfil sair igual do JSON de parâmetros/manifesto
+    perfil["cesta"] = [list(perfil["cesta"][0]), list(perfil["cesta"][1])]
+    return perfil
+
+
+def pesos_zipf(rng, n, expoente):
+    """Pesos de popularidade Zipf, com a ordem de popularidade embaralhada. None se uniforme."""
+    if expoente <= 0 or n == 0:
+        return None
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    pesos = pesos[rng.permutation(n)]
+    return pesos / pesos.sum()
+
+
+def pesos_cauda_longa(rng, n, sigma):
+    """Pesos lognormais: poucos clientes concentram boa parte dos pedidos. None se uniforme."""
+    if sigma <= 0 or n == 0:
+        return None
+    pesos = rng.lognormal(0.0, sigma, n)
+    return pesos / pesos.sum()
+
+
+def pesos_sazonais(hoje, dias=366):
+    """Peso de cada `dias_atras` em [0, dias) pelo mês e dia da semana da data correspondente."""
+    datas = hoje - np.arange(dias).astype("timedelta64[D]")
+    mes = datas.astype("datetime64[M]").astype(np.int64) % 12
+    dia_semana = (datas.astype(np.int64) + 3) % 7  # 1970-01-01 foi quinta-feira; 0 = segunda
+    pesos = PESO_MES[mes] * PESO_DIA_SEMANA[dia_semana]
+    return pesos / pesos.sum()
+
+
+####################################################################################################################
+###                                                  HELPERS                                                     ###
+####################################################################################################################
+def uniforme_centavos(rng, minimo, maximo, n):
+    """Valor uniforme em reais no intervalo, já convertido para centavos inteiros."""
+    return np.round(rng.uniform(minimo, maximo, n) * 100).astype(np.int64)
+
+
+def aplicar_taxa(rng, base_centavos, minimo, maximo):
+    """base × taxa uniforme no intervalo, arredondado para centavos."""
+    return np.round(base_centavos * rng.uniform(minimo, maximo, len(base_centavos))).astype(np.int64)
+
+
+def centavos_para_decimal(centavos):
+    return [Decimal(c).scaleb(-2) for c in centavos.tolist()]
+
+
+def linhas(dados, colunas, monetarias=()):
+    """
+    Serializa um dict de arrays em tuplas na ordem de `colunas`, prontas para o
+    EscritorEmLote. Colunas em `monetarias` estão em centavos e viram Decimal
+    com 2 casas; as demais passam por .tolist() (datas viram date, int64 vira int).
+    Colunas ausentes em `dados` precisam vir como constante: {"coluna": valor}.
+    """
+    n = len(dados[colunas[0]])
+    valores = []
+    for coluna in colunas:
+        valor = dados[coluna]
+        if coluna in monetarias:
+            valores.append(centavos_para_decimal(valor))
+        elif isinstance(valor, np.ndarray):
+            valores.append(valor.tolist())
+        else:
+            valores.append([valor] * n)
+    return zip(*valores)
+
+
+def somar_por_pedido(ids_pedido, ids_dos_itens, valores):
+    """
+    Soma `valores` (um por item) por pedido, na ordem de `ids_pedido` (crescente).
+    Equivale ao SUM(...) GROUP BY id_pedido das etapas que leem do banco.
+    """
+    posicao = np.searchsorted(ids_pedido, ids_dos_itens)
+    return np.bincount(posicao, weights=valores, minlength=len(ids_pedido)).round().astype(np.int64)
+
+
+def amostrar_sem_reposicao(rng, n_opcoes, quantidades, pesos=None):
+    """
+    Para cada posição i sorteia `quantidades[i]` índices distintos em [0, n_opcoes).
+    Retorna (linha, indice) achatados. Sorteia com reposição e re-sorteia só as
+    posições repetidas, o que converge rápido porque as cestas são pequenas.
+    """
+    n = len(quantidades)
+    k_max = int(quantidades.max()) if n else 0
+    if k_max > n_opcoes:
+        raise ValueError("Há pedidos com mais itens do que produtos disponíveis.")
+
+    escolhas = rng.choice(n_opcoes, size=(n, k_max), p=pesos)
+    validas = np.arange(k_max) < quantidades[:, None]
+
+    while True:
+        repetidas = np.zeros_like(validas)
+        for j in range(1, k_max):
+            repetidas[:, j] = (escolhas[:, :j] == escolhas[:, j:j + 1]).any(axis=1)
+        repetidas &= validas
+        qtd = int(repetidas.sum())
+        if qtd == 0:
+            break
+        escolhas[repetidas] = rng.choice(n_opcoes, size=qtd, p=pesos)
+
+    linha = np.repeat(np.arange(n), quantidades)
+    return linha, escolhas[validas]
+
+
+####################################################################################################################
+###                                                   PEDIDO                                                     ###
+####################################################################################################################
+def gerar_pedidos(rng, n, clientes, hoje, pesos_clientes=None, pesos_dias=None):
+    """
+    Sorteia n pedidos. `clientes` é um array de id_cliente e `hoje` um numpy.datetime64[D].
+    `pesos_clientes` / `pesos_dias` (ver DISTRIBUIÇÕES) tornam a escolha não uniforme.
+    Retorna um dict de arrays com as colunas de Pedido.
+    """
+    if pesos_dias is None:
+        dias_atras = rng.integers(0, 365, n, endpoint=True)
+    else:
+        dias_atras = rng.choice(len(pesos_dias), n, p=pesos_dias)
+    data_pedido = hoje - dias_atras.astype("timedelta64[D]")
+
+    status = rng.choice(STATUS, n, p=STATUS_PROB)
+    prioridade = rng.choice(PRIORIDADES, n, p=PRIORIDADES_PROB)
+    modo_envio = rng.choice(MODOS_ENVIO, n, p=MODOS_ENVIO_PROB)
+
+    alta = prioridade == "alta"
+    baixa = prioridade == "baixa"
+    dias = np.zeros(n, dtype=np.int64)
+
+    # Concluído → 5 a 10 dias (alta reduz 2, mínimo 2)
+    concluido = status == "concluido"
+    d = rng.integers(5, 10, n, endpoint=True)
+    d = np.where(alta, np.maximum(2, d - 2), d)
+    dias = np.where(concluido, d, dias)
+
+    # Enviando → 1 a 5 dias (alta reduz 1, mínimo 1)
+    enviando = status == "enviando"
+    d = rng.integers(1, 5, n, endpoint=True)
+    d = np.where(alta, np.maximum(1, d - 1), d)
+    dias = np.where(enviando, d, dias)
+
+    # Pendente/iniciado → 3 a 12 dias (alta reduz 2, baixa aumenta 2)
+    aberto = (status == "pendente") | (status == "iniciado")
+    d = rng.integers(3, 12, n, endpoint=True)
+    d = np.where(alta, np.maximum(2, d - 2), d)
+    d = np.where(baixa, d + 2, d)
+    dias = np.where(aberto, d, dias)
+
+    # Cancelado → prazo = data do pedido (dias = 0)
+    prazo = data_pedido + dias.astype("timedelta64[D]")
+
+    # Concluído precisa ter prazo no passado
+    no_futuro = concluido & (prazo > hoje)
+    recuo = rng.integers(1, 5, n, endpoint=True).astype("timedelta64[D]")
+    prazo = np.where(no_futuro, hoje - recuo, prazo)
+
+    return {
+        "data_pedido": data_pedido,
+        "prazo_estimado": prazo,
+        "status_pedido": status,
+        "prioridade_pedido": prioridade,
+        "modo_envio": modo_envio,
+        "id_cliente": rng.choice(clientes, n, p=pesos_clientes),
+    }
+
+
+####################################################################################################################
+###                                               ITEM DO PEDIDO                                                 ###
+####################################################################################################################
+def gerar_itens(rng, ids_pedido, ids_produto, precos_centavos, pesos_produtos=None, cesta=None):
+    """
+    Sorteia os itens de um bloco de pedidos (produtos distintos em cada pedido,
+    quantidade 1 e desconto unitário limitado a 75% do preço).
+    `pesos_produtos` dá a popularidade de cada produto e `cesta` = (tamanhos, probabilidades)
+    o nº de itens por pedido (ver DISTRIBUIÇÕES).
+    """
+    n = len(ids_pedido)
+    tamanhos, probabilidades = cesta if cesta is not None else (NUM_ITENS, NUM_ITENS_PROB)
+    num_itens = rng.choice(np.asarray(tamanhos), n, p=probabilidades)
+    num_itens = np.minimum(num_itens, len(ids_produto))
+
+    linha, indice = amostrar_sem_reposicao(rng, len(ids_produto), num_itens, pesos_produtos)
+    preco = precos_centavos[indice]
+    total = len(linha)
+
+    # Desconto: 80% sem, 15% pequeno (5–30), 5% grande (30–80)
+    sorteio = rng.random(total)
+    desconto = np.where(
+        sorteio < 0.80, 0,
+        np.where(sorteio < 0.95, uniforme_centavos(rng, 5, 30, total), uniforme_centavos(rng, 30, 80, total))
+    )
+    desconto = np.minimum(desconto, (preco * 3 + 2) // 4)  # nunca mais que 75% do preço
+
+    quantidade = np.ones(total, dtype=np.int64)
+
+    return {
+        "id_pedido": ids_pedido[linha],
+        "id_produto": ids_produto[indice],
+        "quantidade": quantidade,
+        "preco_unitario": preco,
+        "desconto_unitario": desconto,
+        "valor_total_item": (preco - desconto) * quantidade,
+    }
+
+
+####################################################################################################################
+###                                                   VENDA                                                      ###
+####################################################################################################################
+def gerar_vendas(rng, ids_pedido, modo_envio, subtotal_centavos, desconto_centavos):
+    """Custos, impostos, frete e total de cada venda a partir dos totais dos itens."""
+    n = len(ids_pedido)
+    entrega = modo_envio == "entrega"
+
+    custo_envio = np.where(entrega, uniforme_centavos(rng, 15, 40, n), 0)
+    custo_imposto_loja = aplicar_taxa(rng, subtotal_centavos, 0.03, 0.08)
+    custo_taxa_pagamento = aplicar_taxa(rng, subtotal_centavos, 0.015, 0.03)
+    valor_frete = np.where(entrega, uniforme_centavos(rng, 20, 60, n), 0)
+    valor_imposto_cliente = aplicar_taxa(rng, subtotal_centavos, 0.05, 0.15)
+
+    return {
+        "id_pedido": ids_pedido,
+        "custo_envio": custo_envio,
+        "custo_imposto_loja": custo_imposto_loja,
+        "custo_taxa_pagamento": custo_taxa_pagamento,
+        "valor_frete": valor_frete,
+        "valor_imposto_cliente": valor_imposto_cliente,
+        "subtotal": subtotal_centavos,
+        "valor_desconto": desconto_centavos,
+        "valor_total": subtotal_centavos - desconto_centavos + valor_frete + valor_imposto_cliente,
+    }
+
+
+####################################################################################################################
+###                                                 PAGAMENTO                                                    ###
+####################################################################################################################
+def gerar_pagamentos(rng, ids_pedido, valor_total_centavos, data_pedido):
+    """Forma, parcelas (só crédito) e data (0 a 5 dias após o pedido) de cada pagamento."""
+    n = len(ids_pedido)
+    forma = rng.choice(FORMAS_PAGAMENTO, n, p=FORMAS_PAGAMENTO_PROB)
+
+    escolha = rng.random(n)
+    parcelas = np.select(
+        [escolha <= 0.40, escolha <= 0.70, escolha <= 0.90],
+        [1, rng.integers(2, 3, n, endpoint=True), rng.integers(4, 6, n, endpoint=True)],
+        rng.integers(7, 12, n, endpoint=True),
+    )
+    parcelas = np.where(forma == "cartao_credito", parcelas, 1)
+
+    data_pagamento = data_pedido + rng.integers(0, 5, n, endpoint=True).astype("timedelta64[D]")
+
+    return {
+        "id_pedido": ids_pedido,
+        "forma_pagamento": forma,
+        "parcelas": parcelas,
+        "data_pagamento": data_pagamento,
+        "valor_pago": valor_total_centavos,
+    }
+
+
+####################################################################################################################
+###                                             DESCONTO APLICADO                                                ###
+####################################################################################################################
+def gerar_descontos(rng, ids_pedido, subtotal_original_centavos, desconto_total_centavos):
+    """
+    Um registro por pedido com desconto real: porcentagem = desconto / subtotal
+    original (limitada a 80%) e tipo sorteado.
+    """
+    com_desconto = desconto_total_centavos > 0
+    ids = ids_pedido[com_desconto]
+
+    # Porcentagem em centésimos de ponto percentual (2 casas decimais)
+    porcentagem = np.round(
+        desconto_total_centavos[com_desconto] * 10000 / subtotal_original_centavos[com_desconto]
+    ).astype(np.int64)
+    porcentagem = np.minimum(porcentagem, 8000)
+
+    return {
+        "id_pedido": ids,
+        "tipo": rng.choice(TIPOS_DESCONTO, len(ids), p=TIPOS_DESCONTO_PROB),
+        "porcentagem": porcentagem,
+    }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro de progresso da população, para retomar uma execução interrompida.
+
+- Execucao_Populacao: uma linha por execução de fp.main() (semente + parâmetros)
+- Progresso_Populacao: o plano de cada etapa, um shard por linha
+  (concluido_em preenchido = shard pronto). A linha com indice = -1 marca a
+  etapa inteira como concluída.
+
+Cada shard marca a própria linha na MESMA transação em que grava os dados,
+então ele só aparece como concluído se os dados dele foram de fato commitados.
+As tabelas são criadas pela migração 3 de criacao_banco.py.
+"""
+import json
+
+from sqlalchemy import text
+
+ETAPA_INTEIRA = -1
+
+
+####################################################################################################################
+###                                                 EXECUÇÃO                                                     ###
+####################################################################################################################
+def iniciar_execucao(engine, semente, parametros, retomar=True, semente_fixa=False):
+    """
+    Retorna (id_execucao, semente). Com `retomar`, continua a última execução
+    não concluída com os MESMOS parâmetros (com a semente dela); senão, abre
+    uma nova. Uma execução aberta com outros parâmetros (outra quantidade de
+    pedidos, outra lista de etapas...) não é retomada: o plano e as etapas
+    concluídas dela não valem para esta chamada.
+
+    `semente_fixa`: a semente foi escolhida por quem chamou (--semente). Aí ela
+    precisa ser a da execução retomada — continuar com outra geraria um banco
+    diferente do pedido — e, se não for, levanta ValueError (use retomar=False).
+    """
+    sql_pendentes = """
+        SELECT id_execucao, semente, parametros
+        FROM Execucao_Populacao
+        WHERE concluida_em IS NULL
+        ORDER BY id_execucao DESC;
+    """
+    sql_nova = """
+        INSERT INTO Execucao_Populacao (semente, parametros)
+        VALUES (:semente, CAST(:parametros AS JSONB))
+        RETURNING id_execucao;
+    """
+
+    with engine.begin() as conn:
+        if retomar:
+            pendentes = conn.execute(text(sql_pendentes)).fetchall()
+            for id_execucao, semente_salva, parametros_salvos in pendentes:
+                if parametros_salvos == parametros:
+                    if semente_fixa and semente_salva != semente:
+                        raise ValueError(
+                            f"A execução #{id_execucao} interrompida com os mesmos parâmetros usa a semente "
+                            f"{semente_salva}, não {semente}. Retome sem informar a semente ou comece outra "
+                            "execução com --nova (retomar=False)."
+                        )
+                    print(f"↩️ Retomando a execução #{id_execucao} (semente {semente_salva}).")
+                    return id_execucao, semente_salva
+            for id_execucao, _, parametros_salvos in pendentes:
+                print(f"⚠️ Execução #{id_execucao} interrompida com outros parâmetros ({parametros_salvos}): "
+                      "não será retomada.")
+
+        id_execucao = conn.execute(
+            text(sql_nova), {"semente": semente, "parametros": json.dumps(parametros)}
+        ).scalar()
+
+    print(f"🆕 Execução #{id_execucao} iniciada.")
+    return id_execucao, semente
+
+
+def concluir_execucao(engine, id_execucao):
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE Execucao_Populacao SET concluida_em = NOW() WHERE id_execucao = :id;"),
+            {"id": id_execucao}
+        )
+
+
+####################################################################################################################
+###                                                  ETAPAS                                                      ###
+####################################################################################################################
+def etapa_concluida(engine, id_execucao, etapa):
+    sql = """
+        SELECT 1
+        FROM Progresso_Populacao
+        WHERE id_execucao = :id AND etapa = :etapa AND indice = :indice AND concluido_em IS NOT NULL;
+    """
+    with engine.connect() as conn:
+        return conn.execute(text(sql), {"id": id_execucao, "etapa": etapa, "indice": ETAPA_INTEIRA}).fetchone() is not None
+
+
+def concluir_etapa(engine, id_execucao, etapa, duracao_ms):
+    sql = """
+        INSERT INTO Progresso_Populacao (id_execucao, etapa, indice, inicio, fim, duracao_ms, concluido_em)
+        VALUES (:id, :etapa, :indice, 0, 0, :duracao, NOW())
+        ON CONFLICT (id_execucao, etapa, indice)
+        DO UPDATE SET duracao_ms = EXCLUDED.duracao_ms, concluido_em = EXCLUDED.concluido_em;
+    """
+    with engine.begin() as conn:
+        conn.execute(text(sql), {"id": id_execucao, "etapa": etapa, "indice": ETAPA_INTEIRA, "duracao": duracao_ms})
+
+
+####################################################################################################################
+###                                                  SHARDS                                                      ###
+####################################################################################################################
+def shards_pendentes(engine, id_execucao, etapa, planejar):
+    """
+    Retorna (pendentes, total) com pendentes = [(indice, inicio, fim), ...].
+    Na primeira vez, `planejar(conn)` calcula as faixas e o plano é gravado na
+    mesma transação; nas seguintes, o plano gravado é reutilizado.
+    """
+    sql_plano = """
+        SELECT indice, inicio, fim, concluido_em IS NOT NULL
+        FROM Progresso_Populacao
+        WHERE id_execucao = :id AND etapa = :etapa AND indice >= 0
+        ORDER BY indice;
+    """
+    sql_inserir = """
+        INSERT INTO Progresso_Populacao (id_execucao, etapa, indice, inicio, fim)
+        VALUES (:id, :etapa, :indice, :inicio, :fim);
+    """
+
+    with engine.begin() as conn:
+        plano = conn.execute(text(sql_plano), {"id": id_execucao, "etapa": etapa}).fetchall()
+
+        if not plano:
+            intervalos = planejar(conn)
+            if intervalos:
+                conn.execute(text(sql_inserir), [
+                    {"id": id_execucao, "etapa": etapa, "indice": i, "inicio": ini, "fim": fim}
+                    for i, (ini, fim) in enumerate(intervalos)
+                ])
+            plano = [(i, ini, fim, False) for i, (ini, fim) in enumerate(intervalos)]
+
+    pendentes = [(indice, ini, fim) for indice, ini, fim, feito in plano if not feito]
+    return pendentes, len(plano)
+
+
+def marcar_shard(conn, id_execucao, etapa, indice, linhas, duracao_ms):
+    """Marca o shard como concluído. Chamar antes do commit dos dados do shard."""
+    sql = """
+        UPDATE Progresso_Populacao
+        SET linhas = :linhas, duracao_ms = :duracao, concluido_em = NOW()
+        WHERE id_execucao = :id AND etapa = :etapa AND indice = :indice;
+    """
+    conn.execute(text(sql), {
+        "id": id_execucao, "etapa": etapa, "indice": indice, "linhas": linhas, "duracao": duracao_ms
+    })
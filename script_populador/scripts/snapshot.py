@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot do dataset em arquivos: gera sem banco de dados e recarrega via COPY.
+
+    python snapshot.py exportar <diretorio> --clientes 200 --pedidos 1000000 --semente 42 [--workers 4]
+    python snapshot.py carregar <diretorio> <usuario> <senha> <host> <porta> <banco>
+
+O exportar usa os mesmos geradores de funcoes_populacao.py. Com a mesma
+semente, tamanho_shard e tamanho_lote, os dados de pedidos e derivados são
+os mesmos de um fp.main() num banco vazio (com a mesma distribuição). Cada tabela vira uma pasta com
+um arquivo por shard:
+
+    <diretorio>/manifesto.json
+    <diretorio>/Pedido/parte-00000.csv
+    <diretorio>/Pedido/parte-00001.csv
+    ...
+
+O carregar cria o schema com criacao_banco.main(), grava os arquivos com
+COPY, acerta as sequências dos SERIAL e calcula Coocorrencia_Produto e
+Fidelidade_Cliente direto no banco.
+
+Formato: "csv" (padrão) ou "parquet" (requer o pacote pyarrow).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import text
+
+import carga_adiada as ca
+import execucao_paralela as ep
+import funcoes_populacao as fp
+import geracao_vetorizada as gv
+from carga_em_massa import formatar_taxa
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATOS = ("csv", "parquet")
+
+# Ordem de carga (respeita as FKs) e colunas de cada arquivo
+TABELAS = [
+    ("Produto", ["id_produto", "nome_produto", "categoria", "preco_unitario", "custo_unitario",
+                 "estoque_atual", "estoque_minimo"]),
+    ("Dispositivo", ["id_produto", "cor", "dimensao", "tipo"]),
+    ("Hardware", ["id_produto", "consumo_energia", "especificacao_tecnica", "tipo"]),
+    ("Periferico", ["id_produto", "cor", "conexao", "tipo"]),
+    ("Cliente", ["id_cliente", "nome_cliente", "cidade", "estado", "pais", "data_cadastro"]),
+    ("Pedido", ["id_pedido", "data_pedido", "prazo_estimado", "status_pedido", "prioridade_pedido",
+                "modo_envio", "id_cliente", "pontos_fidelidade_gerados"]),
+    ("Item_Pedido", ["id_pedido", "id_produto", "quantidade", "preco_unitario", "desconto_unitario",
+                     "valor_total_item"]),
+    ("Venda", ["id_pedido", "custo_envio", "custo_imposto_loja", "custo_taxa_pagamento", "valor_frete",
+               "valor_imposto_cliente", "subtotal", "valor_desconto", "valor_total"]),
+    ("Pagamento", ["id_pedido", "forma_pagamento", "parcelas", "data_pagamento", "valor_pago"]),
+    ("Desconto_Aplicado", ["id_pedido", "tipo", "porcentagem", "descricao"]),
+]
+COLUNAS = dict(TABELAS)
+
+# Tabelas com SERIAL: a sequência precisa ser acertada depois de COPY com ids explícitos
+SEQUENCIAS = [("Produto", "id_produto"), ("Cliente", "id_cliente"), ("Pedido", "id_pedido")]
+
+
+####################################################################################################################
+###                                                 ARQUIVOS                                                     ###
+####################################################################################################################
+def _verificar_formato(formato):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato} (use {', '.join(FORMATOS)})")
+    if formato == "parquet" and pa is None:
+        raise RuntimeError("O formato parquet requer o pacote pyarrow (pip install pyarrow).")
+
+
+def _escrever(diretorio, formato, tabela, indice, linhas):
+    """Grava as linhas (tuplas na ordem de COLUNAS[tabela]) na parte `indice` da tabela."""
+    pasta = os.path.join(diretorio, tabela)
+    os.makedirs(pasta, exist_ok=True)
+    nome = f"parte-{indice:05d}.{formato}"
+    caminho = os.path.join(pasta, nome)
+
+    linhas = list(linhas)
+    if formato == "csv":
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f, lineterminator="\n").writerows(linhas)
+    else:
+        colunas = list(zip(*linhas)) if linhas else [[] for _ in COLUNAS[tabela]]
+        pq.write_table(pa.table(dict(zip(COLUNAS[tabela], map(list, colunas)))), caminho)
+
+    return os.path.join(tabela, nome), len(linhas)
+
+
+def _como_csv(caminho, formato):
+    """Conteúdo do arquivo como CSV sem cabeçalho, pronto para o COPY."""
+    if formato == "csv":
+        return open(caminho, encoding="utf-8")
+
+    buffer = io.BytesIO()
+    pa_csv.write_csv(pq.read_table(caminho), buffer, pa_csv.WriteOptions(include_header=False))
+    return io.StringIO(buffer.getvalue().decode("utf-8"))
+
+
+####################################################################################################################
+###                                                 EXPORTAR                                                     ###
+####################################################################################################################
+def _em_blocos(tamanho_total, tamanho_lote):
+    return [slice(i, min(i + tamanho_lote, tamanho_total)) for i in range(0, tamanho_total, tamanho_lote)]
+
+
+def _exportar_shard(diretorio, formato, indice, inicio, fim, semente, qtd_clientes, hoje, tamanho_lote, perfil):
+    """
+    Gera pedido, item, venda, pagamento e desconto dos ids [inicio, fim), com o
+    mesmo gerador por (etapa, shard) e os mesmos blocos que as etapas do banco usam.
+    """
+    ids_produto = np.arange(1, len(fp.PRODUTOS) + 1, dtype=np.int64)
+    precos = np.array([round(p[2] * 100) for p in fp.PRODUTOS], dtype=np.int64)
+    clientes = np.arange(1, qtd_clientes + 1, dtype=np.int64)
+    dist_pedidos = fp.distribuicao_pedidos(perfil, semente, qtd_clientes, hoje)
+    dist_itens = fp.distribuicao_itens(perfil, semente, len(ids_produto))
+    ids = np.arange(inicio, fim, dtype=np.int64)
+    blocos = _em_blocos(len(ids), tamanho_lote)
+    escritos = {}
+
+    def juntar(partes):
+        return {k: np.concatenate([p[k] for p in partes]) for k in partes[0]} if partes else {}
+
+    def gravar(tabela, dados, monetarias=()):
+        if dados:
+            arquivo, qtd = _escrever(diretorio, formato, tabela, indice, gv.linhas(dados, COLUNAS[tabela], monetarias))
+            escritos[tabela] = (arquivo, qtd)
+
+    # PEDIDO
+    rng = ep.gerador_do_shard(semente, "pedido", indice)
+    pedidos = []
+    for b in blocos:
+        bloco = gv.gerar_pedidos(rng, len(ids[b]), clientes, hoje, **dist_pedidos)
+        bloco["id_pedido"] = ids[b]
+        bloco["pontos_fidelidade_gerados"] = np.zeros(len(ids[b]), dtype=np.int64)
+        pedidos.append(bloco)
+    pedidos = juntar(pedidos)
+    gravar("Pedido", pedidos)
+
+    # ITEM DO PEDIDO
+    rng = ep.gerador_do_shard(semente, "item_pedido", indice)
+    itens = juntar([gv.gerar_itens(rng, ids[b], ids_produto, precos, **dist_itens) for b in blocos])
+    gravar("Item_Pedido", itens, ("preco_unitario", "desconto_unitario", "valor_total_item"))
+
+    # Totais por pedido (o GROUP BY id_pedido das etapas de venda e desconto)
+    subtotal = gv.somar_por_pedido(ids, itens["id_pedido"], itens["valor_total_item"])
+    desconto = gv.somar_por_pedido(ids, itens["id_pedido"], itens["desconto_unitario"] * itens["quantidade"])
+    subtotal_original = gv.somar_por_pedido(ids, itens["id_pedido"], itens["preco_unitario"] * itens["quantidade"])
+
+    # VENDA
+    rng = ep.gerador_do_shard(semente, "venda", indice)
+    vendas = []
+    for b in blocos:
+        com_valor = subtotal[b] != 0
+        vendas.append(gv.gerar_vendas(
+            rng, ids[b][com_valor], pedidos["modo_envio"][b][com_valor], subtotal[b][com_valor], desconto[b][com_valor]
+        ))
+    vendas = juntar(vendas)
+    gravar("Venda", vendas, COLUNAS["Venda"][1:])
+
+    # PAGAMENTO
+    rng = ep.gerador_do_shard(semente, "pagamento", indice)
+    posicao = vendas["id_pedido"] - inicio
+    gravar("Pagamento", juntar([
+        gv.gerar_pagamentos(rng, vendas["id_pedido"][b], vendas["valor_total"][b], pedidos["data_pedido"][posicao[b]])
+        for b in _em_blocos(len(posicao), tamanho_lote)
+    ]), ("valor_pago",))
+
+    # DESCONTO APLICADO
+    rng = ep.gerador_do_shard(semente, "desconto", indice)
+    com_desconto = desconto > 0
+    ids_d, sub_d, desc_d = ids[com_desconto], subtotal_original[com_desconto], desconto[com_desconto]
+    descontos = juntar([
+        gv.gerar_descontos(rng, ids_d[b], sub_d[b], desc_d[b]) for b in _em_blocos(len(ids_d), tamanho_lote)
+    ])
+    if descontos:
+        descontos["descricao"] = "Desconto calculado com base nos itens do pedido."
+    gravar("Desconto_Aplicado", descontos, ("porcentagem",))
+
+    return escritos
+
+
+def exportar_snapshot(diretorio, qtd_clientes=50, qtd_pedidos=200, semente=None, formato="csv",
+                      workers=1, tamanho_shard=50_000, tamanho_lote=10_000, distribuicao="uniforme"):
+    """Gera o dataset completo em `diretorio` sem tocar em banco e retorna o manifesto."""
+    _verificar_formato(formato)
+    perfil = gv.montar_perfil(distribuicao)
+    os.makedirs(diretorio, exist_ok=True)
+    semente = ep.definir_semente(semente)
+    print(f"🎲 Semente: {semente}")
+
+    inicio = time.perf_counter()
+    arquivos = {tabela: [] for tabela, _ in TABELAS}
+    linhas = {tabela: 0 for tabela, _ in TABELAS}
+
+    def registrar(escritos):
+        for tabela, (arquivo, qtd) in escritos.items():
+            arquivos[tabela].append(arquivo)
+            linhas[tabela] += qtd
+
+    # Catálogo, tabelas específicas e clientes (no processo principal, como em fp.main)
+    produtos = [(i, *p) for i, p in enumerate(fp.PRODUTOS, start=1)]
+    especificas = {"Dispositivo": fp.linha_dispositivo, "Hardware": fp.linha_hardware, "Periferico": fp.linha_periferico}
+    categorias = {"Dispositivo": "Dispositivo", "Hardware": "Hardware", "Periferico": "Periférico"}
+
+    registrar({"Produto": _escrever(diretorio, formato, "Produto", 0, produtos)})
+    for tabela, linha in especificas.items():
+        registrar({tabela: _escrever(diretorio, formato, tabela, 0, [
+            linha(p[0], p[1]) for p in produtos if p[2] == categorias[tabela]
+        ])})
+
+    random.seed(semente)
+    fp.fake.seed_instance(semente)
+    registrar({"Cliente": _escrever(diretorio, formato, "Cliente", 0, (
+        (i, *c) for i, c in enumerate(fp.gerar_clientes(qtd_clientes), start=1)
+    ))})
+
+    # Pedidos e derivados, um shard por arquivo
+    intervalos = ep.dividir_intervalos(1, qtd_pedidos + 1, tamanho_shard) if qtd_clientes else []
+    hoje = np.datetime64(date.today(), "D")
+    args = [(diretorio, formato, i, ini, fim, semente, qtd_clientes, hoje, tamanho_lote, perfil)
+            for i, (ini, fim) in enumerate(intervalos)]
+
+    if workers <= 1 or len(args) <= 1:
+        for a in args:
+            registrar(_exportar_shard(*a))
+            print(f"   ↳ shard {a[2] + 1}/{len(args)} exportado")
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as pool:
+            futuros = [pool.submit(_exportar_shard, *a) for a in args]
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                registrar(futuro.result())
+                print(f"   ↳ shard {concluidos}/{len(args)} exportado")
+
+    manifesto = {
+        "semente": semente,
+        "qtd_clientes": qtd_clientes,
+        "qtd_pedidos": qtd_pedidos,
+        "tamanho_shard": tamanho_shard,
+        "tamanho_lote": tamanho_lote,
+        "distribuicao": perfil,
+        "formato": formato,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "tabelas": {
+            tabela: {"colunas": colunas, "arquivos": sorted(arquivos[tabela]), "linhas": linhas[tabela]}
+            for tabela, colunas in TABELAS
+        },
+    }
+    with open(os.path.join(diretorio, "manifesto.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    total = sum(linhas.values())
+    print(f"✅ Snapshot exportado em {diretorio}: {formatar_taxa(total, time.perf_counter() - inicio)}")
+    return manifesto
+
+
+####################################################################################################################
+###                                                 CARREGAR                                                     ###
+####################################################################################################################
+def carregar_snapshot(engine, diretorio, otimizar_carga=None):
+    """
+    Carrega um snapshot num schema vazio (criado por criacao_banco.main()) usando COPY.
+    Depois acerta as sequências, calcula coocorrência e fidelidade e roda ANALYZE.
+    otimizar_carga: "adiar" ou "unlogged" — ver carga_adiada.py
+    """
+    with open(os.path.join(diretorio, "manifesto.json"), encoding="utf-8") as f:
+        manifesto = json.load(f)
+    formato = manifesto["formato"]
+    _verificar_formato(formato)
+
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM Produto) OR EXISTS (SELECT 1 FROM Pedido);")).scalar():
+            print("❌ O banco já tem dados. O snapshot só pode ser carregado num schema vazio.")
+            return
+
+    inicio = time.perf_counter()
+    if otimizar_carga:
+        ep.iniciar_medicao()
+        ep.medir_etapa("carga: preparar", ca.preparar, engine, otimizar_carga)
+
+    bruta = engine.raw_connection()
+    try:
+        cursor = bruta.cursor()
+        for tabela, _ in TABELAS:
+            info = manifesto["tabelas"][tabela]
+            sql_copy = f"COPY {tabela} ({', '.join(info['colunas'])}) FROM STDIN WITH (FORMAT csv)"
+            t0 = time.perf_counter()
+            for arquivo in info["arquivos"]:
+                with _como_csv(os.path.join(diretorio, arquivo), formato) as conteudo:
+                    cursor.copy_expert(sql_copy, conteudo)
+            bruta.commit()
+            print(f"   ↳ {tabela}: {formatar_taxa(info['linhas'], time.perf_counter() - t0)}")
+
+        for tabela, coluna in SEQUENCIAS:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE((SELECT MAX({coluna}) FROM {tabela}), 0) + 1, false);",
+                (tabela.lower(), coluna)
+            )
+        bruta.commit()
+        cursor.close()
+    finally:
+        bruta.close()
+
+    # Tabelas derivadas: calculadas no banco, em SQL
+    fp.popular_coocorrencia(engine)
+    fp.popular_fidelidade(engine)
+
+    if otimizar_carga:
+        ca.finalizar(engine)  # termina com ANALYZE
+        ep.imprimir_resumo()
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("ANALYZE;")
+
+    print(f"✅ Snapshot carregado em {time.perf_counter() - inicio:.2f}s (semente {manifesto['semente']}).")
+
+
+####################################################################################################################
+###                                                   CLI                                                        ###
+####################################################################################################################
+if __name__ == "__main__":
+    import criacao_banco as cb
+
+    parser = argparse.ArgumentParser(description="Exporta/carrega snapshots do dataset da loja.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    exp = sub.add_parser("exportar", help="gera o dataset em arquivos, sem banco")
+    exp.add_argument("diretorio")
+    exp.add_argument("--clientes", type=int, default=200)
+    exp.add_argument("--pedidos", type=int, default=1000)
+    exp.add_argument("--semente", type=int, default=None)
+    exp.add_argument("--formato", choices=FORMATOS, default="csv")
+    exp.add_argument("--workers", type=int, default=1)
+    exp.add_argument("--tamanho-shard", type=int, default=50_000)
+    exp.add_argument("--tamanho-lote", type=int, default=10_000)
+    exp.add_argument("--distribuicao", choices=gv.PERFIS_DISTRIBUICAO, default="uniforme")
+
+    car = sub.add_parser("carregar", help="cria o schema e carrega um snapshot via COPY")
+    car.add_argument("diretorio")
+    car.add_argument("usuario")
+    car.add_argument("senha")
+    car.add_argument("host")
+    car.add_argument("porta")
+    car.add_argument("banco")
+    car.add_argument("--otimizar-carga", choices=ca.MODOS_OTIMIZACAO, default=None)
+
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        exportar_snapshot(args.diretorio, args.clientes, args.pedidos, args.semente, args.formato,
+                          args.workers, args.tamanho_shard, args.tamanho_lote, args.distribuicao)
+    else:
+        engine = cb.main(args.usuario, args.senha, args.host, args.porta, args.banco)
+        carregar_snapshot(engine, args.diretorio, args.otimizar_carga)
@@ -0,0 +1,109 @@
+"""
+Integração: uma chamada parcial (--etapas) seguida de uma população completa
+não pode deixar dados derivados (fidelidade, coocorrência) desatualizados.
+
+Precisa de um PostgreSQL acessível; o banco `loja_teste_retomada` é recriado
+a cada execução. Conexão pelas variáveis POPULADOR_TESTE_USUARIO (postgres),
+POPULADOR_TESTE_SENHA (123), POPULADOR_TESTE_HOST (localhost) e
+POPULADOR_TESTE_PORTA (5432). Sem banco disponível o teste é pulado.
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("faker")
+pytest.importorskip("sqlalchemy")
+psycopg2 = pytest.importorskip("psycopg2")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from sqlalchemy import text  # noqa: E402
+
+import criacao_banco as cb  # noqa: E402
+import funcoes_populacao as fp  # noqa: E402
+
+BANCO = "loja_teste_retomada"
+CONEXAO = {
+    "user": os.environ.get("POPULADOR_TESTE_USUARIO", "postgres"),
+    "password": os.environ.get("POPULADOR_TESTE_SENHA", "123"),
+    "host": os.environ.get("POPULADOR_TESTE_HOST", "localhost"),
+    "port": os.environ.get("POPULADOR_TESTE_PORTA", "5432"),
+}
+
+
+def _apagar_banco():
+    conn = psycopg2.connect(dbname="postgres", **CONEXAO)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {BANCO};")
+    conn.close()
+
+
+@pytest.fixture
+def engine():
+    try:
+        _apagar_banco()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL indisponível: {e}")
+
+    engine = cb.main(CONEXAO["user"], CONEXAO["password"], CONEXAO["host"], CONEXAO["port"], BANCO)
+    yield engine
+    engine.dispose()
+    _apagar_banco()
+
+
+def _escalar(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).scalar()
+
+
+def test_parcial_seguida_de_completa_recalcula_derivadas(engine):
+    fp.main(engine, qtd_clientes=50, qtd_pedidos=300, semente=1)
+    fp.main(engine, qtd_clientes=50, qtd_pedidos=300, semente=1, etapas=["coocorrencia", "fidelidade"])
+    fp.main(engine, qtd_clientes=50, qtd_pedidos=200, semente=2)
+
+    # Todas as execuções, inclusive a parcial, foram concluídas
+    assert _escalar(engine, "SELECT COUNT(*) FROM Execucao_Populacao WHERE concluida_em IS NULL;") == 0
+    assert _escalar(engine, "SELECT COUNT(*) FROM Pedido;") == 500
+
+    # Pontos de cada pedido com venda batem com a regra da etapa de fidelidade
+    assert _escalar(engine, """
+        SELECT COUNT(*)
+        FROM Pedido p
+        JOIN Venda v ON v.id_pedido = p.id_pedido
+        WHERE p.pontos_fidelidade_gerados IS DISTINCT FROM TRUNC(v.valor_total * CASE
+            WHEN v.valor_total <= 500  THEN 0.01
+            WHEN v.valor_total <= 2000 THEN 0.02
+            ELSE 0.03
+        END)::int;
+    """) == 0
+
+    # Saldo de cada cliente = soma dos pontos dos seus pedidos
+    assert _escalar(engine, """
+        SELECT COUNT(*)
+        FROM (
+            SELECT id_cliente, SUM(pontos_fidelidade_gerados) AS pontos
+            FROM Pedido
+            GROUP BY id_cliente
+            HAVING SUM(pontos_fidelidade_gerados) > 0
+        ) esperado
+        FULL JOIN Fidelidade_Cliente f ON f.id_cliente = esperado.id_cliente
+        WHERE f.pontos_acumulados IS DISTINCT FROM esperado.pontos;
+    """) == 0
+
+    # Coocorrência igual à recalculada a partir de todo o Item_Pedido
+    assert _escalar(engine, """
+        WITH esperado AS (
+            SELECT a.id_produto, b.id_produto AS id_relacionado, COUNT(*) AS qtd_pedidos
+            FROM Item_Pedido a
+            JOIN Item_Pedido b ON a.id_pedido = b.id_pedido AND a.id_produto <> b.id_produto
+            GROUP BY a.id_produto, b.id_produto
+        )
+        SELECT COUNT(*)
+        FROM esperado e
+        FULL JOIN Coocorrencia_Produto c
+          ON c.id_produto = e.id_produto AND c.id_relacionado = e.id_relacionado
+        WHERE c.qtd_pedidos IS DISTINCT FROM e.qtd_pedidos;
+    """) == 0